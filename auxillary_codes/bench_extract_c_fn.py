@@ -0,0 +1,84 @@
+import re
+import time
+import argparse
+from pathlib import Path
+
+from extract_c_fn import extract_c_functions
+
+
+def extract_c_functions_regex(file_path):
+    """
+    The original regex/line-loop extractor, kept here as the benchmark baseline.
+    """
+    with open(file_path, 'r') as file:
+        content = file.read()
+
+    content = re.sub(r'//.*?\n', '\n', content)
+    content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
+
+    functions = []
+    brace_count = 0
+    current_function = ""
+    recording = False
+
+    func_start_pattern = r'^[a-zA-Z_]\w*\s+[a-zA-Z_]\w*\s*\([^;]*\)\s*{?$'
+
+    for line in content.split('\n'):
+        if not recording:
+            if re.search(func_start_pattern, line.strip()):
+                recording = True
+                brace_count = line.count('{')
+                current_function = line + '\n'
+                if brace_count > 0:
+                    continue
+
+        elif recording and not brace_count and line.strip().startswith('{'):
+            current_function += line + '\n'
+            brace_count += 1
+            continue
+
+        elif recording:
+            current_function += line + '\n'
+            brace_count += line.count('{')
+            brace_count -= line.count('}')
+
+            if brace_count == 0 and current_function:
+                functions.append(current_function)
+                current_function = ""
+                recording = False
+
+    return functions
+
+
+def run(extractor, c_files, repeat):
+    """Return (best seconds per pass, functions found) for extractor over c_files"""
+    best = float('inf')
+    found = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = sum(len(extractor(c_file)) for c_file in c_files)
+        best = min(best, time.perf_counter() - start)
+    return best, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare C function extractors on a corpus of .c files")
+    parser.add_argument('corpus_dir', help="directory of .c files, e.g. the fetch_c_dataset.py output")
+    parser.add_argument('--limit', type=int, default=None, help="only use the first N files")
+    parser.add_argument('--repeat', type=int, default=3, help="passes per extractor; the best is reported")
+    args = parser.parse_args()
+
+    c_files = sorted(str(p) for p in Path(args.corpus_dir).glob('*.c'))[:args.limit]
+    if not c_files:
+        print(f"No .c files found in {args.corpus_dir}")
+        return
+
+    print(f"{len(c_files)} files, best of {args.repeat}")
+    for label, extractor in [('regex (baseline)', extract_c_functions_regex),
+                             ('lexer', extract_c_functions)]:
+        seconds, found = run(extractor, c_files, args.repeat)
+        print(f"{label:>16}: {len(c_files) / seconds:10.1f} files/sec, {found} functions")
+
+
+if __name__ == "__main__":
+    main()
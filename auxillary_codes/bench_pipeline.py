@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import bench_toolchain
+from extract_c_fn import extract_c_functions, generate_and_extract_ir
+from extract_rust_fn import extract_ir_for_functions, extract_rust_function_definitions
+from get_function_from_ll import demangle_and_write
+
+STAGES = ('extract_c_functions', 'generate_and_extract_ir', 'extract_rust_function_definitions',
+          'extract_ir_for_functions', 'demangle_and_write')
+
+# Synthetic function shapes; {name} and {k} are filled in per function
+C_TEMPLATES = {
+    'simple': "int {name}(int a, int b) {{\n    return a * b + {k};\n}}\n",
+    'loop': ("int {name}(int n, int m) {{\n    int total = 0;\n    for (int i = 0; i < n; i++) {{\n"
+             "        if (i % {k} == 0) {{\n            total += i * m;\n        }} else {{\n"
+             "            total -= m;\n        }}\n    }}\n    return total;\n}}\n"),
+    'strings': ("/* {name}: braces in comments {{ and strings }} */\n"
+                "int {name}(int a, int b) {{\n    const char *s = \"{{ not a body }}\";  // }}\n"
+                "    char c = '}}';\n    return a + b + s[{k} % 4] + c;\n}}\n"),
+    'multiline': ("static unsigned long\n{name}(unsigned long a,\n        unsigned long b)\n{{\n"
+                  "    unsigned long r = a;\n    while (b--) {{ r = r * {k} + 1; }}\n    return r;\n}}\n"),
+}
+RUST_TEMPLATES = {
+    'simple': "fn {name}(a: i32, b: i32) -> i32 {{\n    a * b + {k}\n}}\n",
+    'loop': ("fn {name}(n: i32, m: i32) -> i32 {{\n    let mut total = 0;\n    for i in 0..n {{\n"
+             "        if i % {k} == 0 {{\n            total += i * m;\n        }} else {{\n"
+             "            total -= m;\n        }}\n    }}\n    total\n}}\n"),
+    'method': ("struct S{k};\n\nimpl S{k} {{\n    fn {name}(&self, a: i32) -> i32 {{\n"
+               "        let s = \"{{ not a body }}\"; // }}\n        a + s.len() as i32\n    }}\n}}\n"),
+    # Array types put a `;` inside the signature
+    'array': "fn {name}(a: [i32; {k}]) -> [u8; 2] {{\n    [a[0] as u8, {k}]\n}}\n",
+}
+DEFAULT_MIX = 'simple=4,loop=3,strings=2,multiline=1,method=2,array=1'
+
+
+def parse_mix(spec):
+    """'simple=4,loop=3' -> {'simple': 4.0, 'loop': 3.0}"""
+    mix = {}
+    for part in spec.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in C_TEMPLATES and kind not in RUST_TEMPLATES:
+            raise ValueError(f"Unknown function kind {kind!r}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def _pick_functions(rng, templates, mix, count, prefix):
+    kinds = [kind for kind in templates if mix.get(kind)]
+    if not kinds:
+        return []
+    chosen = rng.choices(kinds, weights=[mix[kind] for kind in kinds], k=count)
+    return [templates[kind].format(name=f"{prefix}_{kind}_{i}", k=rng.randint(2, 9))
+            for i, kind in enumerate(chosen)]
+
+
+def generate_corpus(root, files=100, functions=8, mix=None, seed=0):
+    """
+    Write a synthetic corpus under root: C/train<N>.c and RUST/train<N>.rs
+    with about `functions` functions each (drawn from the templates by the
+    mix weights), and RUST_IR/train<N>.ll from the stub rustc. Returns a
+    description of the corpus for the report.
+    """
+    mix = mix or parse_mix(DEFAULT_MIX)
+    rng = random.Random(seed)
+    for sub in ('C', 'RUST', 'RUST_IR'):
+        os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    for n in range(1, files + 1):
+        stem = f"train{n}"
+        count = max(1, round(rng.gauss(functions, functions / 4)))
+        c_functions = _pick_functions(rng, C_TEMPLATES, mix, count, 'f')
+        with open(os.path.join(root, 'C', stem + '.c'), 'w') as f:
+            f.write('#include <stdio.h>\n\n' + '\n'.join(c_functions)
+                    + '\nint main(void) {\n    printf("%d\\n", 0);\n    return 0;\n}\n')
+
+        rust_functions = _pick_functions(rng, RUST_TEMPLATES, mix, count, 'f')
+        rust_text = '\n'.join(rust_functions) + '\nfn main() {\n    println!("{}", 0);\n}\n'
+        with open(os.path.join(root, 'RUST', stem + '.rs'), 'w') as f:
+            f.write(rust_text)
+        with open(os.path.join(root, 'RUST_IR', stem + '.ll'), 'w') as f:
+            f.write(bench_toolchain.rustc_ir(rust_text, stem))
+
+    return {'files': files, 'functions_per_file': functions, 'mix': mix, 'seed': seed}
+
+
+def _sorted_files(directory, extension):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(extension))
+
+
+def _stage_work(stage, root, scratch):
+    """Return (number of input files, timed callable returning a function count) for stage"""
+    c_files = _sorted_files(os.path.join(root, 'C'), '.c')
+    rust_files = _sorted_files(os.path.join(root, 'RUST'), '.rs')
+    ir_files = _sorted_files(os.path.join(root, 'RUST_IR'), '.ll')
+
+    if stage == 'extract_c_functions':
+        return len(c_files), lambda: sum(len(extract_c_functions(path)) for path in c_files)
+    if stage == 'generate_and_extract_ir':
+        return len(c_files), lambda: sum(len(generate_and_extract_ir(path)) for path in c_files)
+    if stage == 'extract_rust_function_definitions':
+        return len(rust_files), lambda: sum(len(extract_rust_function_definitions(path)) for path in rust_files)
+    if stage == 'extract_ir_for_functions':
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            names = [list(extract_rust_function_definitions(path)) for path in rust_files]
+        ir_paths = [os.path.join(root, 'RUST_IR', os.path.basename(path)[:-3] + '.ll') for path in rust_files]
+        return len(ir_paths), lambda: sum(len(extract_ir_for_functions(path, function_names))
+                                          for path, function_names in zip(ir_paths, names))
+    if stage == 'demangle_and_write':
+        defines = 0
+        for path in ir_files:
+            with open(path) as f:
+                defines += sum(1 for line in f if line.startswith('define'))
+
+        def run():
+            for path in ir_files:
+                demangle_and_write(path, os.path.join(scratch, os.path.basename(path)))
+            return defines
+        return len(ir_files), run
+    raise ValueError(f"Unknown stage {stage!r}")
+
+
+def _run_stage(stage, root, bin_dir, repeat):
+    """Child process body: best-of-repeat timing of one stage and the process's peak RSS"""
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    scratch = tempfile.mkdtemp(prefix='bench_')
+    try:
+        files, work = _stage_work(stage, root, scratch)
+        best = float('inf')
+        functions = 0
+        # Per-line prints are part of today's cost; keep them off the terminal
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                functions = work()
+                best = min(best, time.perf_counter() - start)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_mb = peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+    return {'files': files, 'functions': functions, 'seconds': best,
+            'files_per_sec': files / best if best else None,
+            'functions_per_sec': functions / best if best else None,
+            'peak_rss_mb': round(peak_mb, 1)}
+
+
+def run_benchmarks(root, bin_dir, stages=STAGES, repeat=3):
+    """
+    Time each stage over the corpus at root in its own fresh process, so
+    peak RSS is per stage and no stage warms another's caches. Stub tools
+    in bin_dir come first on the children's PATH.
+    """
+    results = {}
+    # spawn rather than fork: a forked child would inherit the parent's peak RSS
+    context = get_context('spawn')
+    for stage in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[stage] = executor.submit(_run_stage, stage, root, bin_dir, repeat).result()
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Return (stage, metric, old, new) for every throughput that dropped by more than tolerance"""
+    regressions = []
+    for stage, result in report['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if not old:
+            continue
+        for metric in ('files_per_sec', 'functions_per_sec'):
+            if old.get(metric) and result.get(metric) is not None and result[metric] < old[metric] * (1 - tolerance):
+                regressions.append((stage, metric, old[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extraction stages on a synthetic corpus with stub compilers")
+    parser.add_argument('--files', type=int, default=200, help="files per language in the corpus")
+    parser.add_argument('--functions', type=int, default=8, help="average functions per file")
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"weights of the function kinds (C: {', '.join(C_TEMPLATES)}; "
+                             f"Rust: {', '.join(RUST_TEMPLATES)})")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma-separated stages to run")
+    parser.add_argument('--repeat', type=int, default=3, help="passes per stage; the best is reported")
+    parser.add_argument('--workdir', default=None, help="keep the corpus and stubs here (default: a temp dir)")
+    parser.add_argument('--output', default='bench_results.json', help="where to write the JSON report")
+    parser.add_argument('--compare', default=None, help="a previous report; exit 1 if a stage got slower")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed slowdown for --compare")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_corpus_')
+    try:
+        corpus = generate_corpus(os.path.join(workdir, 'corpus'), args.files, args.functions,
+                                 parse_mix(args.mix), args.seed)
+        bin_dir = bench_toolchain.install(os.path.join(workdir, 'bin'))
+        stages = run_benchmarks(os.path.join(workdir, 'corpus'), bin_dir, args.stages.split(','), args.repeat)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git_commit': _git_commit(),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'corpus': corpus, 'repeat': args.repeat, 'stages': stages}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    for stage, result in stages.items():
+        print(f"{stage:>34}: {result['files_per_sec']:9.1f} files/sec, "
+              f"{result['functions_per_sec']:10.1f} functions/sec, {result['peak_rss_mb']:7.1f} MB peak RSS")
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for stage, metric, old, new in regressions:
+            print(f"REGRESSION {stage} {metric}: {old:.1f} -> {new:.1f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
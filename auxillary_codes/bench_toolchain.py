@@ -0,0 +1,125 @@
+import os
+import re
+import sys
+import stat
+import hashlib
+
+# Deterministic stand-ins for clang, opt and rustc, so the benchmarks run
+# offline and measure our code rather than the compilers. They only
+# understand the shapes of source bench_pipeline.py generates.
+
+TOOLS = ('clang', 'opt', 'rustc')
+
+_C_DEFINITION = re.compile(r'^(?:[A-Za-z_][\w \t*]*[\s*])?([A-Za-z_]\w*)\s*\([^;{]*\)\s*\{', re.M)
+_RUST_ITEM = re.compile(r'^(\s*)(?:impl\s+(\w+)|(?:pub\s+)?fn\s+(\w+))', re.M)
+
+
+def _legacy_mangle(crate, *path):
+    components = ''.join(f"{len(part)}{part}" for part in (crate,) + path)
+    digest = hashlib.sha1('::'.join((crate,) + path).encode()).hexdigest()[:16]
+    return f"_ZN{components}17h{digest}E"
+
+
+def _function_body(seed):
+    """A few lines of plausible -O0 IR whose size depends on seed"""
+    lines = ['  %3 = alloca i32, align 4', '  store i32 %0, ptr %3, align 4']
+    for i in range(seed % 5 + 1):
+        lines.append(f'  %{i + 4} = add nsw i32 %{i + 3 if i else 0}, {seed % 97 + i}, !dbg !{i + 10}')
+    lines.append(f'  ret i32 %{seed % 5 + 4}')
+    return lines
+
+
+def clang_ir(source_text, source_name):
+    """Textual IR with one `define` per C function definition in source_text"""
+    out = [f"; ModuleID = '{source_name}'", f'source_filename = "{source_name}"', '']
+    for number, match in enumerate(_C_DEFINITION.finditer(source_text)):
+        out += ['; Function Attrs: noinline nounwind optnone',
+                f'define dso_local i32 @{match.group(1)}(i32 noundef %0, i32 noundef %1) #0 {{']
+        out += _function_body(number) + ['}', '']
+    out += ['attributes #0 = { noinline nounwind optnone }', '']
+    return '\n'.join(out)
+
+
+def rustc_ir(source_text, crate):
+    """
+    Textual IR with one legacy-mangled `define` per Rust fn in source_text
+    (methods of `impl Type` blocks as `Type::method`), plus a core
+    monomorphization and a few declarations, as rustc's output has.
+    """
+    out = [f"; ModuleID = '{crate}.{hashlib.sha1(crate.encode()).hexdigest()[:8]}-cgu.0'",
+           f'source_filename = "{crate}.{crate}-cgu.0"', '']
+    impl = None
+    symbols = []
+    for match in _RUST_ITEM.finditer(source_text):
+        indent, impl_type, fn_name = match.groups()
+        if impl_type:
+            impl = impl_type
+        elif fn_name:
+            path = (impl, fn_name) if impl and indent else (fn_name,)
+            if not indent:
+                impl = None
+            symbols.append(_legacy_mangle(crate, *path))
+    for number, symbol in enumerate(symbols):
+        out += ['; Function Attrs: nonlazybind uwtable',
+                f'define internal i32 @{symbol}(i32 %0) unnamed_addr #0 {{', 'start:']
+        out += _function_body(number)
+        out.insert(-1, f'  call void @_ZN4core3fmt9Arguments6new_v117h{"0" * 16}E(ptr %3)')
+        out += ['}', '']
+    core = _legacy_mangle('core', 'ptr', 'drop_in_place')
+    out += [f'define internal void @{core}(ptr %0) unnamed_addr #0 {{', 'start:', '  ret void', '}', '',
+            f'declare void @_ZN4core3fmt9Arguments6new_v117h{"0" * 16}E(ptr) unnamed_addr #0', '',
+            'attributes #0 = { nonlazybind uwtable }', '']
+    return '\n'.join(out)
+
+
+def _arguments(argv):
+    """(input path or '-', output path or '-') of a compiler command line"""
+    source = output = '-'
+    i = 0
+    while i < len(argv):
+        if argv[i] == '-o':
+            output = argv[i + 1]
+            i += 2
+            continue
+        if not argv[i].startswith('-') or argv[i] == '-':
+            source = argv[i]
+        elif argv[i] in ('-C', '--crate-name', '--edition', '--crate-type'):
+            i += 1
+        i += 1
+    return source, output
+
+
+def main(tool, argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if '--version' in argv:
+        print(f"{tool} version 0.0.0 (bench_toolchain stub)")
+        return 0
+    source, output = _arguments(argv)
+    text = sys.stdin.read() if source == '-' else open(source).read()
+    if tool == 'clang':
+        text = clang_ir(text, source)
+    elif tool == 'rustc':
+        text = rustc_ir(text, os.path.splitext(os.path.basename(source))[0])
+    if output == '-':
+        sys.stdout.write(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text)
+    return 0
+
+
+def install(bin_dir):
+    """Write clang, opt and rustc stubs into bin_dir; put it first on PATH to use them"""
+    os.makedirs(bin_dir, exist_ok=True)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(f"#!{sys.executable}\nimport sys\nsys.path.insert(0, {here!r})\n"
+                    f"import bench_toolchain\nsys.exit(bench_toolchain.main({tool!r}))\n")
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+if __name__ == "__main__":
+    install(sys.argv[1] if len(sys.argv) > 1 else 'bench_bin')
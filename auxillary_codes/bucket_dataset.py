@@ -0,0 +1,123 @@
+import os
+import json
+import argparse
+from bisect import bisect_left
+from itertools import islice
+
+from dataset_sink import SHARD_FORMATS, ShardedSink, iter_shard_records
+from token_counts import get_tokenizer
+
+# Fields of the training records, as in the README
+RECORD_FIELDS = ('c_code', 'c_ir', 'rust_code', 'rust_ir')
+
+
+def add_lengths(records, tokenizer, fields=RECORD_FIELDS, batch_size=1024):
+    """
+    Yield records with a 'lengths' dict of token counts per field added.
+    Each field is tokenized once per batch of records, in one call.
+    """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        for record in batch:
+            record['lengths'] = {}
+        for field in fields:
+            present = [record for record in batch if record.get(field)]
+            if present:
+                for record, length in zip(present, tokenizer.lengths([record[field] for record in present])):
+                    record['lengths'][field] = length
+        yield from batch
+
+
+def bucket_of(length, boundaries):
+    """Index of the first boundary >= length; len(boundaries) for overflow"""
+    return bisect_left(boundaries, length)
+
+
+def build_buckets(records, output_dir, boundaries, fmt='jsonl', shard_bytes=256 << 20, fields=RECORD_FIELDS):
+    """
+    Write records (with 'lengths') into one set of shards per length bucket,
+    bucketed by the longest of fields, and write two files next to them:
+
+    - index.json: per bucket its max length, record count, shards and the
+      largest length seen per field;
+    - lengths.jsonl: one line per record with its bucket, shard, row within
+      the shard and lengths, so loaders can batch and filter without
+      reading any text.
+
+    fields should be those a model reads (e.g. c_code and c_ir for a C to
+    IR model), so that a long field it never sees doesn't move a record
+    into a larger bucket. Returns the index.
+    """
+    sinks = {}
+    rows = {}
+    buckets = {}
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'lengths.jsonl'), 'w', buffering=1 << 20) as lengths_file:
+        for record in records:
+            bucket = bucket_of(max((record['lengths'].get(field, 0) for field in fields), default=0), boundaries)
+            if bucket not in sinks:
+                name = f"len{boundaries[bucket]}" if bucket < len(boundaries) else f"len{boundaries[-1]}plus"
+                sinks[bucket] = ShardedSink(output_dir, fmt, prefix=name, max_shard_bytes=shard_bytes)
+                buckets[bucket] = {'name': name,
+                                   'max_length': boundaries[bucket] if bucket < len(boundaries) else None,
+                                   'records': 0, 'shards': [], 'max_field_lengths': {}}
+            shard = sinks[bucket].write(record)[0]
+            row = rows.get(shard, 0)
+            rows[shard] = row + 1
+
+            info = buckets[bucket]
+            info['records'] += 1
+            if not info['shards'] or info['shards'][-1] != os.path.basename(shard):
+                info['shards'].append(os.path.basename(shard))
+            for field, length in record['lengths'].items():
+                info['max_field_lengths'][field] = max(info['max_field_lengths'].get(field, 0), length)
+            lengths_file.write(json.dumps({'bucket': info['name'], 'shard': os.path.basename(shard),
+                                           'row': row, 'lengths': record['lengths']}) + '\n')
+
+    for sink in sinks.values():
+        sink.close()
+    index = {'boundaries': boundaries, 'fields': list(fields), 'format': fmt,
+             'buckets': [buckets[b] for b in sorted(buckets)]}
+    with open(os.path.join(output_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=4)
+    return index
+
+
+def iter_inputs(paths):
+    for path in paths:
+        yield from iter_shard_records(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tokenize dataset records once and write length-bucketed shards")
+    parser.add_argument('inputs', nargs='+', help="JSONL files or shards of {c_code, c_ir, rust_code, rust_ir} records")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--tokenizer', default='regex',
+                        help="'regex' (default), 'hf:<name or path>' or 'tiktoken:<encoding>'")
+    parser.add_argument('--buckets', default='128,256,512,1024,2048,4096',
+                        help="comma-separated bucket upper bounds in tokens")
+    parser.add_argument('--fields', default=','.join(RECORD_FIELDS),
+                        help="comma-separated fields the model reads; only these are tokenized and bucketed by "
+                             "(default: all four)")
+    parser.add_argument('--batch-size', type=int, default=1024, help="records tokenized per call")
+    parser.add_argument('--format', default='jsonl', choices=SHARD_FORMATS)
+    parser.add_argument('--shard-size', type=int, default=256, help="approximate shard size in MB")
+    args = parser.parse_args()
+
+    fields = tuple(args.fields.split(','))
+    for field in fields:
+        if field not in RECORD_FIELDS:
+            parser.error(f"unknown field {field!r}, expected some of {', '.join(RECORD_FIELDS)}")
+
+    boundaries = sorted(int(b) for b in args.buckets.split(','))
+    records = add_lengths(iter_inputs(args.inputs), get_tokenizer(args.tokenizer), fields, args.batch_size)
+    index = build_buckets(records, args.output_dir, boundaries, args.format, args.shard_size << 20, fields)
+    for bucket in index['buckets']:
+        print(f"{bucket['name']:>12}: {bucket['records']} records in {len(bucket['shards'])} shards")
+
+
+if __name__ == "__main__":
+    main()
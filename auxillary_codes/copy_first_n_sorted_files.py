@@ -1,65 +1,43 @@
 import os
-import shutil
-import re
 
-def natural_sort_key(s):
-    """
-    Create a key for natural sorting of strings containing numbers.
-    This will extract the number from strings like 'train44.ll' and return 44
-    """
-    return int(re.search(r'train(\d+)\.rs', s).group(1))
+from dataset_subset import first_n, materialize, scan, write_manifest
 
-def copy_first_n_sorted_files(source_dir, dest_dir, n=100):
+def copy_first_n_sorted_files(source_dir, dest_dir, n=100, mode='hardlink', manifest_path=None):
     """
-    Copy the first n files after sorting them numerically by their names.
+    Put the first n files, ordered numerically by their names, in dest_dir.
+    
+    The files are hard-linked by default rather than copied (see
+    dataset_subset.materialize for the other modes), so no data is
+    duplicated. If manifest_path is given, the subset is also recorded
+    there (see dataset_subset.write_manifest).
     
     Args:
-        source_dir (str): Source directory containing the .ll files
-        dest_dir (str): Destination directory where files will be copied
-        n (int): Number of files to copy (default: 100)
+        source_dir (str): Source directory containing the train<N>.rs files
+        dest_dir (str): Destination directory where files will be linked
+        n (int): Number of files to link (default: 100)
+        mode (str): 'hardlink', 'reflink', 'symlink' or 'copy'
+        manifest_path (str): Optional manifest of the selected files
     """
-    # Create destination directory if it doesn't exist
-    os.makedirs(dest_dir, exist_ok=True)
-    
-    # Get all .ll files
-    ll_files = [f for f in os.listdir(source_dir) if f.endswith('.rs') and f.startswith('train')]
+    # Only the n lowest-numbered files are kept while scanning
+    files_to_copy = [name for _, name, _ in first_n(scan(source_dir, '.rs'), n)]
     
-    if not ll_files:
-        print(f"No .ll files found in {source_dir}")
+    if not files_to_copy:
+        print(f"No train<N>.rs files found in {source_dir}")
         return
     
-    # Sort files numerically
-    sorted_files = sorted(ll_files, key=natural_sort_key)
-    
-    # Take first n files
-    files_to_copy = sorted_files[:n]
-    
-    print(f"Found {len(sorted_files)} total files")
-    print(f"Copying first {len(files_to_copy)} files...")
-    
-    # Copy files with progress indication
-    for i, filename in enumerate(files_to_copy, 1):
-        source_path = os.path.join(source_dir, filename)
-        dest_path = os.path.join(dest_dir, filename)
-        
-        try:
-            shutil.copy2(source_path, dest_path)
-            if i % 10 == 0:  # Print progress every 10 files
-                print(f"Copied {i} files...")
-        except Exception as e:
-            print(f"Error copying {filename}: {str(e)}")
-            continue
+    if manifest_path:
+        write_manifest(manifest_path, source_dir, files_to_copy, {'first': n, 'extension': '.rs'})
+    copied = materialize([os.path.join(source_dir, name) for name in files_to_copy], dest_dir, mode)
     
-    # Print first and last copied files for verification
-    if files_to_copy:
-        print("\nFirst copied file:", files_to_copy[0])
-        print("Last copied file:", files_to_copy[-1])
-        print(f"\nSuccessfully copied {len(files_to_copy)} files to {dest_dir}")
+    # Print first and last files for verification
+    print("\nFirst file:", files_to_copy[0])
+    print("Last file:", files_to_copy[-1])
+    print(f"\nPlaced {len(files_to_copy)} files in {dest_dir} ({copied} had to be copied)")
 
 if __name__ == "__main__":
     # Directory paths
     source_directory = "/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c/RS_CODE"  # Replace with your source directory path
     destination_directory = "/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c/test_clean/test_input"  # Replace with your destination directory path
     
-    # Copy first 100 sorted files
+    # Link first 100 sorted files
     copy_first_n_sorted_files(source_directory, destination_directory)
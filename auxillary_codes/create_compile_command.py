@@ -1,35 +1,49 @@
 import json
-from datasets import load_dataset
-
-# Load the dataset with the desired split
-ds = load_dataset("UKPLab/SLTrans", "C")
-
-# Choose the desired split (either 'Perf_Optimized' or 'Size_Optimized')
-split = 'Perf_Optimized'
-
-# Initialize an empty list to hold the compile commands
-compile_commands = []
-
-start_row = 10001  # Start of the range (inclusive)
-end_row = 10100 
-# Iterate over the first 10,000 rows of the chosen split
-for i in range(start_row, end_row):
-    # Get the filename based on the row index
-    filename = f'train{i}.c'
-
-    # Create the compile command entry for the current file
-    command_entry = {
-        "directory": "/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c",
-        "command": f"gcc -c {filename} -o {filename.replace('.c', '.o')}",
-        "file": filename
-    }
-    
-    # Append the command entry to the list
-    compile_commands.append(command_entry)
-
-# Write the compile commands to a JSON file
-with open('compile_commands.json', 'w') as json_file:
-    json.dump(compile_commands, json_file, indent=4)
-
-print("compile_commands.json has been generated.")
-
+import argparse
+
+# Command templates per kind of build; {file} is the source, {output} the artifact
+COMMAND_TEMPLATES = {
+    'gcc': ("gcc -c {file} -o {output}", '.o'),
+    'clang-ir': ("clang -Oz -emit-llvm -S {file} -o {output}", '.ll'),
+    'rustc-ir': ("rustc --emit=llvm-ir -C opt-level=0 -C debuginfo=0 -C codegen-units=1 {file} -o {output}", '.ll'),
+}
+
+
+def compile_command_entries(directory, filenames, kind='gcc'):
+    """Return compile_commands.json entries building each of filenames with the `kind` template"""
+    template, output_ext = COMMAND_TEMPLATES[kind]
+    entries = []
+    for filename in filenames:
+        output = filename.rsplit('.', 1)[0] + output_ext
+        entries.append({
+            "directory": directory,
+            "command": template.format(file=filename, output=output),
+            "file": filename,
+            "output": output,
+        })
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a compile_commands.json for a range of train<N> sources")
+    parser.add_argument('--directory', default="/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c")
+    parser.add_argument('--start', type=int, default=10001, help="first row (inclusive)")
+    parser.add_argument('--end', type=int, default=10100, help="last row (exclusive)")
+    parser.add_argument('--kind', default='gcc', choices=sorted(COMMAND_TEMPLATES),
+                        help="gcc objects (default), clang LLVM IR or rustc LLVM IR")
+    parser.add_argument('--output', default='compile_commands.json')
+    args = parser.parse_args()
+
+    extension = '.rs' if args.kind.startswith('rustc') else '.c'
+    filenames = [f'train{i}{extension}' for i in range(args.start, args.end)]
+    compile_commands = compile_command_entries(args.directory, filenames, args.kind)
+
+    # Write the compile commands to a JSON file
+    with open(args.output, 'w') as json_file:
+        json.dump(compile_commands, json_file, indent=4)
+
+    print(f"{args.output} has been generated.")
+
+
+if __name__ == "__main__":
+    main()
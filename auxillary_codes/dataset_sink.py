@@ -0,0 +1,314 @@
+import io
+import os
+import re
+import gzip
+import json
+import hashlib
+
+# Formats accepted by ShardedSink, plus 'files' for the per-function layout
+SHARD_FORMATS = ('jsonl', 'jsonl.gz', 'jsonl.zst', 'parquet')
+OUTPUT_FORMATS = ('files',) + SHARD_FORMATS
+
+# Extension for the source file of a record in the per-function layout
+SOURCE_EXTENSIONS = {'c': '.c', 'rust': '.rs'}
+
+# Parquet column types of the record fields; other fields (ir_<level>) are strings
+RECORD_COLUMNS = {'source': 'string', 'number': 'int64', 'function': 'string', 'language': 'string',
+                  'code': 'string', 'ir': 'string', 'ir_hash': 'string'}
+
+
+# Runs of digits in a source id, compared as numbers by source_order
+_DIGITS = re.compile(r'(\d+)')
+
+
+def source_order(source_id):
+    """
+    Sort key for source ids (file stems) with numbers compared by value,
+    `train9` before `train10`: the order fetched rows come in. The
+    extractors write records in this order and join_dataset.py merges by it.
+    """
+    parts = _DIGITS.split(source_id)
+    # Odd positions are always the digit runs, so lists compare type by type
+    return [int(part) if i % 2 else part for i, part in enumerate(parts)], source_id
+
+
+def stem_order(name):
+    """Sort key putting plain identifiers before qualified paths, so they claim their file stems first"""
+    return (not name.isidentifier(), name)
+
+
+def function_file_stem(name, taken):
+    """
+    File name stem for a function: qualified paths (`Point::new`,
+    `<Point as Display>::fmt`) become `Point_new`, `Point_as_Display_fmt`.
+    taken maps the stems already used by one source file's functions to
+    their names; a stem another function holds gets a short hash of the
+    full name appended (`Point::new` next to `Point_new` becomes
+    `Point_new_<hash>`), so neither file overwrites the other.
+    """
+    stem = re.sub(r'\W+', '_', name).strip('_')
+    if taken.setdefault(stem, name) != name:
+        stem = f"{stem}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+        taken[stem] = name
+    return stem
+
+
+def function_file_stems(names):
+    """{name: file stem} for the functions of one source file, plain identifiers keeping theirs"""
+    taken = {}
+    return {name: function_file_stem(name, taken) for name in sorted(names, key=stem_order)}
+
+
+class PerFileSink:
+    """
+    The original output layout: one `{stem}_{id}.c`/`.rs` file with the
+    function's code and one `{stem}_{id}.ll` file with its IR per record,
+    where stem is the source file's stem and id the record's 'number'
+    (falling back to its function name, see function_file_stem; records of
+    a source should arrive together, in stem_order). Extra IR columns `ir_<level>`
+    (see extract_c_fn --opt-levels) go to `{stem}_{id}.<level>.ll`.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        # Function stems used by the current source's records
+        self._source = None
+        self._taken = {}
+
+    def write(self, record):
+        """Write one record; returns the paths written"""
+        stem = os.path.splitext(os.path.basename(record['source']))[0]
+        if record['source'] != self._source:
+            self._source, self._taken = record['source'], {}
+        file_id = record.get('number') or function_file_stem(record['function'], self._taken)
+        base = os.path.join(self.output_dir, f"{stem}_{file_id}")
+
+        written = []
+        code_path = base + SOURCE_EXTENSIONS[record['language']]
+        with open(code_path, 'w') as f:
+            f.write(record['code'])
+        written.append(code_path)
+
+        for field, text in record.items():
+            if text and (field == 'ir' or field.startswith('ir_') and field != 'ir_hash'):
+                ir_path = base + ('.ll' if field == 'ir' else f".{field[3:]}.ll")
+                with open(ir_path, 'w') as f:
+                    f.write(text)
+                written.append(ir_path)
+        return written
+
+    def when_durable(self, callback):
+        """Call callback once the records written so far are on disk: right away, files are closed on write"""
+        callback()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordBuffer:
+    """
+    Sink that just keeps records in memory, for workers that hand their
+    records back to a parent process owning the real sink.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+        return []
+
+    def close(self):
+        pass
+
+
+class ShardedSink:
+    """
+    Append records to size-rotated shards `{prefix}-{n:05d}.{fmt}` in
+    output_dir, so a corpus becomes a handful of large files instead of a
+    pair of tiny files per function.
+
+    fmt is one of SHARD_FORMATS. JSONL shards are written through a large
+    buffer, optionally gzip- or zstd-compressed (the latter needs the
+    `zstandard` package). Parquet shards need `pyarrow` and are written one
+    row group per `row_group_size` records. A shard is closed once about
+    `max_shard_bytes` of uncompressed record data has gone into it. Shard
+    numbering continues after any shards already in output_dir, so reruns
+    never overwrite earlier output.
+
+    A shard is written as `<name>.tmp` and renamed when it is closed, so a
+    crash never leaves a truncated shard behind. Callers that record
+    progress elsewhere (e.g. a run_manifest.RunManifest) should do it
+    through when_durable(), which waits for that rename.
+    """
+
+    def __init__(self, output_dir, fmt='jsonl', prefix='part', max_shard_bytes=256 << 20,
+                 row_group_size=10000):
+        if fmt not in SHARD_FORMATS:
+            raise ValueError(f"Unknown shard format {fmt!r}, expected one of {SHARD_FORMATS}")
+        # Fail before any work is done if the optional writer is missing
+        required = {'jsonl.zst': 'zstandard', 'parquet': 'pyarrow'}.get(fmt)
+        if required:
+            try:
+                __import__(required)
+            except ImportError:
+                raise ImportError(f"{fmt} output needs the {required} package "
+                                  f"(pip install {required})") from None
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.row_group_size = row_group_size
+        self.shards = []
+        self.records_written = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        pattern = re.compile(rf'^{re.escape(prefix)}-(\d+)\.{re.escape(fmt)}$')
+        existing = [int(m.group(1)) for m in map(pattern.match, os.listdir(output_dir)) if m]
+        self._next_index = max(existing, default=-1) + 1
+        self._file = None
+        self._raw = None
+        self._parquet = None
+        self._rows = []
+        self._schema = None
+        self._shard_bytes = 0
+        self._shard_open = False
+        self._durable = []
+
+    def _open_shard(self):
+        path = os.path.join(self.output_dir, f"{self.prefix}-{self._next_index:05d}.{self.fmt}")
+        self._next_index += 1
+        self._shard_bytes = 0
+        self.shards.append(path)
+        path += '.tmp'
+        if self.fmt == 'jsonl':
+            self._file = open(path, 'w', buffering=1 << 20)
+        elif self.fmt == 'jsonl.gz':
+            self._file = io.TextIOWrapper(io.BufferedWriter(gzip.open(path, 'wb', compresslevel=6), 1 << 20))
+        elif self.fmt == 'jsonl.zst':
+            import zstandard
+            self._raw = open(path, 'wb')
+            writer = zstandard.ZstdCompressor(level=10).stream_writer(self._raw)
+            self._file = io.TextIOWrapper(io.BufferedWriter(writer, 1 << 20))
+        # Parquet writers are opened with the first row group, once the schema is known
+        self._shard_open = True
+
+    def _close_shard(self):
+        if self._shard_open:
+            self._shard_open = False
+            if self.fmt == 'parquet':
+                self._flush_rows()
+                if self._parquet is not None:
+                    self._parquet.close()
+                    self._parquet = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._raw is not None:
+                self._raw.close()
+                self._raw = None
+            os.replace(self.shards[-1] + '.tmp', self.shards[-1])
+        callbacks, self._durable = self._durable, []
+        for callback in callbacks:
+            callback()
+
+    def _flush_rows(self):
+        if not self._rows:
+            return
+        import pyarrow
+        import pyarrow.parquet
+        if self._schema is None:
+            # Fixed up front: a batch without ir_hash, or with only None IR, would infer another
+            columns = dict(RECORD_COLUMNS)
+            columns.update((field, 'string') for field in self._rows[0] if field not in RECORD_COLUMNS)
+            self._schema = pyarrow.schema([(field, getattr(pyarrow, type_name)())
+                                           for field, type_name in columns.items()])
+        table = pyarrow.Table.from_pylist(self._rows, schema=self._schema)
+        if self._parquet is None:
+            self._parquet = pyarrow.parquet.ParquetWriter(self.shards[-1] + '.tmp', self._schema,
+                                                          compression='zstd')
+        self._parquet.write_table(table)
+        self._rows = []
+
+    def write(self, record):
+        """Append one record; returns [path of the shard it went to]"""
+        if not self._shard_open:
+            self._open_shard()
+
+        if self.fmt == 'parquet':
+            self._rows.append(record)
+            self._shard_bytes += sum(len(value) for value in record.values() if isinstance(value, str))
+            if len(self._rows) >= self.row_group_size:
+                self._flush_rows()
+        else:
+            line = json.dumps(record)
+            self._file.write(line + '\n')
+            self._shard_bytes += len(line) + 1
+        self.records_written += 1
+
+        path = self.shards[-1]
+        if self._shard_bytes >= self.max_shard_bytes:
+            self._close_shard()
+        return [path]
+
+    def when_durable(self, callback):
+        """Call callback once every record written so far is in a closed shard"""
+        if self._shard_open:
+            self._durable.append(callback)
+        else:
+            callback()
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def shard_format(path):
+    """Return the SHARD_FORMATS entry matching path's extension, or None"""
+    name = os.path.basename(path)
+    for fmt in sorted(SHARD_FORMATS, key=len, reverse=True):
+        if name.endswith('.' + fmt):
+            return fmt
+    return None
+
+
+def iter_shard_records(path):
+    """Yield the records of one shard written by ShardedSink, in write order"""
+    fmt = shard_format(path)
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+        return
+
+    if fmt == 'jsonl.gz':
+        f = gzip.open(path, 'rt')
+    elif fmt == 'jsonl.zst':
+        import zstandard
+        f = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    elif fmt == 'jsonl':
+        f = open(path, 'r', buffering=1 << 20)
+    else:
+        raise ValueError(f"Not a shard file: {path}")
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def make_sink(output_dir, fmt='files', **kwargs):
+    """Return a PerFileSink for fmt='files', otherwise a ShardedSink"""
+    if fmt == 'files':
+        return PerFileSink(output_dir)
+    return ShardedSink(output_dir, fmt, **kwargs)
@@ -0,0 +1,251 @@
+import os
+import json
+import heapq
+import errno
+import random
+import shutil
+import argparse
+
+# Per-function files written next to them: train<N>_<function>.rs / .ll
+_SPLIT_EXTENSIONS = ('.rs', '.ll')
+
+MODES = ('hardlink', 'reflink', 'symlink', 'copy')
+
+
+def scan(source_dir, extension='.rs'):
+    """
+    Yield (number, name, os.DirEntry) for the train<N><extension> files of
+    source_dir (named after their dataset row), from one os.scandir pass.
+    Files are only stat()ed by selections that need their size.
+    """
+    stop = -len(extension)
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            # Plain string checks: a regex per name costs more than the listing itself
+            if name.startswith('train') and name.endswith(extension) and name[5:stop].isdigit():
+                yield int(name[5:stop]), name, entry
+
+
+def first_n(entries, n):
+    """The n lowest-numbered entries, in order, keeping only n in memory"""
+    return heapq.nsmallest(n, entries, key=lambda entry: entry[0])
+
+
+def numeric_range(entries, start, end):
+    """Entries numbered in [start, end), in order"""
+    return sorted((entry for entry in entries if start <= entry[0] < end), key=lambda entry: entry[0])
+
+
+def random_sample(entries, k, seed=0):
+    """A uniform sample of k entries in one pass (reservoir sampling), in numeric order"""
+    rng = random.Random(seed)
+    reservoir = []
+    for i, entry in enumerate(entries):
+        if i < k:
+            reservoir.append(entry)
+        else:
+            j = rng.randrange(i + 1)
+            if j < k:
+                reservoir[j] = entry
+    return sorted(reservoir, key=lambda entry: entry[0])
+
+
+def _size_stratum(entry):
+    # Powers of two of the file size: 0-1 KB, 1-2 KB, 2-4 KB, ...
+    return (entry[2].stat().st_size >> 10).bit_length()
+
+
+def stratified_sample(entries, k, strata='size', seed=0):
+    """
+    A sample of k entries with each stratum represented in proportion to
+    its size. strata is 'size' (powers of two of the file size in KB) or
+    'range:<width>' (blocks of width row numbers). One pass, keeping a
+    reservoir of up to k entries per stratum.
+    """
+    if strata == 'size':
+        key = _size_stratum
+    elif strata.startswith('range:'):
+        width = int(strata.split(':', 1)[1])
+        key = lambda entry: entry[0] // width
+    else:
+        raise ValueError(f"Unknown strata {strata!r}, expected 'size' or 'range:<width>'")
+
+    rng = random.Random(seed)
+    reservoirs = {}
+    counts = {}
+    for entry in entries:
+        stratum = key(entry)
+        seen = counts.get(stratum, 0)
+        counts[stratum] = seen + 1
+        reservoir = reservoirs.setdefault(stratum, [])
+        if seen < k:
+            reservoir.append(entry)
+        else:
+            j = rng.randrange(seen + 1)
+            if j < k:
+                reservoir[j] = entry
+
+    # Largest-remainder allocation of k over the strata
+    total = sum(counts.values())
+    if not total:
+        return []
+    quotas = {stratum: k * count / total for stratum, count in counts.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    leftover = min(k, total) - sum(allocation.values())
+    for stratum in sorted(quotas, key=lambda s: quotas[s] - allocation[s], reverse=True)[:leftover]:
+        allocation[stratum] += 1
+
+    sample = []
+    for stratum in sorted(reservoirs):
+        reservoir = reservoirs[stratum]
+        rng.shuffle(reservoir)
+        sample.extend(reservoir[:allocation[stratum]])
+    return sorted(sample, key=lambda entry: entry[0])
+
+
+def split_function_files(source_dir):
+    """
+    The per-function files of source_dir (names with an underscore, ending
+    in .rs or .ll), the set move_split_rust_code.py used to move. Sorted by
+    name.
+    """
+    with os.scandir(source_dir) as entries:
+        return sorted(entry.name for entry in entries
+                      if '_' in entry.name and entry.name.endswith(_SPLIT_EXTENSIONS) and entry.is_file())
+
+
+def write_manifest(path, source_dir, names, selection):
+    """
+    Save a subset as a manifest: the source directory, how the subset was
+    selected and the file names, one per line after a JSON header line.
+    """
+    with open(path, 'w', buffering=1 << 20) as f:
+        f.write(json.dumps({'source_dir': os.path.abspath(source_dir), 'selection': selection,
+                            'count': len(names)}) + '\n')
+        f.writelines(name + '\n' for name in names)
+
+
+def read_manifest(path):
+    """Return (header, list of absolute paths) of a manifest"""
+    with open(path) as f:
+        header = json.loads(f.readline())
+        names = [line.rstrip('\n') for line in f if line.strip()]
+    return header, [os.path.join(header['source_dir'], name) for name in names]
+
+
+def _reflink(source, dest):
+    """Copy-on-write clone (Linux FICLONE); raises OSError where unsupported"""
+    import fcntl
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())  # FICLONE
+        except OSError:
+            dst.close()
+            os.remove(dest)
+            raise
+
+
+def materialize(paths, dest_dir, mode='hardlink'):
+    """
+    Make paths appear in dest_dir for tools that need a directory, without
+    copying data where possible: hard links (same filesystem), reflinks
+    (copy-on-write filesystems) or symlinks. Hard links and reflinks fall
+    back to a copy when the filesystem can't do them. Existing entries are
+    replaced. Returns the number of files that had to be copied.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+    os.makedirs(dest_dir, exist_ok=True)
+    copied = 0
+    for path in paths:
+        dest = os.path.join(dest_dir, os.path.basename(path))
+        if os.path.abspath(dest) == os.path.abspath(path):
+            continue
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            if mode == 'hardlink':
+                os.link(path, dest)
+            elif mode == 'reflink':
+                _reflink(path, dest)
+            elif mode == 'symlink':
+                os.symlink(os.path.abspath(path), dest)
+            else:
+                shutil.copy2(path, dest)
+                copied += 1
+        except OSError as e:
+            if mode == 'symlink' or (mode == 'hardlink' and e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK)):
+                raise
+            shutil.copy2(path, dest)
+            copied += 1
+    return copied
+
+
+def select(source_dir, extension='.rs', first=None, start=None, end=None, random_k=None,
+           stratified_k=None, strata='size', split_functions=False, seed=0):
+    """Run one selection over source_dir; returns (file names, selection description)"""
+    if split_functions:
+        return split_function_files(source_dir), {'split_functions': True}
+    entries = scan(source_dir, extension)
+    if first is not None:
+        chosen, selection = first_n(entries, first), {'first': first}
+    elif start is not None or end is not None:
+        selection = {'start': start, 'end': end}
+        chosen = numeric_range(entries, start or 0, end if end is not None else float('inf'))
+    elif random_k is not None:
+        chosen, selection = random_sample(entries, random_k, seed), {'random': random_k, 'seed': seed}
+    elif stratified_k is not None:
+        chosen = stratified_sample(entries, stratified_k, strata, seed)
+        selection = {'stratified': stratified_k, 'strata': strata, 'seed': seed}
+    else:
+        chosen, selection = sorted(entries, key=lambda entry: entry[0]), {'all': True}
+    selection['extension'] = extension
+    return [name for _, name, _ in chosen], selection
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Define dataset subsets as manifests instead of copies")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    choose = commands.add_parser('select', help="write a manifest of a subset of a directory")
+    choose.add_argument('source_dir')
+    choose.add_argument('--output', required=True, help="manifest to write")
+    choose.add_argument('--extension', default='.rs', help="file extension of train<N> files (default: .rs)")
+    how = choose.add_mutually_exclusive_group()
+    how.add_argument('--first', type=int, help="the N lowest-numbered files")
+    how.add_argument('--range', help="row numbers START:END (end exclusive)")
+    how.add_argument('--random', type=int, help="a uniform random sample of K files")
+    how.add_argument('--stratified', type=int, help="a sample of K files stratified by --strata")
+    how.add_argument('--split-functions', action='store_true',
+                     help="the per-function files (name with '_', .rs or .ll)")
+    choose.add_argument('--strata', default='size', help="'size' or 'range:<width>' (default: size)")
+    choose.add_argument('--seed', type=int, default=0)
+    choose.add_argument('--materialize', default=None, help="also link the files into this directory")
+    choose.add_argument('--mode', default='hardlink', choices=MODES)
+
+    link = commands.add_parser('materialize', help="link the files of a manifest into a directory")
+    link.add_argument('manifest')
+    link.add_argument('dest_dir')
+    link.add_argument('--mode', default='hardlink', choices=MODES)
+    args = parser.parse_args()
+
+    if args.command == 'select':
+        start = end = None
+        if args.range:
+            start, end = (int(part) for part in args.range.split(':'))
+        names, selection = select(args.source_dir, args.extension, args.first, start, end, args.random,
+                                  args.stratified, args.strata, args.split_functions, args.seed)
+        write_manifest(args.output, args.source_dir, names, selection)
+        print(f"Selected {len(names)} files into {args.output}")
+        if args.materialize:
+            copied = materialize([os.path.join(args.source_dir, name) for name in names], args.materialize, args.mode)
+            print(f"Linked {len(names) - copied} and copied {copied} files into {args.materialize}")
+    else:
+        header, paths = read_manifest(args.manifest)
+        copied = materialize(paths, args.dest_dir, args.mode)
+        print(f"Linked {len(paths) - copied} and copied {copied} files into {args.dest_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import re
+import json
+import sqlite3
+import hashlib
+import argparse
+from array import array
+
+from dataset_sink import iter_shard_records
+from join_dataset import JSONArrayWriter, JSONLWriter
+
+# Record fields that hold code, in joined records and in extractor records
+TEXT_FIELDS = ('c_code', 'c_ir', 'rust_code', 'rust_ir', 'code', 'ir')
+
+_MASK64 = (1 << 64) - 1
+
+# Comments of C/Rust (// and /* */) and of IR (;), dropped before tokenizing
+_SOURCE_COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+_IR_COMMENT = re.compile(r';[^\n"]*$', re.M)
+# Identifiers (including IR %/@ names), numbers and single punctuation
+_TOKEN = re.compile(r'[%@#!]?[A-Za-z_$.][\w$.]*|[%@#!]?\d+|\S')
+# IR local values, labels, attribute groups and metadata refs carry no content
+_NUMBERED = re.compile(r'^[%#!]\d+$')
+
+
+def normalize_tokens(text, ir=False):
+    """Tokenize C/Rust (or IR) text with comments dropped and numbered IR names collapsed"""
+    tokens = _TOKEN.findall((_IR_COMMENT if ir else _SOURCE_COMMENT).sub(' ', text))
+    return [token[0] + 'N' if _NUMBERED.match(token) else token for token in tokens]
+
+
+def shingle_hashes(tokens, size=5):
+    """Return the set of 64-bit hashes of the size-token shingles of tokens"""
+    if len(tokens) < size:
+        tokens = tokens + [''] * (size - len(tokens))
+    hashes = set()
+    for i in range(len(tokens) - size + 1):
+        shingle = '\x1f'.join(tokens[i:i + size]).encode()
+        hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'little'))
+    return hashes
+
+
+def minhash_signature(hashes, num_perm=128):
+    """
+    One-permutation MinHash: each shingle hash is assigned to one of
+    num_perm bins and each bin keeps its minimum, so a signature costs one
+    pass over the shingles rather than num_perm. Empty bins borrow the next
+    non-empty bin's value (rotation densification) so that any two
+    signatures stay comparable position by position.
+    """
+    signature = [None] * num_perm
+    for h in hashes:
+        b = h % num_perm
+        value = h // num_perm
+        if signature[b] is None or value < signature[b]:
+            signature[b] = value
+    if all(value is None for value in signature):
+        return array('Q', [_MASK64] * num_perm)
+    for b in range(num_perm):
+        if signature[b] is None:
+            offset = 1
+            while signature[(b + offset) % num_perm] is None:
+                offset += 1
+            signature[b] = (signature[(b + offset) % num_perm] + offset * 0x9E3779B97F4A7C15) & _MASK64
+    return array('Q', signature)
+
+
+def estimated_jaccard(a, b):
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class MinHashLSH:
+    """
+    Banded LSH index over MinHash signatures of cluster representatives,
+    kept in SQLite so memory stays bounded however many items go in
+    (path=':memory:' keeps it in RAM for small runs).
+
+    query_or_add() looks an item up in each band's buckets; a candidate
+    whose estimated Jaccard similarity reaches threshold makes the item a
+    duplicate of that candidate's cluster. Otherwise the item becomes a new
+    representative. Only representatives are indexed, each with the
+    identity of the record it came from, so an index reused across runs
+    still resolves earlier runs' representatives to their records.
+    """
+
+    def __init__(self, path=':memory:', num_perm=128, bands=16, threshold=0.8, commit_every=10000):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.commit_every = commit_every
+        self._pending = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, key INTEGER, rep INTEGER, "
+                        "PRIMARY KEY (band, key)) WITHOUT ROWID")
+        # rep is the rowid, so ids stay unique across runs sharing the file
+        self.db.execute("CREATE TABLE IF NOT EXISTS signatures (rep INTEGER PRIMARY KEY, item TEXT, signature BLOB)")
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(signatures)")]
+        if 'item' not in columns:
+            raise ValueError(f"{path} is an LSH index of an older format; delete it and rerun")
+
+    def _band_keys(self, signature):
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            # SQLite integers are signed 64-bit
+            keys.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), 'little') >> 1)
+        return keys
+
+    def query_or_add(self, item, signature):
+        """
+        Return the identity of the representative item (a JSON-serializable
+        identity of the record) duplicates, or None after adding it as one
+        """
+        keys = self._band_keys(signature)
+        checked = set()
+        for band, key in enumerate(keys):
+            row = self.db.execute("SELECT rep FROM buckets WHERE band = ? AND key = ?", (band, key)).fetchone()
+            if row is None or row[0] in checked:
+                continue
+            rep = row[0]
+            checked.add(rep)
+            rep_item, blob = self.db.execute("SELECT item, signature FROM signatures WHERE rep = ?",
+                                             (rep,)).fetchone()
+            if estimated_jaccard(signature, array('Q', blob)) >= self.threshold:
+                return json.loads(rep_item)
+
+        rep = self.db.execute("INSERT INTO signatures (item, signature) VALUES (?, ?)",
+                              (json.dumps(item), signature.tobytes())).lastrowid
+        # A bucket already owned by another representative keeps pointing at it
+        self.db.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)",
+                            [(band, key, rep) for band, key in enumerate(keys)])
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.db.commit()
+            self._pending = 0
+        return None
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def record_tokens(record, fields=TEXT_FIELDS):
+    """Normalized tokens of the code fields of a record that are present, in field order"""
+    tokens = []
+    for field in fields:
+        if record.get(field):
+            tokens.extend(normalize_tokens(record[field], ir=field.endswith('ir')))
+            tokens.append('\x1e')
+    return tokens
+
+
+def record_identity(record, path, position):
+    """Where a record came from: its input file and position there, plus its source and function if it has them"""
+    item = {'input': path, 'position': position}
+    for field in ('source', 'function', 'number'):
+        if record.get(field) is not None:
+            item[field] = record[field]
+    return item
+
+
+def dedup(items, writer, index, fields=TEXT_FIELDS, shingle_size=5, clusters=None):
+    """
+    Stream (identity, record) items (see iter_inputs) through the LSH index
+    and write the first record of each near-duplicate cluster to writer. If
+    clusters is a file, a JSON line {"item": identity, "representative":
+    identity} is written for every dropped record; the representative may
+    come from an earlier run sharing the index. Returns (records read,
+    records kept).
+    """
+    read = kept = 0
+    for item, record in items:
+        read += 1
+        tokens = record_tokens(record, fields)
+        signature = minhash_signature(shingle_hashes(tokens, shingle_size), index.num_perm)
+        rep = index.query_or_add(item, signature)
+        if rep is None:
+            writer.write(record)
+            kept += 1
+        elif clusters is not None:
+            clusters.write(json.dumps({'item': item, 'representative': rep}) + '\n')
+    return read, kept
+
+
+def iter_inputs(paths):
+    """(identity, record) for the records of every input, see record_identity"""
+    for path in paths:
+        for position, record in enumerate(iter_shard_records(path)):
+            yield record_identity(record, path, position), record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop near-duplicate functions with MinHash LSH")
+    parser.add_argument('inputs', nargs='+',
+                        help="JSONL files or shards (join_dataset.py --format jsonl, or extractor shards)")
+    parser.add_argument('--output', required=True, help="where to write the kept records")
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='jsonl')
+    parser.add_argument('--fields', default=','.join(TEXT_FIELDS),
+                        help="comma-separated record fields to compare (default: all code fields present)")
+    parser.add_argument('--threshold', type=float, default=0.8, help="Jaccard similarity for duplicates")
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--bands', type=int, default=16)
+    parser.add_argument('--shingle-size', type=int, default=5, help="tokens per shingle")
+    parser.add_argument('--index', default=':memory:', help="SQLite file for the LSH index (default: in memory)")
+    parser.add_argument('--clusters', default=None, help="write dropped -> representative record identities here")
+    args = parser.parse_args()
+
+    index = MinHashLSH(args.index, args.num_perm, args.bands, args.threshold)
+    clusters = open(args.clusters, 'w') if args.clusters else None
+    with open(args.output, 'w', buffering=1 << 20) as f:
+        writer = JSONArrayWriter(f) if args.format == 'json' else JSONLWriter(f)
+        read, kept = dedup(iter_inputs(args.inputs), writer, index, tuple(args.fields.split(',')),
+                           args.shingle_size, clusters)
+        writer.close()
+    index.close()
+    if clusters is not None:
+        clusters.close()
+    print(f"Kept {kept} of {read} records ({read - kept} near-duplicates dropped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import re
+import subprocess
+from collections import OrderedDict
+
+_LEGACY_HASH = re.compile(r'^h[0-9a-f]{16}$')
+_LEGACY_ESCAPE = re.compile(r'\$(SP|BP|RF|LT|GT|LP|RP|C|u[0-9a-f]+)\$')
+_LEGACY_ESCAPES = {
+    'SP': '@', 'BP': '*', 'RF': '&', 'LT': '<', 'GT': '>',
+    'LP': '(', 'RP': ')', 'C': ',',
+}
+
+# Symbol references at define/declare/call sites: bare or quoted @_Z.../@_R...
+_SYMBOL_REF = re.compile(r'@(?:"((?:_Z|_R)[^"]*)"|((?:_Z|_R)[-\w$.]*))')
+_BARE_IDENTIFIER = re.compile(r'^[-a-zA-Z$._][-a-zA-Z$._0-9]*$')
+
+
+def _nested_name_components(symbol):
+    """Split an Itanium nested name (`_ZN<len><ident>...E`) into its raw components"""
+    if not symbol.startswith('_ZN'):
+        return None
+    components = []
+    pos = 3
+    end = len(symbol)
+    while pos < end and symbol[pos] != 'E':
+        digits_end = pos
+        while digits_end < end and symbol[digits_end].isdigit():
+            digits_end += 1
+        if digits_end == pos:
+            return None
+        length = int(symbol[pos:digits_end])
+        components.append(symbol[digits_end:digits_end + length])
+        pos = digits_end + length
+    if pos >= end or not components:
+        return None
+    return components
+
+
+def legacy_rust_path(symbol):
+    """
+    Split a legacy-mangled Rust symbol (`_ZN<len><ident>...17h<hash>E`) into
+    its path components, without the trailing hash.
+
+    Returns None if symbol is not in the legacy Rust/Itanium nested-name form.
+    """
+    components = _nested_name_components(symbol)
+    if components and len(components) > 1 and _LEGACY_HASH.match(components[-1]):
+        components.pop()
+    return components
+
+
+def legacy_rust_prefix(crate):
+    """Return the mangled-symbol prefix shared by every item in crate"""
+    return f"_ZN{len(crate)}{crate}"
+
+
+def strip_legacy_crate(symbol, crate):
+    """
+    Rewrite a legacy Rust symbol of crate as if crate's top-level modules were
+    crates of their own: a leading `crate` component is dropped and
+    `crate..` prefixes inside components (impl paths, generic arguments) are
+    removed, with the length prefixes recomputed. For example
+    `_ZN5batch9train48403add17h...E` -> `_ZN9train48403add17h...E`.
+    Anything after the nested name (such as `.llvm.` suffixes) is kept.
+
+    Returns symbol unchanged if it does not mention crate.
+    """
+    if crate not in symbol or not symbol.startswith('_ZN'):
+        return symbol
+    components = _nested_name_components(symbol)
+    if not components:
+        return symbol
+    tail = symbol[3 + sum(len(c) + len(str(len(c))) for c in components):]
+    if components[0] == crate and len(components) > 1:
+        components = components[1:]
+    components = [c.replace(f'{crate}..', '') for c in components]
+    return '_ZN' + ''.join(f"{len(c)}{c}" for c in components) + tail
+
+
+def _unescape_legacy_component(component):
+    if component.startswith('_$'):
+        component = component[1:]
+
+    def replace(match):
+        code = match.group(1)
+        if code.startswith('u'):
+            return chr(int(code[1:], 16))
+        return _LEGACY_ESCAPES[code]
+
+    return _LEGACY_ESCAPE.sub(replace, component).replace('..', '::')
+
+
+def demangle_rust_legacy(symbol):
+    """
+    Demangle a legacy Rust symbol to its path, e.g.
+    `_ZN9train48406main_017h472af9ca814a5c7dE` -> `train4840::main_0`.
+
+    Returns None if symbol is not a legacy Rust symbol (i.e. has no hash).
+    """
+    components = _nested_name_components(symbol)
+    # Without the 17h<hash> suffix this is a C++ nested name, not Rust
+    if not components or len(components) < 2 or not _LEGACY_HASH.match(components[-1]):
+        return None
+    return '::'.join(_unescape_legacy_component(c) for c in components[:-1])
+
+
+def _split_path(path):
+    """Split a demangled path on `::` outside <>, [], () and {}"""
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(path):
+        ch = path[i]
+        if ch in '<[({':
+            depth += 1
+        elif ch in '>])}':
+            depth -= 1
+        elif depth == 0 and path.startswith('::', i):
+            parts.append(path[start:i])
+            start = i + 2
+            i += 1
+        i += 1
+    parts.append(path[start:])
+    return parts
+
+
+def item_name(demangled):
+    """
+    Return the unqualified item name of a demangled Rust or C++ symbol, e.g.
+    `<() as std::process::Termination>::report` -> `report`,
+    `foo[ef17931c9e9b4641]::bar::<i32>` -> `bar`,
+    `std::vector<int>::push_back(int const&)` -> `push_back`.
+    """
+    # Drop a C++ parameter list
+    depth = 0
+    for i, ch in enumerate(demangled):
+        if ch in '<[{':
+            depth += 1
+        elif ch in '>]}':
+            depth -= 1
+        elif ch == '(' and depth == 0 and i > 0:
+            demangled = demangled[:i]
+            break
+
+    parts = [p for p in _split_path(demangled) if p]
+    # Drop generic arguments (`::<T>`) and trailing legacy hashes
+    while len(parts) > 1 and (_LEGACY_HASH.match(parts[-1])
+                              or parts[-1].startswith('<') and ' as ' not in parts[-1]):
+        parts.pop()
+    name = parts[-1] if parts else demangled
+    # Drop v0 disambiguators (`foo[ef17931c9e9b4641]`) and C++ template args
+    for opener in '[<':
+        cut = name.find(opener)
+        if cut > 0:
+            name = name[:cut]
+    return name
+
+
+def _strip_generics(name):
+    cut = name.find('<')
+    return name[:cut] if cut > 0 else name
+
+
+def rust_item_path(demangled, crate):
+    """
+    Normalize a demangled Rust path to the form used for source items of
+    crate: crate name and generic arguments dropped, trait impls written as
+    `<Type as Trait>` with bare type and trait names. For example
+    `t2::geometry::Point<T>::new` -> `geometry::Point::new` and
+    `<t2::geometry::Point<T> as core::fmt::Display>::fmt`
+    -> `geometry::<Point as Display>::fmt`.
+
+    Returns None if the path does not belong to crate.
+    """
+    parts = _split_path(demangled)
+    head = parts[0]
+    if head.startswith('<') and head.endswith('>') and ' as ' in head:
+        self_type, trait = head[1:-1].split(' as ', 1)
+        type_path = _split_path(self_type)
+        if type_path[0] != crate:
+            return None
+        trait_name = _strip_generics(_split_path(trait)[-1])
+        parts = ([_strip_generics(p) for p in type_path[1:-1]]
+                 + [f"<{_strip_generics(type_path[-1])} as {trait_name}>"] + parts[1:])
+    elif head == crate and len(parts) > 1:
+        parts = parts[1:]
+    else:
+        return None
+    return '::'.join(p if p.startswith('<') else _strip_generics(p) for p in parts)
+
+
+class Demangler:
+    """
+    Demangler for legacy and v0 Rust symbols and C++ (Itanium) symbols.
+
+    Legacy Rust symbols are decoded in Python. Everything else is sent in
+    batches to a single long-lived `c++filt` co-process (binutils >= 2.36
+    understands Rust v0). Results are memoised in a bounded LRU, since the
+    same core:: and std:: symbols recur in every module. Symbols that cannot
+    be demangled map to themselves.
+    """
+
+    BATCH_SIZE = 128
+
+    def __init__(self, maxsize=65536, cxxfilt='c++filt'):
+        self.maxsize = maxsize
+        self.cxxfilt = cxxfilt
+        self._memo = OrderedDict()
+        self._process = None
+
+    def _filter(self, symbols):
+        """Demangle symbols through the c++filt co-process"""
+        if self._process is None:
+            try:
+                self._process = subprocess.Popen([self.cxxfilt], stdin=subprocess.PIPE,
+                                                 stdout=subprocess.PIPE, text=True, bufsize=1)
+            except OSError:
+                self.cxxfilt = None
+        if self.cxxfilt is None:
+            return list(symbols)
+
+        results = []
+        # Bounded batches so neither pipe can fill up while the other is blocked
+        for start in range(0, len(symbols), self.BATCH_SIZE):
+            batch = symbols[start:start + self.BATCH_SIZE]
+            self._process.stdin.write(''.join(s + '\n' for s in batch))
+            self._process.stdin.flush()
+            results.extend(self._process.stdout.readline().rstrip('\n') for _ in batch)
+        return results
+
+    def _remember(self, symbol, demangled):
+        self._memo[symbol] = demangled
+        if len(self._memo) > self.maxsize:
+            self._memo.popitem(last=False)
+
+    def demangle_many(self, symbols):
+        """Demangle a list of symbols, returning the results in the same order"""
+        results = {}
+        pending = []
+        for symbol in symbols:
+            if symbol in results:
+                continue
+            if symbol in self._memo:
+                self._memo.move_to_end(symbol)
+                results[symbol] = self._memo[symbol]
+                continue
+            demangled = demangle_rust_legacy(symbol)
+            if demangled is not None:
+                results[symbol] = demangled
+                self._remember(symbol, demangled)
+            elif symbol.startswith(('_Z', '_R')):
+                results[symbol] = None
+                pending.append(symbol)
+            else:
+                results[symbol] = symbol
+
+        if pending:
+            for symbol, demangled in zip(pending, self._filter(pending)):
+                results[symbol] = demangled
+                self._remember(symbol, demangled)
+        return [results[symbol] for symbol in symbols]
+
+    def demangle(self, symbol):
+        """Demangle a single symbol"""
+        return self.demangle_many([symbol])[0]
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def rewrite_symbol_sites(lines, demangler):
+    """
+    Replace mangled Rust/C++ symbols at define, declare and call sites with
+    their unqualified item name (quoted when it is not a bare IR identifier).
+    Other lines are passed through untouched. Yields the rewritten lines.
+    """
+    for line in lines:
+        if not (line.startswith(('define', 'declare')) or 'call ' in line or 'invoke ' in line):
+            yield line
+            continue
+        matches = list(_SYMBOL_REF.finditer(line))
+        if not matches:
+            yield line
+            continue
+        symbols = [m.group(1) if m.group(1) is not None else m.group(2) for m in matches]
+        names = demangler.demangle_many(symbols)
+        pieces = []
+        pos = 0
+        for match, symbol, demangled in zip(matches, symbols, names):
+            pieces.append(line[pos:match.start()])
+            if demangled and demangled != symbol:
+                name = item_name(demangled)
+                pieces.append(f"@{name}" if _BARE_IDENTIFIER.match(name) else f'@"{name}"')
+            else:
+                pieces.append(match.group(0))
+            pos = match.end()
+        pieces.append(line[pos:])
+        yield ''.join(pieces)
@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import keyword
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from demangle import demangle_rust_legacy, strip_legacy_crate
+from run_compile_commands import is_up_to_date
+
+# Name of the synthetic crate the batched files become modules of
+BATCH_CRATE = 'rsbatch'
+
+# One codegen unit so rustc writes a single .ll
+RUSTC_IR_FLAGS = ['--emit=llvm-ir', '-C', 'opt-level=0', '-C', 'debuginfo=0',
+                  '-C', 'codegen-units=1', '-A', 'warnings']
+# Batches compile as one library crate; link-dead-code because nothing in it
+# would otherwise be reachable and no fn would get codegen'd
+RUSTC_BATCH_FLAGS = RUSTC_IR_FLAGS + ['--crate-type=lib', '--crate-name', BATCH_CRATE, '-C', 'link-dead-code']
+
+_MODULE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_SYMBOL = re.compile(r'@(?:"((?:[^"\\]|\\.)*)"|([-\w$.]+))')
+_MANGLED = re.compile(r'_ZN\d[\w$.]*')
+_ERROR_LOCATION = re.compile(r'^\s*--> (.+?):\d+:\d+$', re.M)
+
+
+def can_batch(rust_file):
+    """True if rust_file's stem can be used as a module name"""
+    stem = os.path.splitext(os.path.basename(rust_file))[0]
+    return bool(_MODULE_NAME.match(stem)) and not keyword.iskeyword(stem) and stem != BATCH_CRATE
+
+
+def parse_module(text):
+    """
+    Split a textual LLVM IR module into its top-level entities.
+
+    Returns (header lines, entities) where entities is a list of
+    (kind, name, text) in module order and kind is one of 'type', 'comdat',
+    'global', 'define', 'declare', 'attributes', 'metadata' or 'other'.
+    """
+    header = []
+    entities = []
+    lines = iter(text.split('\n'))
+    for line in lines:
+        if not line or line.startswith(';'):
+            continue
+        if line.startswith(('source_filename', 'target ')):
+            header.append(line)
+        elif line.startswith('define'):
+            body = [line]
+            for body_line in lines:
+                body.append(body_line)
+                if body_line.rstrip() == '}':
+                    break
+            match = _SYMBOL.search(line)
+            entities.append(('define', match.group(1) or match.group(2), '\n'.join(body)))
+        elif line.startswith('declare'):
+            match = _SYMBOL.search(line)
+            entities.append(('declare', match.group(1) or match.group(2), line))
+        elif line.startswith('@'):
+            match = _SYMBOL.match(line)
+            entities.append(('global', match.group(1) or match.group(2), line))
+        elif line.startswith('%'):
+            entities.append(('type', None, line))
+        elif line.startswith('$'):
+            entities.append(('comdat', line.split(' ', 1)[0][1:].strip('"'), line))
+        elif line.startswith('attributes'):
+            entities.append(('attributes', None, line))
+        elif line.startswith('!'):
+            entities.append(('metadata', None, line))
+        else:
+            entities.append(('other', None, line))
+    return header, entities
+
+
+def _module_of(symbol):
+    """Return the top-level module of the batch crate that owns symbol, or None"""
+    path = demangle_rust_legacy(symbol)
+    if path is None:
+        return None
+    path = path.lstrip('<')
+    prefix = f"{BATCH_CRATE}::"
+    if not path.startswith(prefix):
+        return None
+    return path[len(prefix):].split('::', 1)[0]
+
+
+def split_batch_module(text, modules):
+    """
+    Split the IR of a batch crate into one module text per entry of modules.
+
+    Each module keeps the functions owned by that module plus everything they
+    reference transitively (shared generic instantiations, globals,
+    declarations), together with all type definitions, attribute groups and
+    metadata. Symbols are renamed as if the module had been compiled as its
+    own crate (see demangle.strip_legacy_crate).
+
+    Returns {module: IR text}.
+    """
+    header, entities = parse_module(text)
+    named = {}
+    owned = {module: [] for module in modules}
+    for index, (kind, name, _) in enumerate(entities):
+        if name is not None and kind != 'comdat':
+            named[name] = index
+        if kind == 'define':
+            module = _module_of(name)
+            if module in owned:
+                owned[module].append(index)
+
+    shared = [i for i, (kind, _, _) in enumerate(entities) if kind in ('type', 'attributes', 'metadata', 'other')]
+    comdats = {name: i for i, (kind, name, _) in enumerate(entities) if kind == 'comdat'}
+
+    def rename(match):
+        return strip_legacy_crate(match.group(0), BATCH_CRATE)
+
+    split = {}
+    for module, roots in owned.items():
+        keep = set(roots)
+        pending = list(roots)
+        while pending:
+            kind, name, entity_text = entities[pending.pop()]
+            for match in _SYMBOL.finditer(entity_text):
+                index = named.get(match.group(1) or match.group(2))
+                if index is not None and index not in keep:
+                    keep.add(index)
+                    pending.append(index)
+        keep.update(comdats[entities[i][1]] for i in list(keep) if entities[i][1] in comdats)
+        keep.update(shared)
+
+        lines = [f"; ModuleID = '{module}'", f'source_filename = "{module}"']
+        lines += [line for line in header if not line.startswith('source_filename')]
+        for index in sorted(keep):
+            lines.append(entities[index][2])
+        split[module] = _MANGLED.sub(rename, '\n'.join(lines) + '\n')
+    return split
+
+
+def _run_rustc(arguments, cwd):
+    completed = subprocess.run(['rustc'] + arguments, cwd=cwd, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    return completed.returncode, completed.stderr.decode(errors='replace')
+
+
+def emit_single(rust_file, output_dir, extra_args=()):
+    """Compile one file on its own to output_dir/<stem>.ll; returns an error message or None"""
+    stem = os.path.splitext(os.path.basename(rust_file))[0]
+    output = os.path.abspath(os.path.join(output_dir, f"{stem}.ll"))
+    returncode, stderr = _run_rustc(RUSTC_IR_FLAGS + list(extra_args) + [os.path.abspath(rust_file), '-o', output],
+                                    output_dir)
+    if returncode != 0:
+        if os.path.exists(output):
+            os.remove(output)
+        return stderr.strip()[-2000:] or f"rustc exited with {returncode}"
+    return None
+
+
+def emit_batch(rust_files, output_dir, extra_args=()):
+    """
+    Compile rust_files as modules of one library crate and split the result
+    into output_dir/<stem>.ll per file.
+
+    Files that rustc reports errors for are dropped and the rest of the
+    batch is retried once; whatever cannot be batched is compiled on its own.
+    Returns {rust_file: error message} for files that failed.
+    """
+    errors = {}
+    batch = list(rust_files)
+    with tempfile.TemporaryDirectory() as tmp:
+        for attempt in range(2):
+            if not batch:
+                break
+            modules = {os.path.splitext(os.path.basename(f))[0]: f for f in batch}
+            root = os.path.join(tmp, f"{BATCH_CRATE}.rs")
+            with open(root, 'w') as f:
+                for module, rust_file in modules.items():
+                    f.write(f"#[path = {json.dumps(os.path.abspath(rust_file))}]\nmod {module};\n")
+            output = os.path.join(tmp, f"{BATCH_CRATE}.ll")
+            returncode, stderr = _run_rustc(RUSTC_BATCH_FLAGS + list(extra_args) + [root, '-o', output], tmp)
+            if returncode == 0:
+                with open(output) as f:
+                    split = split_batch_module(f.read(), modules)
+                for module, ir_text in split.items():
+                    with open(os.path.join(output_dir, f"{module}.ll"), 'w') as f:
+                        f.write(ir_text)
+                return errors
+
+            failing = {os.path.abspath(path) for path in _ERROR_LOCATION.findall(stderr)}
+            culprits = [f for f in batch if os.path.abspath(f) in failing]
+            if not culprits or attempt == 1:
+                break
+            for rust_file in culprits:
+                batch.remove(rust_file)
+                error = emit_single(rust_file, output_dir, extra_args)
+                if error:
+                    errors[rust_file] = error
+
+    # The batch as a whole would not build: fall back to one rustc per file
+    for rust_file in batch:
+        error = emit_single(rust_file, output_dir, extra_args)
+        if error:
+            errors[rust_file] = error
+    return errors
+
+
+def emit_directory(input_dir, output_dir, batch_size=64, jobs=None, force=False, extra_args=()):
+    """
+    Emit LLVM IR for every .rs file in input_dir to output_dir/<stem>.ll,
+    as test_fetch_rs_ll_pairs.py expects, packing up to batch_size files
+    into each rustc invocation and running `jobs` invocations at once.
+    Files whose .ll is newer than the source are skipped unless force.
+
+    Returns (number of files compiled, {rust_file: error message}).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rust_files = sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir) if name.endswith('.rs'))
+    pending = []
+    for rust_file in rust_files:
+        stem = os.path.splitext(os.path.basename(rust_file))[0]
+        if force or not is_up_to_date(rust_file, os.path.join(output_dir, f"{stem}.ll")):
+            pending.append(rust_file)
+
+    batchable = [f for f in pending if can_batch(f)]
+    batches = [batchable[i:i + batch_size] for i in range(0, len(batchable), batch_size)]
+    batches += [[f] for f in pending if not can_batch(f)]
+
+    def run(batch):
+        if len(batch) == 1:
+            error = emit_single(batch[0], output_dir, extra_args)
+            return {batch[0]: error} if error else {}
+        return emit_batch(batch, output_dir, extra_args)
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        for batch_errors in executor.map(run, batches):
+            errors.update(batch_errors)
+    return len(pending), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emit per-file LLVM IR for a directory of .rs files with batched rustc runs")
+    parser.add_argument('input_dir', help="directory of trainN.rs files")
+    parser.add_argument('output_dir', help="where to write trainN.ll files")
+    parser.add_argument('--batch-size', type=int, default=64, help="files per rustc invocation (default: 64)")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help="rustc invocations at once (default: number of CPUs)")
+    parser.add_argument('--force', action='store_true', help="rebuild files whose .ll is up to date")
+    args, extra_args = parser.parse_known_args()
+
+    compiled, errors = emit_directory(args.input_dir, args.output_dir, args.batch_size, args.jobs,
+                                      args.force, extra_args)
+    for rust_file, error in sorted(errors.items()):
+        print(f"Error compiling {rust_file}: {error.splitlines()[0] if error else ''}")
+    print(f"Emitted IR for {compiled - len(errors)} of {compiled} files ({len(errors)} failed)")
+
+
+if __name__ == "__main__":
+    main()
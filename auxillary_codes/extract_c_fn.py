@@ -1,9 +1,27 @@
 
 import re
 import os
+import io
+import argparse
 import subprocess
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import redirect_stdout
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+from ir_cache import IRCache, cache_key
+from ir_index import IRIndex
+from ir_minify import LEVELS, minify_ir
+from run_manifest import RunManifest, file_digest
+from dataset_sink import OUTPUT_FORMATS, PerFileSink, RecordBuffer, ShardedSink, source_order
+from ir_canonical import SeenHashes, canonical_hash
+from metrics import Metrics
+
+_C_IDENTIFIER = re.compile(r'^[a-zA-Z_]\w*$')
+
 def remove_blank_lines(text):
     """Remove blank lines from the text while preserving indentation"""
     lines = text.split('\n')
@@ -28,189 +46,758 @@ def extract_ir_function_name(ir_text):
         return match.group(1)
     return None
 
+# Outside literals and comments '#' only occurs in preprocessor directives
+_C_HAZARDS = '"\'/#'           # can hide a brace (literals, comments, directives)
+# At file scope the gaps between stops are short, so one search is cheaper
+# than tracking each character
+_C_FILE_SCOPE_STOP = re.compile(r'[{};"\'/#]')
+# A backslash escapes any character, newlines included (line continuations)
+_C_LITERAL = {'"': re.compile(r'"(?:\\.|[^"\\\n])*"?', re.S), "'": re.compile(r"'(?:\\.|[^'\\\n])*'?", re.S)}
+
+def _c_body_text_pattern(nesting):
+    """
+    Regex matching body text up to the next brace, comment or directive,
+    literals included, together with the blocks nested up to nesting deep
+    that contain none of them. Every token can only be matched one way (a
+    plain run must end where the next token starts), so a block that turns
+    out to hold a comment is given up in linear time.
+    """
+    pattern = ''
+    for _ in range(nesting + 1):
+        alternatives = [r'[^"\'/#{}]+(?![^"\'/#{}])', r'"(?:\\.|[^"\\\n])*"', r"'(?:\\.|[^'\\\n])*'",
+                        r'/(?![/*])']
+        if pattern:
+            alternatives.append(r'\{' + pattern + r'\}')
+        pattern = '(?:' + '|'.join(alternatives) + ')*'
+    return re.compile(pattern, re.S)
+
+_C_BODY_TEXT = _c_body_text_pattern(3)
+
+# The common case, `int *name(int a, char *b)`, recognized in one match: as
+# a whole declaration, and ahead of the scan as the header of a definition
+_C_SIMPLE_DECLARATION = re.compile(r'\s*(?:[A-Za-z_]\w*[\s*]+)*([A-Za-z_]\w*)\s*\([^()]*\)\s*\Z')
+_C_SIMPLE_DEFINITION = re.compile(r'\s*((?:[A-Za-z_]\w*[\s*]+)*([A-Za-z_]\w*)\s*\([^()"\'/#{};]*\)\s*)\{')
+_C_DECLARATION_TOKEN = re.compile(r'[A-Za-z_]\w*|\d\w*|[()=]')
+# '(' opening a grouped declarator such as `(*getf(void))`, not a parameter list
+_C_GROUPING_PAREN = re.compile(r'\(\s*[*^]')
+
+# Identifiers that may precede '(' at file scope without naming a function
+_C_NOT_FUNCTION_NAMES = {
+    '__attribute__', '__declspec', '__asm__', '__asm', 'asm', '_Alignas',
+    '_Static_assert', 'sizeof', 'typeof', '__typeof__', '__extension__',
+}
+
+def _skip_hazard(text, at, comments):
+    """
+    Return the end of the literal, comment or directive starting at at
+    (just past a '/' that starts none of them), recording comment spans.
+    """
+    ch = text[at]
+    if ch in _C_LITERAL:
+        return _C_LITERAL[ch].match(text, at).end()
+    if ch == '#':
+        end = text.find('\n', at)
+        # Continuation lines
+        while end > 0 and text[end - 1] == '\\' or end > 1 and text[end - 2:end] == '\\\r':
+            end = text.find('\n', end + 1)
+        return end if end >= 0 else len(text)
+    follower = text[at + 1:at + 2]
+    if follower == '/':
+        end = text.find('\n', at)
+        end = end if end >= 0 else len(text)
+    elif follower == '*':
+        end = text.find('*/', at + 2)
+        end = end + 2 if end >= 0 else len(text)
+    else:
+        return at + 1
+    if comments is not None:
+        comments.append((at, end))
+    return end
+
+def _skip_body(text, pos, comments):
+    """
+    Return the offset just past the '}' matching the '{' that ends at pos,
+    or None if the file ends first.
+    """
+    depth = 1
+    skip = _C_BODY_TEXT.match
+    end = len(text)
+    while True:
+        pos = skip(text, pos).end()
+        if pos == end:
+            return None
+        token = text[pos]
+        if token == '{':
+            depth += 1
+            pos += 1
+        elif token == '}':
+            depth -= 1
+            pos += 1
+            if not depth:
+                return pos
+        elif token == '/' and text[pos + 1] == '/':
+            # Line comments, by far the most common hazard left in bodies
+            comment = pos
+            pos = text.find('\n', pos)
+            if pos < 0:
+                pos = end
+            if comments is not None:
+                comments.append((comment, pos))
+        else:
+            pos = _skip_hazard(text, pos, comments)
+
+def _blank(text, start, end, spans):
+    """text[start:end] with the given spans replaced by spaces, keeping offsets"""
+    if not spans:
+        return text[start:end]
+    pieces = []
+    pos = start
+    for span_start, span_end in spans:
+        pieces.append(text[pos:span_start])
+        pieces.append(' ' * (span_end - span_start))
+        pos = span_end
+    pieces.append(text[pos:end])
+    return ''.join(pieces)
+
+def _function_declarator(declaration):
+    """
+    Look at a file-scope declaration up to its '{' or ';' (comments,
+    literals, directives and nested bodies blanked out). Returns (name,
+    knr) if it declares a function, where knr tells whether declarations
+    follow the parameter list (K&R style), or None.
+
+    The name is the identifier whose '(' opens the parameter list, so for
+    `int (*getf(void))(int)` it is getf, not int.
+    """
+    simple = _C_SIMPLE_DECLARATION.match(declaration)
+    if simple is not None and simple.group(1) not in _C_NOT_FUNCTION_NAMES:
+        return simple.group(1), False
+
+    name = None
+    closed = False     # the parameter list after name has been closed
+    knr = False
+    depth = 0
+    skip_depth = None  # inside the parentheses of e.g. __attribute__((...))
+    last = None
+    for m in _C_DECLARATION_TOKEN.finditer(declaration):
+        token = m.group()
+        if token == '(':
+            if skip_depth is None and last is not None:
+                if last in _C_NOT_FUNCTION_NAMES:
+                    skip_depth = depth
+                elif name is None and not _C_GROUPING_PAREN.match(declaration, m.start()):
+                    name = last
+            depth += 1
+        elif token == ')':
+            depth = max(depth - 1, 0)
+            if skip_depth is not None and depth == skip_depth:
+                skip_depth = None
+            elif name is not None and depth == 0:
+                closed = True
+        elif token == '=':
+            if depth == 0:
+                return None
+        elif token[0].isdigit():
+            last = None
+            continue
+        else:
+            if closed and depth == 0 and token not in _C_NOT_FUNCTION_NAMES:
+                knr = True
+            last = token
+            continue
+        last = None
+    if name is None or not closed or depth:
+        return None
+    return name, knr
+
+def iter_c_function_spans(text, comments=None):
+    """
+    Find function definitions in C source text in a single pass.
+
+    Yields (name, start, end) for every function body at file scope, where
+    text[start:end] runs from the first token of the declaration to the
+    closing brace. Comments, string/char literals and preprocessor lines are
+    tokenized, so braces inside them are ignored. Multi-line and K&R-style
+    signatures and declarators such as `int (*getf(void))(int)` are
+    recognized. If a list is passed as `comments`, the (start, end) span of
+    every comment is appended to it.
+    """
+    decl_start = 0   # where the current file-scope declaration may begin
+    blanked = []     # spans since decl_start that aren't declaration text
+    pos = 0
+    search = _C_FILE_SCOPE_STOP.search
+    definition = _C_SIMPLE_DEFINITION.match
+
+    while True:
+        if pos == decl_start:
+            m = definition(text, pos)
+            if m is not None and m.group(2) not in _C_NOT_FUNCTION_NAMES:
+                end = _skip_body(text, m.end(), comments)
+                if end is None:
+                    return
+                yield m.group(2), m.start(1), end
+                decl_start = pos = end
+                continue
+
+        m = search(text, pos)
+        if m is None:
+            return
+        at = m.start()
+        token = text[at]
+        pos = at + 1
+        if token in _C_HAZARDS:
+            pos = _skip_hazard(text, at, comments)
+            if token in '/#' and pos > at + 1 and (at == decl_start or text[decl_start:at].isspace()):
+                # A comment or directive ahead of the declaration
+                decl_start = pos
+            elif pos > at + 1 or token != '/':
+                blanked.append((at, pos))
+            continue
+
+        if token == '}':
+            # Unbalanced '}' at file scope: start over
+            decl_start, blanked = pos, []
+            continue
+        if token == ';':
+            # A ';' only continues the declaration if it ends a K&R parameter
+            # declaration, which ends with a declarator rather than with
+            # ')' like prototypes or '}' like struct definitions
+            statement = text[decl_start:at]
+            if '(' in statement and statement.rstrip()[-1:] not in ')}':
+                declarator = _function_declarator(_blank(text, decl_start, at, blanked))
+                if declarator is not None and declarator[1]:
+                    continue
+            decl_start, blanked = pos, []
+            continue
+
+        end = _skip_body(text, pos, comments)
+        if end is None:
+            return
+        declaration = _blank(text, decl_start, at, blanked)
+        declarator = _function_declarator(declaration)
+        if declarator is not None:
+            yield declarator[0], decl_start + len(declaration) - len(declaration.lstrip()), end
+            decl_start, blanked = end, []
+        else:
+            # struct/enum bodies and initializers continue the declaration
+            blanked.append((at, end))
+        pos = end
+
+def _strip_comments(text, start, end, comments, comment_starts):
+    """Return text[start:end] with the comments inside it removed"""
+    i = bisect_left(comment_starts, start)
+    if i == len(comments) or comments[i][0] >= end:
+        return text[start:end]
+    pieces = []
+    pos = start
+    while i < len(comments) and comments[i][0] < end:
+        comment_start, comment_end = comments[i]
+        pieces.append(text[pos:comment_start])
+        pos = comment_end
+        i += 1
+    pieces.append(text[pos:end])
+    return ''.join(pieces)
+
 def extract_c_functions(file_path):
     """Extract complete function definitions from a C file"""
     try:
         with open(file_path, 'r') as file:
             content = file.read()
         
-        # Remove comments
-        content = re.sub(r'//.*?\n', '\n', content)
-        content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
-        
-        functions = []
-        brace_count = 0
-        current_function = ""
-        recording = False
-        
-        func_start_pattern = r'^[a-zA-Z_]\w*\s+[a-zA-Z_]\w*\s*\([^;]*\)\s*{?$'
-        
-        lines = content.split('\n')
-        # And modify the recording logic in the function extraction loop:
-        for line in lines:
-            if not recording:
-                if re.search(func_start_pattern, line.strip()):
-                    recording = True
-                    brace_count = line.count('{')  # Count braces in function signature line
-                    current_function = line + '\n'
-                    if brace_count > 0:
-                        continue
-                    
-            elif recording and not brace_count and line.strip().startswith('{'):
-                # Handle opening brace on its own line
-                current_function += line + '\n'
-                brace_count += 1
-                continue
-                
-            elif recording:
-                current_function += line + '\n'
-                brace_count += line.count('{')
-                brace_count -= line.count('}')
-                
-                if brace_count == 0 and current_function:
-                    functions.append(current_function)
-                    current_function = ""
-                    recording = False
-        
-        # Return list of tuples with function number, text, and name
-        return [(i+1, func, extract_function_name(func)) 
-                for i, func in enumerate(functions)]
+        comments = []
+        spans = list(iter_c_function_spans(content, comments))
+        comment_starts = [start for start, _ in comments]
+        
+        # Return list of tuples with function number, text (without comments), and name
+        return [(i+1, _strip_comments(content, start, end, comments, comment_starts), name)
+                for i, (name, start, end) in enumerate(spans)]
     
     except Exception as e:
         print(f"Error processing file {file_path}: {str(e)}")
         return []
 
-def generate_and_extract_ir(c_file):
-    """Generate LLVM IR for complete file and extract functions"""
-    base_name = os.path.splitext(c_file)[0]
-    temp_ll = f"{base_name}_temp.ll"
-    temp_clean_ll = f"{base_name}_temp_clean.ll"
+# clang writes IR to stdout, opt reads it from stdin and writes cleaned IR to stdout
+CLANG_COMMAND = ['clang', '-Oz', '-emit-llvm', '-S', '-o', '-']
+OPT_COMMAND = ['opt', '-strip-debug', '-S', '-o', '-']
+
+def compile_to_ir(c_file):
+    """
+    Compile a C file to debug-free textual LLVM IR without touching the disk.
+
+    clang's stdout is piped straight into opt, and the cleaned IR is read
+    from opt's stdout. Raises subprocess.CalledProcessError (with the
+    failing tool's stderr) if either step fails.
+    """
+    # clang's diagnostics go to an anonymous temp file so a chatty compile
+    # cannot fill the stderr pipe while we are blocked reading opt
+    with tempfile.TemporaryFile() as clang_stderr:
+        clang = subprocess.Popen(CLANG_COMMAND + [c_file],
+                                 stdout=subprocess.PIPE, stderr=clang_stderr)
+        opt = subprocess.Popen(OPT_COMMAND, stdin=clang.stdout,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Let clang receive SIGPIPE if opt exits early
+        clang.stdout.close()
+        ir_text, opt_err = opt.communicate()
+        clang.wait()
+        
+        if clang.returncode != 0:
+            clang_stderr.seek(0)
+            raise subprocess.CalledProcessError(clang.returncode, clang.args,
+                                                stderr=clang_stderr.read())
+    if opt.returncode != 0:
+        raise subprocess.CalledProcessError(opt.returncode, opt.args, stderr=opt_err)
+    
+    return ir_text.decode()
+
+# Multi-level mode: the front end runs once, without optimizing, to bitcode.
+# -disable-O0-optnone keeps the functions optimizable by the later opt runs.
+FRONTEND_COMMAND = ['clang', '-O0', '-Xclang', '-disable-O0-optnone', '-emit-llvm', '-c', '-o', '-']
+OPT_LEVELS = ('O0', 'O1', 'O2', 'O3', 'Os', 'Oz')
+
+def opt_level_command(level):
+    """The opt command line turning bitcode on stdin into cleaned IR at level"""
+    if level not in OPT_LEVELS:
+        raise ValueError(f"Unknown optimization level {level!r}, expected one of {OPT_LEVELS}")
+    passes = [] if level == 'O0' else [f'-{level}']
+    return ['opt'] + passes + ['-strip-debug', '-S', '-o', '-']
+
+def compile_to_bitcode(c_file, cache=None):
+    """
+    Run the clang front end once on c_file and return unoptimized bitcode,
+    looked up in (and stored to) cache if an IRCache is given.
+    """
+    key = None
+    if cache is not None:
+        with open(c_file, 'rb') as f:
+            key = cache_key(f.read(), FRONTEND_COMMAND)
+        bitcode = cache.get(key, binary=True)
+        if bitcode is not None:
+            return bitcode
+    completed = subprocess.run(FRONTEND_COMMAND + [c_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise subprocess.CalledProcessError(completed.returncode, completed.args, stderr=completed.stderr)
+    if cache is not None:
+        cache.put(key, completed.stdout)
+    return completed.stdout
+
+def optimize_bitcode(bitcode, level, cache=None):
+    """Run the opt pipeline for level over bitcode; returns textual IR (cached by bitcode and command)"""
+    command = opt_level_command(level)
+    key = None
+    if cache is not None:
+        key = cache_key(bitcode, command)
+        ir_text = cache.get(key)
+        if ir_text is not None:
+            return ir_text
+    completed = subprocess.run(command, input=bitcode, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise subprocess.CalledProcessError(completed.returncode, completed.args, stderr=completed.stderr)
+    ir_text = completed.stdout.decode()
+    if cache is not None:
+        cache.put(key, ir_text)
+    return ir_text
+
+def generate_multi_level_ir(c_file, levels, cache=None, ir_level='none'):
+    """
+    Return {level: [(function name, IR)]} for each optimization level in
+    levels, from one front-end run: the unoptimized bitcode is produced (or
+    fetched from cache) once and the opt pipelines run on it in parallel.
+
+    The opt pipelines approximate `clang -<level>`; the front end's own
+    level-dependent choices (e.g. TBAA metadata) are those of -O0.
+    """
+    bitcode = compile_to_bitcode(c_file, cache)
+    with ThreadPoolExecutor(max_workers=len(levels)) as executor:
+        texts = list(executor.map(lambda level: optimize_bitcode(bitcode, level, cache), levels))
+    return {level: [(name, minify_ir(ir, ir_level)) for name, ir in split_ir_functions(text)]
+            for level, text in zip(levels, texts)}
+
+def split_ir_functions(content):
+    """Split textual LLVM IR into a list of (function name, function text) tuples"""
+    index = IRIndex.from_text(content)
+    # C symbols are plain identifiers; skip anything else (e.g. quoted names)
+    return [(name, index.text(name)) for name in index if _C_IDENTIFIER.match(name)]
+
+def compile_to_ir_cached(c_file, cache):
+    """
+    compile_to_ir() through an IRCache keyed by the source contents, the
+    clang/opt command lines and the clang/opt versions.
+    """
+    with open(c_file, 'rb') as f:
+        key = cache_key(f.read(), CLANG_COMMAND, OPT_COMMAND)
     
+    ir_text = cache.get(key)
+    if ir_text is None:
+        ir_text = compile_to_ir(c_file)
+        cache.put(key, ir_text)
+    return ir_text
+
+def generate_and_extract_ir(c_file, cache=None, ir_level='none'):
+    """
+    Generate LLVM IR for complete file and extract functions.
+
+    If an IRCache is given, the cleaned IR is looked up there first and
+    stored there after compiling, so only the splitting is redone on reruns.
+    Each function is minified to ir_level (see ir_minify.minify_ir).
+    """
     try:
-        # Generate LLVM IR
-        subprocess.run(['clang', '-Oz', '-emit-llvm', '-S', c_file, '-o', temp_ll], 
-                      check=True, stderr=subprocess.PIPE)
-        
-        # Clean and strip debug info
-        subprocess.run(['opt', '-strip-debug', '-S', temp_ll, '-o', temp_clean_ll],
-                      check=True, stderr=subprocess.PIPE)
-        
-        # Extract functions from IR
-        ir_functions = []
-        with open(temp_clean_ll, 'r') as f:
-            content = f.read()
-        
-        current_function = []
-        in_function = False
-        
-        for line in content.split('\n'):
-            if line.startswith('define '):
-                in_function = True
-                current_function = [line]
-            elif in_function:
-                current_function.append(line)
-                if line.strip() == '}':
-                    func_text = '\n'.join(current_function)
-                    func_name = extract_ir_function_name(func_text)
-                    if func_name:
-                        ir_functions.append((func_name, func_text))
-                    in_function = False
-                    current_function = []
-        
-        # Cleanup temporary files
-        os.remove(temp_ll)
-        os.remove(temp_clean_ll)
-        
-        return ir_functions
+        if cache is not None:
+            ir_text = compile_to_ir_cached(c_file, cache)
+        else:
+            ir_text = compile_to_ir(c_file)
+        return [(name, minify_ir(ir, ir_level)) for name, ir in split_ir_functions(ir_text)]
     
     except subprocess.CalledProcessError as e:
         print(f"Error generating LLVM IR for {c_file}: {e.stderr.decode()}")
-        # Cleanup any temporary files
-        for f in [temp_ll, temp_clean_ll]:
-            if os.path.exists(f):
-                os.remove(f)
         return []
     except Exception as e:
         print(f"Error in generate_and_extract_ir: {str(e)}")
         return []
 
-def process_file(c_file, output_dir):
-    """Process a single C file, matching C functions with their IR"""
+def _generate_levels_or_report(c_file, opt_levels, cache, ir_level):
+    """generate_multi_level_ir, reporting failures like generate_and_extract_ir"""
+    try:
+        return generate_multi_level_ir(c_file, opt_levels, cache, ir_level)
+    except subprocess.CalledProcessError as e:
+        print(f"Error generating LLVM IR for {c_file}: {e.stderr.decode(errors='replace')}")
+        return {}
+
+def process_file(c_file, output_dir, cache=None, sink=None, ir_level='none', metrics=None, opt_levels=None):
+    """
+    Process a single C file, matching C functions with their IR.
+
+    Each function becomes one record (source, number, function, language,
+    code, ir) written to sink; the default is the per-function file layout
+    in output_dir (see dataset_sink.PerFileSink). IR is minified to
+    ir_level (see ir_minify.LEVELS).
+
+    Returns a dict with the file's status ('ok', 'ir_failed', 'no_functions'
+    or 'error'), the number of C functions and IR functions written, the
+    paths written and, on failure, the reason.
+
+    If opt_levels (e.g. ['O0', 'O2', 'Oz']) is given, IR comes from
+    generate_multi_level_ir instead of `clang -Oz`: 'ir' holds the first
+    level's IR and each further level gets its own `ir_<level>` field.
+
+    Stage times, counters and per-file latency go to metrics (see
+    metrics.Metrics); per-artifact messages are only printed when it is
+    verbose.
+    """
+    result = {'file': c_file, 'status': 'error', 'functions': 0, 'matched': 0,
+              'outputs': [], 'error': None}
+    if sink is None:
+        sink = PerFileSink(output_dir)
+    if metrics is None:
+        metrics = Metrics()
+    start = time.perf_counter()
     try:
-        base_filename = Path(c_file).stem
-        print(f"\nProcessing {c_file}...")
+        metrics.trace(f"\nProcessing {c_file}...")
         
         # First, generate IR and extract IR functions
-        ir_functions = generate_and_extract_ir(c_file)
+        with metrics.stage('generate_ir'):
+            if opt_levels:
+                levels = _generate_levels_or_report(c_file, opt_levels, cache, ir_level)
+                ir_functions = levels.get(opt_levels[0], [])
+                extra_levels = {level: dict(levels[level]) for level in opt_levels[1:]}
+            else:
+                ir_functions = generate_and_extract_ir(c_file, cache, ir_level)
+                extra_levels = {}
         if not ir_functions:
-            print(f"Failed to generate IR for {c_file}")
-            return
+            metrics.trace(f"Failed to generate IR for {c_file}")
+            result['status'] = 'ir_failed'
+            result['error'] = "no IR functions generated"
+            return result
         
         # Create a dictionary of IR functions by name
         ir_dict = {name: ir for name, ir in ir_functions}
         
         # Extract C functions
-        c_functions = extract_c_functions(c_file)
+        with metrics.stage('extract_c'):
+            c_functions = extract_c_functions(c_file)
         if not c_functions:
-            print(f"No functions found in {c_file}")
-            return
+            metrics.trace(f"No functions found in {c_file}")
+            result['status'] = 'no_functions'
+            result['error'] = "no C functions found"
+            return result
         
         # Process each function
-        for number, c_func_text, c_func_name in c_functions:
-            if not c_func_name:
-                print(f"Could not extract name for function {number}")
-                continue
-            
-            # Write C function
-            c_output = os.path.join(output_dir, f"{base_filename}_{number}.c")
-            with open(c_output, 'w') as f:
-                f.write(remove_blank_lines(c_func_text))
-            print(f"Created {c_output}")
-            
-            # Find and write corresponding IR
-            if c_func_name in ir_dict:
-                ll_output = os.path.join(output_dir, f"{base_filename}_{number}.ll")
-                with open(ll_output, 'w') as f:
-                    f.write(ir_dict[c_func_name])
-                print(f"Created {ll_output}")
-            else:
-                print(f"Warning: No matching IR found for function {c_func_name}")
+        with metrics.stage('write'):
+            for number, c_func_text, c_func_name in c_functions:
+                if not c_func_name:
+                    metrics.trace(f"Could not extract name for function {number}")
+                    continue
+                
+                record = {'source': c_file, 'number': number, 'function': c_func_name,
+                          'language': 'c', 'code': remove_blank_lines(c_func_text),
+                          'ir': ir_dict.get(c_func_name)}
+                for level, level_dict in extra_levels.items():
+                    record[f'ir_{level}'] = level_dict.get(c_func_name)
+                for path in sink.write(record):
+                    metrics.trace(f"Created {path}")
+                    result['outputs'].append(path)
+                result['functions'] += 1
+                
+                if record['ir'] is not None:
+                    result['matched'] += 1
+                else:
+                    metrics.trace(f"Warning: No matching IR found for function {c_func_name}")
+        
+        result['status'] = 'ok'
     
     except Exception as e:
         print(f"Error processing file {c_file}: {str(e)}")
+        result['error'] = str(e)
+    
+    finally:
+        metrics.count('files')
+        metrics.count(result['status'])
+        metrics.count('functions', result['functions'])
+        metrics.count('matched', result['matched'])
+        metrics.count('unmatched', result['functions'] - result['matched'])
+        metrics.observe('file_seconds', time.perf_counter() - start)
+    
+    return result
 
-def process_directory(input_dir, output_dir):
-    """Process all .c files in the input directory"""
+# One IRCache per (process, cache directory), created on first use
+_worker_caches = {}
+
+def _process_file_captured(args):
+    """
+    Worker entry point: run process_file and capture everything it prints,
+    so the parent can emit each file's log as one block in input order.
+    The file's metrics travel back as a snapshot for the parent to merge.
+    """
+    c_file, output_dir, cache_dir, cache_bytes, collect, ir_level, verbose, opt_levels = args
+    cache = None
+    if cache_dir:
+        cache = _worker_caches.get(cache_dir)
+        if cache is None:
+            cache = _worker_caches[cache_dir] = IRCache(cache_dir, cache_bytes)
+        hits, misses = cache.stats['hits'], cache.stats['misses']
+    
+    # Shards and the dedup set are owned by the parent, so output travels
+    # back as records, hashed here to keep that work in the workers
+    sink = RecordBuffer() if collect else None
+    buffer = io.StringIO()
+    metrics = Metrics(verbose, stream=buffer)
+    with redirect_stdout(buffer):
+        result = process_file(c_file, output_dir, cache, sink, ir_level, metrics, opt_levels)
+    result['metrics'] = metrics.to_dict()
+    if sink is not None:
+        for record in sink.records:
+            if record['ir'] is not None:
+                record['ir_hash'] = canonical_hash(record['ir'])
+        result['records'] = sink.records
+    
+    if cache is not None:
+        result['cache_hits'] = cache.stats['hits'] - hits
+        result['cache_misses'] = cache.stats['misses'] - misses
+    return result, buffer.getvalue()
+
+def process_directory(input_dir, output_dir, jobs=None, cache_dir=None,
+                      cache_bytes=1 << 30, manifest_path=None, output_format='files',
+                      shard_bytes=256 << 20, dedup_path=None, ir_level='none',
+                      metrics=None, metrics_path=None, opt_levels=None):
+    """
+    Process all .c files in the input directory.
+
+    Files are spread over a pool of `jobs` worker processes (default: number
+    of CPUs; 1 runs everything in-process). Progress is reported on stderr
+    at most once a second; with a verbose metrics.Metrics, per-file logs
+    are printed in sorted file order regardless of completion order. Worker
+    metrics are merged into metrics and, if metrics_path is given, written
+    there as JSON at the end.
+
+    If cache_dir is given, cleaned IR is cached there (see ir_cache.IRCache)
+    and the cache is trimmed to cache_bytes at the end of the run.
+
+    If manifest_path is given, each file's outcome is recorded there (see
+    run_manifest.RunManifest) and files that already succeeded with the same
+    contents are skipped, so an interrupted run can be resumed.
+
+    output_format 'files' writes a .c/.ll pair per function; any of
+    dataset_sink.SHARD_FORMATS instead appends one record per function to
+    shards of about shard_bytes in output_dir.
+
+    If dedup_path is given, functions whose IR is an exact duplicate (after
+    ir_canonical.canonicalize_ir) of one already written, in this run or an
+    earlier one sharing the same hash set file, are dropped before writing.
+
+    ir_level selects how much the written IR is minified (see ir_minify).
+
+    opt_levels (e.g. ['O0', 'O2', 'Oz']) switches to multi-level IR: one
+    unoptimized bitcode per file (cached in cache_dir) and one opt run per
+    level, each level in its own field (see process_file).
+
+    Returns a dict of counts: files per status, skipped files, functions,
+    matched IR, duplicates dropped and cache hits/misses.
+    """
+    summary = {'ok': 0, 'ir_failed': 0, 'no_functions': 0, 'error': 0, 'skipped': 0,
+               'functions': 0, 'matched': 0, 'duplicates': 0, 'cache_hits': 0, 'cache_misses': 0}
+    manifest = None
+    sink = None
+    seen = None
+    if metrics is None:
+        metrics = Metrics()
     try:
         # Create output directory if it doesn't exist
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         
-        # Get all .c files from input directory
-        c_files = list(Path(input_dir).glob('*.c'))
+        # Get all .c files from input directory, in the order join_dataset.py merges by
+        c_files = [str(p) for p in sorted(Path(input_dir).glob('*.c'), key=lambda p: source_order(p.stem))]
         
         if not c_files:
             print(f"No .c files found in {input_dir}")
-            return
+            return summary
+        
+        if manifest_path:
+            manifest = RunManifest(manifest_path)
+            digests = {c_file: file_digest(c_file) for c_file in c_files}
+            pending = [f for f in c_files if manifest.should_process(f, digests[f])]
+            summary['skipped'] = len(c_files) - len(pending)
+            if summary['skipped']:
+                print(f"Skipping {summary['skipped']} unchanged files already processed")
+            c_files = pending
+            if not c_files:
+                return summary
+        
+        jobs = jobs or os.cpu_count() or 1
+        jobs = min(jobs, len(c_files))
+        print(f"Found {len(c_files)} .c files to process ({jobs} jobs)")
         
-        print(f"Found {len(c_files)} .c files to process")
+        if output_format != 'files':
+            sink = ShardedSink(output_dir, output_format, max_shard_bytes=shard_bytes)
+        if dedup_path:
+            # Committed along with the records, so a crash can't drop their rerun as duplicates
+            seen = SeenHashes(dedup_path, commit_every=None)
+            sink = sink or PerFileSink(output_dir)
         
-        # Process each file
-        for c_file in c_files:
-            process_file(str(c_file), output_dir)
+        work = [(c_file, output_dir, cache_dir, cache_bytes, sink is not None, ir_level, metrics.verbose,
+                 opt_levels) for c_file in c_files]
+        if jobs == 1:
+            results = map(_process_file_captured, work)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=jobs)
+            chunksize = max(1, len(work) // (jobs * 8))
+            results = executor.map(_process_file_captured, work, chunksize=chunksize)
+        
+        try:
+            # executor.map yields in submission order, so output is deterministic
+            for done, (result, log) in enumerate(results, 1):
+                print(log, end='')
+                metrics.merge(result.pop('metrics'))
+                if sink is not None:
+                    written = set()
+                    for record in result.pop('records', []):
+                        if seen is not None and 'ir_hash' in record and not seen.add(record['ir_hash']):
+                            # The worker counted it as a written, matched function
+                            result['functions'] -= 1
+                            result['matched'] -= 1
+                            summary['duplicates'] += 1
+                            metrics.count('functions', -1)
+                            metrics.count('matched', -1)
+                            metrics.count('duplicates')
+                            continue
+                        written.update(sink.write(record))
+                    result['outputs'] = sorted(written)
+                    if seen is not None:
+                        sink.when_durable(seen.commit)
+                summary[result['status']] += 1
+                summary['functions'] += result['functions']
+                summary['matched'] += result['matched']
+                summary['cache_hits'] += result.get('cache_hits', 0)
+                summary['cache_misses'] += result.get('cache_misses', 0)
+                if manifest is not None:
+                    stage = 'done' if result['status'] == 'ok' else result['status']
+                    entry = partial(manifest.record, result['file'], digests[result['file']], stage,
+                                    result['outputs'], result['error'])
+                    # Shard records sit in buffers until their shard is closed; a crash
+                    # before that must leave the file to be processed again
+                    if sink is not None:
+                        sink.when_durable(entry)
+                    else:
+                        entry()
+                metrics.progress(done, len(c_files))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        print(f"\nFiles: {summary['ok']} ok, {summary['ir_failed']} IR failures, "
+              f"{summary['no_functions']} without functions, {summary['error']} errors, "
+              f"{summary['skipped']} skipped")
+        print(f"Functions: {summary['functions']} written, {summary['matched']} with matching IR")
+        if seen is not None:
+            print(f"Duplicates: {summary['duplicates']} functions with already seen IR dropped")
+        if isinstance(sink, ShardedSink):
+            sink.close()
+            print(f"Shards: {len(sink.shards)} written to {output_dir}")
+        if cache_dir:
+            # Workers only see their own writes, so enforce the size bound here
+            cache = IRCache(cache_dir, cache_bytes)
+            cache.evict()
+            print(f"IR cache: {summary['cache_hits']} hits, {summary['cache_misses']} misses, "
+                  f"{cache.stats['evictions']} evicted")
     
     except Exception as e:
         print(f"Error processing directory: {str(e)}")
+    finally:
+        if sink is not None:
+            sink.close()
+        if seen is not None:
+            seen.close()
+        if manifest is not None:
+            manifest.close()
+        if metrics_path:
+            metrics.write(metrics_path)
+    
+    return summary
 
 def main():
-    # You can modify these paths as needed
-    input_dir = "/home/mshaikh2/test_C_IR_generation"
-    output_dir = "/home/mshaikh2/test_C_IR_generation/output"
+    parser = argparse.ArgumentParser(description="Extract C functions and their LLVM IR")
+    # You can modify these default paths as needed
+    parser.add_argument('input_dir', nargs='?', default="/home/mshaikh2/test_C_IR_generation")
+    parser.add_argument('output_dir', nargs='?', default="/home/mshaikh2/test_C_IR_generation/output")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="directory for the compiled-IR cache (default: no cache)")
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help="maximum IR cache size in MB (default: 1024)")
+    parser.add_argument('--manifest', default=None,
+                        help="JSONL run manifest; files already processed are skipped on rerun")
+    parser.add_argument('--format', default='files', choices=OUTPUT_FORMATS,
+                        help="'files' for a .c/.ll pair per function, otherwise sharded records "
+                             "(jsonl.zst needs zstandard, parquet needs pyarrow)")
+    parser.add_argument('--shard-size', type=int, default=256,
+                        help="approximate shard size in MB before rotating (default: 256)")
+    parser.add_argument('--dedup', default=None,
+                        help="on-disk hash set; functions whose canonical IR was already seen are dropped")
+    parser.add_argument('--ir-level', default='none', choices=LEVELS,
+                        help="IR minification level for the written IR (default: none)")
+    parser.add_argument('--opt-levels', default=None,
+                        help="comma-separated levels (e.g. O0,O2,Oz): run the front end once to bitcode and "
+                             "opt once per level, one IR field per level (default: clang -Oz)")
+    parser.add_argument('--metrics', default=None,
+                        help="write stage timers, counters and latency histograms here as JSON")
+    parser.add_argument('--verbose', '-v', action='store_true', help="print a line per file and artifact")
+    args = parser.parse_args()
+    
+    opt_levels = args.opt_levels.split(',') if args.opt_levels else None
+    for level in opt_levels or []:
+        if level not in OPT_LEVELS:
+            parser.error(f"unknown optimization level {level!r}, expected some of {', '.join(OPT_LEVELS)}")
     
-    if not os.path.isdir(input_dir):
-        print(f"Error: Input directory '{input_dir}' does not exist")
+    if not os.path.isdir(args.input_dir):
+        print(f"Error: Input directory '{args.input_dir}' does not exist")
         return
     
-    process_directory(input_dir, output_dir)
+    process_directory(args.input_dir, args.output_dir, jobs=args.jobs,
+                      cache_dir=args.cache_dir, cache_bytes=args.cache_size << 20,
+                      manifest_path=args.manifest, output_format=args.format,
+                      shard_bytes=args.shard_size << 20, dedup_path=args.dedup,
+                      ir_level=args.ir_level, metrics=Metrics(args.verbose), metrics_path=args.metrics,
+                      opt_levels=opt_levels)
     print("\nProcessing complete!")
 
 if __name__ == "__main__":
@@ -1,114 +1,111 @@
 import os
 import re
-import subprocess
+from contextlib import nullcontext
+
+from demangle import demangle_rust_legacy, legacy_rust_prefix, rust_item_path
+from ir_index import IRIndex
+from ir_minify import minify_ir
+from rust_scanner import iter_rust_function_spans
+
+
+_PLAIN_SYMBOL = re.compile(r'^[a-zA-Z0-9_]+$')
 
 
 def extract_rust_function_definitions(rust_file_path):
     """
     Extract complete function definitions from a Rust source file.
-    Returns a dictionary with function names as keys and their definitions as values.
+    Returns a dictionary keyed by each function's path inside the crate
+    (e.g. `main`, `Point::new`, `<Point as Display>::fmt`, `outer::inner`)
+    with the full lines of its definition as values, in source order.
     """
-    function_definitions = {}
-
     with open(rust_file_path, 'r') as file:
-        lines = file.readlines()
-
-    for i, line in enumerate(lines):
-        # Modified to include main() function
-        if "fn " in line and line.strip().endswith("{"):  # Look for lines containing 'fn'
-            start_line = i
-            function_def = extract_function(lines, start_line)
-            if function_def:
-                function_name = extract_function_name(line)
-                if function_name:
-                    print(f'function name is {function_name}')
-                    function_definitions[function_name] = function_def
+        text = file.read()
+
+    spans = sorted(iter_rust_function_spans(text), key=lambda span: span[1])
+
+    function_definitions = {}
+    for path, start, end in spans:
+        # Whole lines, from the line holding `fn` to the one holding the closing brace
+        start = text.rfind('\n', 0, start) + 1
+        line_end = text.find('\n', end)
+        end = len(text) if line_end < 0 else line_end + 1
+        function_definitions[path] = text[start:end]
 
     return function_definitions
 
 
-def extract_function(lines, start_line):
-    """
-    Extract a complete function definition starting from the given line index.
-    Uses brace matching to find the end of the function.
-    """
-    function_body = []
-    brace_count = 0
-    in_function = False
-
-    for line in lines[start_line:]:
-        function_body.append(line)
-        if '{' in line:
-            brace_count += line.count('{')
-            in_function = True
-        if '}' in line and in_function:
-            brace_count -= line.count('}')
-            if brace_count == 0:
-                break
-
-    if brace_count == 0 and in_function:
-        return ''.join(function_body)
-    return None
-
-
-def extract_function_name(line):
+def index_crate_symbols(index, crate):
     """
-    Extract the function name from a line containing 'fn'.
-    Handles generics and type constraints correctly.
+    Map Rust item paths to IR symbol names for the functions defined in index.
+
+    Legacy-mangled symbols of crate items (`_ZN<len><crate>...`, or trait
+    impls for crate types `_ZN<len>_$LT$<crate>..`) are keyed by their path
+    inside the crate in the form extract_rust_function_definitions uses
+    (e.g. `add`, `Point::new`, `<Point as Display>::fmt`). Other mangled
+    symbols (std/core monomorphizations) fail the prefix check and are never
+    demangled. Unmangled symbols (`#[no_mangle]` functions) are keyed by
+    their own name unless a mangled crate item already claimed it. Only the
+    first symbol for a path is kept, so generic instances don't overwrite
+    each other.
     """
-    match = re.search(r'fn\s+([a-zA-Z_][a-zA-Z0-9_]*)', line)
-    if match:
-        return match.group(1)
-    return None
-
-
-def extract_ir_for_functions(ir_file_path, function_names):
+    crate_prefix = legacy_rust_prefix(crate)
+    impl_prefix = re.compile(r'_ZN\d+_\$LT\$' + re.escape(crate) + r'\.\.')
+    symbols = {}
+    unmangled = []
+    for ir_func_name in index:
+        if ir_func_name.startswith(crate_prefix) or impl_prefix.match(ir_func_name):
+            demangled = demangle_rust_legacy(ir_func_name)
+            path = rust_item_path(demangled, crate) if demangled else None
+            if path:
+                symbols.setdefault(path, ir_func_name)
+        elif _PLAIN_SYMBOL.match(ir_func_name) and not ir_func_name.startswith('_Z'):
+            unmangled.append(ir_func_name)
+    for ir_func_name in unmangled:
+        symbols.setdefault(ir_func_name, ir_func_name)
+    return symbols
+
+
+def extract_ir_for_functions(ir_file_path, function_names, crate=None, ir_level='none', store=None):
     """
     Extract LLVM IR for specific functions from the IR file.
     Returns a dictionary mapping function names to their IR.
+
+    IR symbols are demangled to their path inside `crate` (default: the IR
+    file's stem, as rustc names the crate after the source file) and looked
+    up by exact path. A bare function name falls back to the unique crate
+    item whose last path component matches it.
+
+    ir_level is an ir_minify level applied to each function's IR.
+
+    If store (an ir_store.IRStore) is given, the module named after the IR
+    file's stem is read from it instead of from ir_file_path.
     """
     ir_dict = {}
-    current_function = None
-    current_ir = []
-
-    with open(ir_file_path, 'r') as file:
-        lines = file.readlines()
-
-    for line in lines:
-        # Look for function definitions in IR
-        define_match = re.search(r'define\s+(?:.*?\s+)?@([a-zA-Z0-9_]+)\s*\(', line)
-
-        if define_match:
-            print(f'printing define_match {define_match}')
-            if current_function and current_ir:
-                ir_dict[current_function] = ''.join(current_ir)
-                current_ir = []
-
-            ir_func_name = define_match.group(1)
-            print(f'printing ir_func_name {ir_func_name}')
-            found_function = None
-
-            for rust_func in function_names:
-                if rust_func in ir_func_name:
-                    found_function = rust_func
-                    break
-
-            current_function = found_function
-            if current_function:
-                current_ir.append(line)
-
-        elif current_function and line.strip():
-            current_ir.append(line)
-            if line.strip() == '}':
-                ir_dict[current_function] = ''.join(current_ir)
-                current_function = None
-                current_ir = []
+    if crate is None:
+        crate = os.path.splitext(os.path.basename(ir_file_path))[0]
 
-    return ir_dict
+    module = os.path.splitext(os.path.basename(ir_file_path))[0]
+    with nullcontext(store.index(module)) if store is not None else IRIndex.open(ir_file_path) as index:
+        symbols = index_crate_symbols(index, crate)
 
+        by_last_component = {}
+        for path, ir_func_name in symbols.items():
+            by_last_component.setdefault(path.rsplit('::', 1)[-1], []).append(ir_func_name)
 
+        for rust_func in function_names:
+            ir_func_name = symbols.get(rust_func)
+            if ir_func_name is None:
+                candidates = by_last_component.get(rust_func, [])
+                if len(candidates) != 1:
+                    continue
+                ir_func_name = candidates[0]
+
+            # Keep the historical format: no blank lines, trailing newline
+            lines = index.text(ir_func_name).splitlines(True)
+            ir_dict[rust_func] = minify_ir(''.join(line for line in lines if line.strip()) + '\n', ir_level)
+
+    return ir_dict
 
-import os
 
 def write_files_for_functions(rust_file_path, ir_file_path, function_definitions, ir_dict):
     """
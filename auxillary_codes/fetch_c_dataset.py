@@ -1,22 +1,156 @@
-from datasets import load_dataset
-
-# Load the dataset with a specific split, like "Perf_Optimized" or "Size_Optimized"
-ds = load_dataset("UKPLab/SLTrans", "C")
-
-# Choose the desired split (either 'Perf_Optimized' or 'Size_Optimized')
-split = 'Perf_Optimized'
-
-start_row = 10001  # Start of the range (inclusive)
-end_row = 10100    # End of the range (exclusive)
-
-# Iterate over the first 10,000 rows of the chosen split
-for i in range(start_row, end_row):
-    # Extract the source code from the current row of the selected split
-    source_code = ds[split][i]['Source_Code']
-    
-    # Define the filename for the current row
-    filename = f'train{i+1}.c'
-    
-    # Write the source code to a .c file
-    with open(filename, 'w') as file:
-        file.write(source_code)
+import io
+import os
+import re
+import glob
+import tarfile
+import argparse
+
+DATASET = "UKPLab/SLTrans"
+CONFIG = "C"
+COLUMN = 'Source_Code'
+
+
+def shard_range(start, end, shard, num_shards):
+    """Return the contiguous [start, end) sub-range of rows owned by shard i of N"""
+    size = end - start
+    return start + size * shard // num_shards, start + size * (shard + 1) // num_shards
+
+
+def iter_parquet_rows(paths, start, end):
+    """
+    Yield (row, source_code) for rows [start, end) of a local parquet
+    snapshot of one split, whose files are read in sorted order. Row groups
+    outside the range are skipped using the file metadata alone, and only
+    the source column is read.
+    """
+    import pyarrow.parquet
+
+    offset = 0
+    for path in paths:
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for group in range(parquet_file.num_row_groups):
+            num_rows = parquet_file.metadata.row_group(group).num_rows
+            if offset >= end:
+                return
+            if offset + num_rows > start:
+                column = parquet_file.read_row_group(group, columns=[COLUMN]).column(COLUMN)
+                low = max(start - offset, 0)
+                high = min(end - offset, num_rows)
+                for row, source_code in enumerate(column.slice(low, high - low).to_pylist(), offset + low):
+                    yield row, source_code
+            offset += num_rows
+
+
+def iter_hub_rows(split, start, end, batch_size=1000, streaming=False):
+    """
+    Yield (row, source_code) for rows [start, end) of a split of the
+    SLTrans C config.
+
+    By default the split is loaded from the local datasets cache (set
+    HF_DATASETS_OFFLINE=1 to work offline), which is memory-mapped Arrow,
+    and read in batches. With streaming=True nothing is downloaded up front
+    and rows before start are skipped on the fly.
+    """
+    from datasets import load_dataset
+
+    if streaming:
+        ds = load_dataset(DATASET, CONFIG, split=split, streaming=True)
+        ds = ds.select_columns([COLUMN]).skip(start).take(end - start)
+    else:
+        ds = load_dataset(DATASET, CONFIG, split=split).select_columns([COLUMN])
+        ds = ds.select(range(start, min(end, len(ds))))
+
+    row = start
+    for batch in ds.iter(batch_size=batch_size):
+        for source_code in batch[COLUMN]:
+            yield row, source_code
+            row += 1
+
+
+class DirectoryWriter:
+    """Write each source to its own file in output_dir"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, filename, text):
+        with open(os.path.join(self.output_dir, filename), 'w', buffering=1 << 16) as f:
+            f.write(text)
+
+    def close(self):
+        pass
+
+
+class ArchiveWriter:
+    """Write all sources as members of one tar archive (.tar, .tar.gz or .tar.xz)"""
+
+    def __init__(self, path):
+        mode = 'w'
+        if path.endswith(('.tar.gz', '.tgz')):
+            mode = 'w:gz'
+        elif path.endswith('.tar.xz'):
+            mode = 'w:xz'
+        self.tar = tarfile.open(path, mode, bufsize=1 << 20)
+
+    def write(self, filename, text):
+        data = text.encode()
+        info = tarfile.TarInfo(filename)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch a range of C sources from the SLTrans dataset")
+    # Choose the desired split (either 'Perf_Optimized' or 'Size_Optimized')
+    parser.add_argument('--split', default='Perf_Optimized', choices=['Perf_Optimized', 'Size_Optimized'])
+    parser.add_argument('--start', type=int, default=10001, help="first row (inclusive)")
+    parser.add_argument('--end', type=int, default=10100, help="last row (exclusive)")
+    parser.add_argument('--shard', default='0/1',
+                        help="i/N: only fetch the i-th of N equal parts of the range (default: 0/1)")
+    parser.add_argument('--parquet', default=None,
+                        help="local parquet snapshot of the split (a file or a directory of files)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="stream from the hub instead of using the local datasets cache")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--output-dir', default='.', help="where to write train<row>.c files")
+    parser.add_argument('--archive', default=None,
+                        help="write the files into this tar archive instead of --output-dir")
+    args = parser.parse_args()
+
+    match = re.fullmatch(r'(\d+)/(\d+)', args.shard)
+    if not match:
+        parser.error(f"--shard must be i/N, got {args.shard!r}")
+    shard, num_shards = int(match.group(1)), int(match.group(2))
+    if not 0 <= shard < num_shards:
+        parser.error(f"--shard {args.shard}: need N > 0 and 0 <= i < N")
+    if not 0 <= args.start < args.end:
+        parser.error(f"--start {args.start} / --end {args.end}: need 0 <= start < end")
+    if num_shards > args.end - args.start:
+        parser.error(f"--shard {args.shard}: {num_shards} shards don't fit in the "
+                     f"{args.end - args.start} rows of --start {args.start} --end {args.end}")
+    start, end = shard_range(args.start, args.end, shard, num_shards)
+
+    if args.parquet:
+        paths = sorted(glob.glob(os.path.join(args.parquet, '*.parquet'))) if os.path.isdir(args.parquet) else [args.parquet]
+        rows = iter_parquet_rows(paths, start, end)
+    else:
+        rows = iter_hub_rows(args.split, start, end, args.batch_size, args.streaming)
+
+    writer = ArchiveWriter(args.archive) if args.archive else DirectoryWriter(args.output_dir)
+    count = 0
+    try:
+        for row, source_code in rows:
+            # Files are named after the 1-based row number
+            writer.write(f'train{row + 1}.c', source_code)
+            count += 1
+    finally:
+        writer.close()
+    print(f"Wrote {count} files for rows {start}..{end} to {args.archive or args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-import re
+from demangle import Demangler, rewrite_symbol_sites
+from ir_index import IRIndex
+from metrics import Metrics
 
 def extract_function_definitions(input_file, output_file):
     """
@@ -6,63 +8,56 @@ def extract_function_definitions(input_file, output_file):
 
     :param input_file: Path to the input .ll file
     :param output_file: Path to the output .ll file with only function definitions
+    :return: The number of function definitions written
     """
-    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
-        inside_function = False  # Flag to indicate if we're inside a function
-        brace_count = 0  # Counter to track opening and closing braces
+    written = 0
+    with IRIndex.open(input_file) as index, open(output_file, 'wb') as outfile:
+        for name in index:
+            body = index.body(name)
+            outfile.write(body)
+            outfile.write(b'\n')
+            body.release()
+            written += 1
+    return written
 
-        for line in infile:
-            stripped_line = line.strip()
 
-            # Check for the start of a function definition
-            if stripped_line.startswith("define") and "{" in stripped_line:
-                inside_function = True
-                brace_count += stripped_line.count("{") - stripped_line.count("}")
-                outfile.write(line)  # Write the line containing "define"
-                continue
-
-            # If we're inside a function, write the lines and track braces
-            if inside_function:
-                brace_count += stripped_line.count("{") - stripped_line.count("}")
-                outfile.write(line)
-
-                # If brace_count reaches 0, the function definition ends
-                if brace_count == 0:
-                    inside_function = False
-
-
-def demangle_and_write(input_file, output_file):
+def demangle_and_write(input_file, output_file, demangler=None):
     """
     Demangles function names in a .ll file and writes the updated file to a new file.
 
+    Mangled Rust (legacy and v0) and C++ symbols at define, declare and call
+    sites are replaced by their unqualified item name, e.g.
+    `@_ZN9train48406main_017h472af9ca814a5c7dE(` becomes `@main_0(`.
+
     :param input_file: Path to the input .ll file
     :param output_file: Path to the output .ll file with demangled function names
+    :param demangler: Optional demangle.Demangler to reuse across files
     """
-    # Define the regex pattern for demangling
-    pattern = r"@_Z[A-Za-z\d]+(\d+[a-zA-Z0-9_]+)17h.*?\("
+    own_demangler = demangler is None
+    if own_demangler:
+        demangler = Demangler()
 
-    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
-        for line in infile:
-            # Search for mangled names in the line
-            match = re.search(pattern, line)
-            if match:
-                demangled_name = match.group(1)
-                # Remove the leading digits before the actual name
-                demangled_name = re.sub(r"^\d+", "", demangled_name)
-                # Replace the mangled name with the demangled name, preserving the parenthesis
-                line = re.sub(pattern, f"@{demangled_name}(", line)
-            outfile.write(line)
+    try:
+        with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
+            outfile.writelines(rewrite_symbol_sites(infile, demangler))
+    finally:
+        if own_demangler:
+            demangler.close()
 
 
 import os
 import glob
+import time
 
-def process_ll_files(directory_path):
+def process_ll_files(directory_path, metrics=None, metrics_path=None):
     """
     Process all .ll files in the specified directory.
     
     Args:
         directory_path (str): Path to the directory containing .ll files
+        metrics (metrics.Metrics): Collects stage times, counters and per-file
+            latency; per-file messages are printed only if it is verbose
+        metrics_path (str): Where to write the metrics as JSON at the end
     """
     # Get all .ll files in the directory
     ll_files = glob.glob(os.path.join(directory_path, "*.ll"))
@@ -71,31 +66,50 @@ def process_ll_files(directory_path):
         print(f"No .ll files found in {directory_path}")
         return
     
-    for input_ll in ll_files:
+    if metrics is None:
+        metrics = Metrics()
+    
+    # One demangler (and c++filt co-process) shared by every file
+    demangler = Demangler()
+    
+    for done, input_ll in enumerate(ll_files, 1):
+        start = time.perf_counter()
         try:
             # Create paths for temporary and output files
             base_name = os.path.basename(input_ll)
             extracted_ll = os.path.join(directory_path, f"temp_{base_name}")
             demangled_ll = os.path.join(directory_path, base_name)
             
-            print(f"\nProcessing: {base_name}")
+            metrics.trace(f"\nProcessing: {base_name}")
             
             # Extract function definitions
-            extract_function_definitions(input_ll, extracted_ll)
-            print(f"Function definitions extracted to {extracted_ll}")
+            with metrics.stage('extract_definitions'):
+                functions = extract_function_definitions(input_ll, extracted_ll)
+            metrics.count('functions', functions)
+            metrics.trace(f"Function definitions extracted to {extracted_ll}")
             
             # Demangle function names
-            demangle_and_write(extracted_ll, demangled_ll)
-            print(f"Demangled function names written to {demangled_ll}")
+            with metrics.stage('demangle'):
+                demangle_and_write(extracted_ll, demangled_ll, demangler)
+            metrics.trace(f"Demangled function names written to {demangled_ll}")
             
             # Clean up temporary file
             if os.path.exists(extracted_ll):
                 os.remove(extracted_ll)
-                print(f"Temporary file {extracted_ll} removed")
+                metrics.trace(f"Temporary file {extracted_ll} removed")
+            metrics.count('files')
                 
         except Exception as e:
             print(f"Error processing {base_name}: {str(e)}")
+            metrics.count('errors')
             continue
+        finally:
+            metrics.observe('file_seconds', time.perf_counter() - start)
+            metrics.progress(done, len(ll_files))
+    
+    demangler.close()
+    if metrics_path:
+        metrics.write(metrics_path)
 
 if __name__ == "__main__":
     # Directory containing .ll files
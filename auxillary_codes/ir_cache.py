@@ -0,0 +1,115 @@
+import os
+import hashlib
+import threading
+import subprocess
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    """
+    Return the `<tool> --version` banner, or an empty string if the tool
+    cannot be run. Looked up once per process.
+    """
+    try:
+        result = subprocess.run([tool, '--version'], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, check=False)
+        return result.stdout.decode(errors='replace')
+    except OSError:
+        return ''
+
+
+def cache_key(source_bytes, *commands):
+    """
+    Build a content-addressed cache key from the source text, the full
+    command lines used to compile it and the versions of the tools they run.
+
+    Only the main source file is hashed; SLTrans programs are self-contained,
+    so headers outside the system include path are not tracked.
+    """
+    digest = hashlib.sha256()
+    digest.update(source_bytes)
+    for command in commands:
+        digest.update(b'\0cmd\0' + '\0'.join(command).encode())
+        digest.update(b'\0ver\0' + tool_version(command[0]).encode())
+    return digest.hexdigest()
+
+
+class IRCache:
+    """
+    On-disk cache of compiler output keyed by cache_key().
+
+    Entries live in `<cache_dir>/<key[:2]>/<key>` and are written atomically,
+    so several worker processes can share one cache directory. A hit bumps
+    the entry's mtime; once the cache grows past `max_bytes` the least
+    recently used entries are evicted down to `low_water` of it, so the
+    scan over the cache runs once per that much new output rather than on
+    every put of a full cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1 << 30, low_water=0.9):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _entries(self):
+        """Yield (path, mtime, size) for every entry in the cache"""
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                yield entry.path, st.st_mtime, st.st_size
+
+    def get(self, key, binary=False):
+        """Return the cached text (bytes if binary) for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb' if binary else 'r') as f:
+                text = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return text
+
+    def put(self, key, text):
+        """Store text (or bytes) under key, evicting old entries if the cache is full"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per process and thread, so concurrent writers of one key never share a temp file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits low_water * max_bytes"""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * self.low_water
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.stats['evictions'] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
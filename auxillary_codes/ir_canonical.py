@@ -0,0 +1,149 @@
+import re
+import sqlite3
+import hashlib
+
+from demangle import strip_legacy_crate
+
+# Local value and label names, quoted or bare
+_LOCAL = re.compile(r'%("(?:[^"\\]|\\.)*"|[-\w$.]+)')
+_LABEL_DEF = re.compile(r'^("(?:[^"\\]|\\.)*"|[-\w$.]+):')
+_VALUE_DEF = re.compile(r'^\s*%("(?:[^"\\]|\\.)*"|[-\w$.]+)\s*=')
+# Trailing `; ...` comments (outside string constants), metadata attachments
+# and attribute group references
+_COMMENT = re.compile(r'\s*;[^"\n]*$')
+_METADATA_ATTACHMENT = re.compile(r',?\s*!(?:[A-Za-z_][-\w.]*)\s+!(?:\d+|\{[^}]*\})')
+_ATTRIBUTE_REF = re.compile(r'\s#\d+\b')
+# Parts of Rust symbols that depend on the crate rather than the code
+_MANGLED = re.compile(r'_ZN\d[\w$.]*')
+_LEGACY_HASH = re.compile(r'17h[0-9a-f]{16}E')
+_ANON_GLOBAL = re.compile(r'@anon\.[0-9a-f]+\.')
+
+
+def _parameter_names(header):
+    """Local names declared in a define line's parameter list"""
+    start = header.find('(', header.find('@'))
+    depth = 0
+    for end in range(start, len(header)):
+        if header[end] == '(':
+            depth += 1
+        elif header[end] == ')':
+            depth -= 1
+            if depth == 0:
+                break
+    return [m.group(1) for m in _LOCAL.finditer(header, start, end)]
+
+
+def _strip_crate(text, crate):
+    def rename(match):
+        return _LEGACY_HASH.sub('E', strip_legacy_crate(match.group(0), crate))
+    return _ANON_GLOBAL.sub('@anon.', _MANGLED.sub(rename, text))
+
+
+def strip_annotations(line):
+    """Drop a trailing comment, metadata attachments and attribute group refs from an IR line"""
+    line = _COMMENT.sub('', line)
+    line = _METADATA_ATTACHMENT.sub('', line)
+    return _ATTRIBUTE_REF.sub('', line).rstrip()
+
+
+def canonicalize_ir(function_text, crate=None):
+    """
+    Return a canonical form of one IR function definition: comments,
+    metadata attachments and attribute group refs (`#0`) are dropped, and
+    parameters, values and block labels (including the entry block) are
+    renamed `%v0`, `%v1`, ... in order of definition. Two functions that
+    differ only in value numbering, label names, attribute groups or
+    metadata get the same text.
+
+    For Rust IR, pass the crate name: symbols are then rewritten without the
+    crate and without their hashes, so the same function from two crates
+    (e.g. `train7` and `train9`) compares equal.
+    """
+    if crate:
+        function_text = _strip_crate(function_text, crate)
+    lines = [line for line in map(strip_annotations, function_text.split('\n')) if line]
+    if not lines:
+        return ''
+
+    names = {}
+
+    def define(name):
+        if name not in names:
+            names[name] = f"v{len(names)}"
+
+    parameters = _parameter_names(lines[0])
+    for name in parameters:
+        define(name)
+    if len(lines) > 1 and not _LABEL_DEF.match(lines[1]):
+        # Give an unnamed entry block the number LLVM implicitly assigns it
+        lines.insert(1, f"{sum(1 for name in parameters if name.isdigit())}:")
+    for line in lines[1:]:
+        match = _VALUE_DEF.match(line) or _LABEL_DEF.match(line)
+        if match:
+            define(match.group(1))
+
+    def rename_local(match):
+        name = names.get(match.group(1))
+        return f"%{name}" if name else match.group(0)
+
+    def rename_label(match):
+        return f"{names[match.group(1)]}:"
+
+    canonical = [_LOCAL.sub(rename_local, lines[0])]
+    for line in lines[1:]:
+        line = _LABEL_DEF.sub(rename_label, line) if _LABEL_DEF.match(line) else line
+        canonical.append(_LOCAL.sub(rename_local, line))
+    return '\n'.join(canonical) + '\n'
+
+
+def canonical_hash(function_text, crate=None):
+    """Stable hex digest of canonicalize_ir(function_text, crate)"""
+    return hashlib.sha256(canonicalize_ir(function_text, crate).encode()).hexdigest()
+
+
+class SeenHashes:
+    """
+    On-disk set of hashes, for dropping exact duplicates across files and
+    runs while streaming. add() returns True only the first time a hash is
+    seen.
+
+    Additions are committed every commit_every new hashes, or only by
+    commit() and close() if commit_every is None, for callers that commit
+    once the records behind the hashes are on disk.
+    """
+
+    def __init__(self, path, commit_every=1000):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen (hash TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.commit_every = commit_every
+        self._pending = 0
+
+    def add(self, digest):
+        cursor = self.db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (digest,))
+        if cursor.rowcount == 0:
+            return False
+        self._pending += 1
+        if self.commit_every is not None and self._pending >= self.commit_every:
+            self.commit()
+        return True
+
+    def commit(self):
+        self.db.commit()
+        self._pending = 0
+
+    def __contains__(self, digest):
+        return self.db.execute("SELECT 1 FROM seen WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,137 @@
+import re
+import mmap
+from collections import namedtuple
+
+# A function definition inside an indexed module. offset/length cover the
+# text from "define" up to and including the closing "}".
+IRFunction = namedtuple('IRFunction', ['name', 'offset', 'length', 'linkage', 'attributes'])
+
+LINKAGE_TYPES = {
+    'private', 'internal', 'available_externally', 'linkonce', 'weak',
+    'common', 'appending', 'extern_weak', 'linkonce_odr', 'weak_odr', 'external',
+}
+
+_DEFINE = re.compile(rb'^define[ \t][^\n]*', re.M)
+_FUNCTION_END = re.compile(rb'^\}[ \t]*\r?$', re.M)
+_SYMBOL = re.compile(rb'@(?:"((?:[^"\\]|\\.)*)"|([-\w$.]+))')
+_ATTRIBUTE_REF = re.compile(rb'#(\d+)')
+
+
+def parse_define_header(header):
+    """
+    Parse a `define ...` line into (name, linkage, attribute group refs).
+
+    Returns None if no symbol name can be found on the line.
+    """
+    match = _SYMBOL.search(header)
+    if not match:
+        return None
+    name = (match.group(1) if match.group(1) is not None else match.group(2)).decode()
+
+    linkage = 'external'
+    for token in header[len(b'define'):match.start()].split():
+        token = token.decode()
+        if token in LINKAGE_TYPES:
+            linkage = token
+            break
+
+    # Function attribute groups follow the parameter list
+    params_end = header.rfind(b')')
+    attributes = ()
+    if params_end > match.end():
+        attributes = tuple(int(ref) for ref in _ATTRIBUTE_REF.findall(header, params_end + 1))
+    return name, linkage, attributes
+
+
+class IRIndex:
+    """
+    Function index over a textual LLVM IR module, built in one pass.
+
+    The module is held as a single buffer (a read-only mmap when opened from
+    a file) and the index only stores offsets into it, so function bodies are
+    sliced out lazily. `body()` returns a zero-copy memoryview; `text()`
+    decodes just that function.
+
+    Iterating an index yields symbol names in module order.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.functions = {}
+        self._mmap = None
+        self._file = None
+        self._build()
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map the .ll file at path and index it"""
+        f = open(path, 'rb')
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            buffer = b''  # empty files cannot be mapped
+        index = cls(buffer)
+        index._file = f
+        if isinstance(buffer, mmap.mmap):
+            index._mmap = buffer
+        return index
+
+    @classmethod
+    def from_text(cls, text):
+        """Index IR held in a str (e.g. read from a pipe)"""
+        return cls(text.encode())
+
+    def _build(self):
+        buffer = self.buffer
+        pos = 0
+        while True:
+            define = _DEFINE.search(buffer, pos)
+            if not define:
+                break
+            end = _FUNCTION_END.search(buffer, define.end())
+            if not end:
+                break
+            parsed = parse_define_header(define.group(0))
+            if parsed:
+                name, linkage, attributes = parsed
+                offset = define.start()
+                length = end.start() + 1 - offset
+                self.functions[name] = IRFunction(name, offset, length, linkage, attributes)
+            pos = end.end()
+
+    def __iter__(self):
+        return iter(self.functions)
+
+    def __len__(self):
+        return len(self.functions)
+
+    def __contains__(self, name):
+        return name in self.functions
+
+    def body(self, name):
+        """Return the bytes of function `name` as a memoryview into the module"""
+        function = self.functions[name]
+        return memoryview(self.buffer)[function.offset:function.offset + function.length]
+
+    def text(self, name):
+        """Return the text of function `name`"""
+        function = self.functions[name]
+        return self.buffer[function.offset:function.offset + function.length].decode()
+
+    def close(self):
+        """
+        Release the mapping. Any memoryview returned by body() must be
+        released first.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,106 @@
+import re
+import argparse
+import subprocess
+
+from ir_canonical import canonicalize_ir, strip_annotations
+from ir_index import IRIndex
+from token_counts import get_tokenizer
+
+# Named minification levels, from no change to smallest
+LEVELS = ('none', 'light', 'aggressive')
+
+# Attributes and markers that only guide the optimizer or the ABI
+_OPTIMIZER_HINTS = re.compile(
+    r'(?<![-%@\w$.])(?:dso_local|dso_preemptable|local_unnamed_addr|unnamed_addr|noundef|nonnull|noalias|'
+    r'nocapture|readonly|writeonly|readnone|nofree|nosync|nounwind|willreturn|mustprogress|'
+    r'returned|immarg|noinline|optnone|tail|'
+    r'dereferenceable(?:_or_null)?\(\d+\)|captures\([^)]*\)|range\([^)]*\)|align \d+) ')
+_ALIGNMENT = re.compile(r', align \d+')
+
+
+def minify_ir(function_text, level='light'):
+    """
+    Shrink the text of one IR function definition.
+
+    'light' drops comments, metadata attachments (`!tbaa`, `!llvm.loop`,
+    ...), attribute group refs (`#0`) and blank lines; the instructions are
+    untouched. 'aggressive' additionally renames values and labels to
+    `%v0`, `%v1`, ... (see ir_canonical.canonicalize_ir) and drops optimizer
+    and ABI hints (`dso_local`, `noundef`, `tail`, alignments, ...), so the
+    function still parses but is no longer equivalent for code generation.
+    """
+    if level == 'none':
+        return function_text
+    if level == 'light':
+        text = '\n'.join(line for line in map(strip_annotations, function_text.split('\n')) if line)
+    elif level == 'aggressive':
+        text = _ALIGNMENT.sub('', _OPTIMIZER_HINTS.sub('', canonicalize_ir(function_text)))
+    else:
+        raise ValueError(f"Unknown IR minification level {level!r}, expected one of {LEVELS}")
+    # Keep the caller's convention for a trailing newline
+    return text.rstrip('\n') + ('\n' if function_text.endswith('\n') else '')
+
+
+def minify_module(module_text, level='light'):
+    """Minify every function definition of a module, leaving everything else as is"""
+    out = []
+    function = None
+    for line in module_text.split('\n'):
+        if function is not None:
+            function.append(line)
+            if line.rstrip() == '}':
+                out.append(minify_ir('\n'.join(function), level).rstrip('\n'))
+                function = None
+        elif line.startswith('define'):
+            function = [line]
+        else:
+            out.append(line)
+    return '\n'.join(out)
+
+
+def check_parses(module_text, llvm_as='llvm-as'):
+    """Assemble module_text with llvm-as; returns its error message, or None if it parses"""
+    completed = subprocess.run([llvm_as, '-o', '/dev/null', '-'], input=module_text.encode(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        return completed.stderr.decode(errors='replace').strip()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report IR token reduction per minification level")
+    parser.add_argument('ll_files', nargs='+', help=".ll modules to measure")
+    parser.add_argument('--levels', default='light,aggressive', help="comma-separated levels to compare")
+    parser.add_argument('--tokenizer', default='regex', help="see token_counts.get_tokenizer")
+    parser.add_argument('--check', action='store_true', help="confirm each minified module parses with llvm-as")
+    args = parser.parse_args()
+
+    tokenizer = get_tokenizer(args.tokenizer)
+    modules = []
+    functions = []
+    for path in args.ll_files:
+        with open(path) as f:
+            modules.append(f.read())
+        with IRIndex.open(path) as index:
+            functions.extend(index.text(name) for name in index)
+    if not functions:
+        print("No function definitions found")
+        return
+    baseline = tokenizer.lengths(functions)
+    print(f"{'none':>12}: {sum(baseline) / len(functions):8.1f} tokens/function over {len(functions)} functions")
+
+    for level in args.levels.split(','):
+        lengths = tokenizer.lengths([minify_ir(text, level) for text in functions])
+        reduction = sum(1 - n / b for n, b in zip(lengths, baseline) if b) / len(functions)
+        line = f"{level:>12}: {sum(lengths) / len(functions):8.1f} tokens/function, {reduction:6.1%} average reduction"
+        if args.check:
+            # Functions only parse in the context of their module's globals and declarations
+            errors = [(path, check_parses(minify_module(text, level))) for path, text in zip(args.ll_files, modules)]
+            failures = [(path, error) for path, error in errors if error]
+            line += f", {len(modules) - len(failures)}/{len(modules)} modules parse"
+            for path, error in failures[:5]:
+                line += f"\n  {path}: {error.splitlines()[0]}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
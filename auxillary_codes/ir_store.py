@@ -0,0 +1,280 @@
+import os
+import gzip
+import hashlib
+import sqlite3
+import tempfile
+import argparse
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ir_index import IRIndex
+
+
+def _compressor():
+    """(codec, compress) with zstandard if installed, gzip otherwise"""
+    try:
+        import zstandard
+    except ImportError:
+        return 'gz', lambda data: gzip.compress(data, compresslevel=6)
+    return 'zst', zstandard.ZstdCompressor(level=10).compress
+
+
+def _decompress(codec, data):
+    if codec == 'zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("module is zstd-compressed; install `zstandard` to read it") from None
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def _run(command, data):
+    completed = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise subprocess.CalledProcessError(completed.returncode, command, stderr=completed.stderr)
+    return completed.stdout
+
+
+class IRStore:
+    """
+    IR modules kept at rest as compressed bitcode, with a SQLite index of
+    the functions each module defines. Payloads live in the same SQLite
+    file: one file for the whole corpus instead of a mostly-empty disk
+    block per small module.
+
+    add() assembles a textual module with llvm-as, compresses it (zstd if
+    `zstandard` is installed, gzip otherwise) and records its symbols.
+    Modules llvm-as rejects (e.g. IR newer than the installed LLVM), or
+    small enough that compressed text beats compressed bitcode, are kept as
+    compressed text instead. Text is only produced again on demand:
+    index(module) disassembles the module with llvm-dis into an IRIndex,
+    and function() returns one definition from it. Disassembled modules are
+    kept in an LRU bounded by cache_bytes of text.
+    """
+
+    def __init__(self, root, cache_bytes=64 << 20, llvm_as='llvm-as', llvm_dis='llvm-dis'):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self.llvm_as = llvm_as
+        self.llvm_dis = llvm_dis
+        self.stats = {'hits': 0, 'misses': 0}
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, 'store.sqlite'), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS modules (name TEXT PRIMARY KEY, format TEXT, codec TEXT, "
+                        "sha256 TEXT, text_bytes INTEGER, stored_bytes INTEGER, payload BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS symbols (symbol TEXT, module TEXT, "
+                        "PRIMARY KEY (symbol, module)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS symbols_by_module ON symbols (module)")
+
+    def encode(self, text):
+        """
+        Assemble and compress one module without touching the database;
+        returns (format, codec, sha256 of the text, text bytes, compressed
+        payload, defined symbols). Safe to run from several threads.
+        """
+        data = text.encode() if isinstance(text, str) else text
+        codec, compress = _compressor()
+        payload, fmt = compress(data), 'll'
+        try:
+            bitcode = compress(_run([self.llvm_as, '-o', '-', '-'], data))
+        except (OSError, subprocess.CalledProcessError):
+            bitcode = None
+        # Bitcode's fixed overhead loses to compressed text on tiny modules
+        if bitcode is not None and len(bitcode) < len(payload):
+            payload, fmt = bitcode, 'bc'
+        return (fmt, codec, hashlib.sha256(data).hexdigest(), len(data), payload,
+                list(IRIndex.from_text(data.decode(errors='replace'))))
+
+    def _record(self, name, fmt, codec, sha256, text_bytes, payload, symbols):
+        self.db.execute("INSERT OR REPLACE INTO modules VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (name, fmt, codec, sha256, text_bytes, len(payload), payload))
+        self.db.execute("DELETE FROM symbols WHERE module = ?", (name,))
+        self.db.executemany("INSERT OR IGNORE INTO symbols VALUES (?, ?)", [(symbol, name) for symbol in symbols])
+        self._forget(name)
+
+    def add(self, name, text):
+        """Store module text (str or bytes) under name, replacing any earlier version"""
+        self._record(name, *self.encode(text))
+        self.db.commit()
+
+    def add_files(self, paths, jobs=None):
+        """
+        Store .ll files, named after their stems, assembling them in
+        parallel. Returns {format: count}.
+        """
+        def encode(path):
+            with open(path, 'rb') as f:
+                name = os.path.splitext(os.path.basename(path))[0]
+                return name, self.encode(f.read())
+
+        formats = {}
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+            for name, encoded in executor.map(encode, paths):
+                self._record(name, *encoded)
+                formats[encoded[0]] = formats.get(encoded[0], 0) + 1
+        self.db.commit()
+        return formats
+
+    def modules(self):
+        return [row[0] for row in self.db.execute("SELECT name FROM modules ORDER BY name")]
+
+    def __contains__(self, name):
+        return self.db.execute("SELECT 1 FROM modules WHERE name = ?", (name,)).fetchone() is not None
+
+    def digest(self, name):
+        """sha256 hex digest of the module text as it was added"""
+        row = self.db.execute("SELECT sha256 FROM modules WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def symbols(self, module):
+        """Functions defined by module, without disassembling it"""
+        return [row[0] for row in self.db.execute("SELECT symbol FROM symbols WHERE module = ? ORDER BY symbol",
+                                                  (module,))]
+
+    def find(self, symbol):
+        """Modules that define symbol"""
+        return [row[0] for row in self.db.execute("SELECT module FROM symbols WHERE symbol = ?", (symbol,))]
+
+    def module_texts(self, names):
+        """
+        {name: textual IR} for several modules. Bitcode modules go through
+        a single llvm-dis run, whose startup costs more than disassembling
+        a typical module.
+        """
+        texts = {}
+        bitcode = []
+        for name in dict.fromkeys(names):
+            row = self.db.execute("SELECT format, codec, payload FROM modules WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            payload = _decompress(row[1], row[2])
+            if row[0] == 'bc':
+                bitcode.append((name, payload))
+            else:
+                texts[name] = payload.decode()
+        if bitcode:
+            with tempfile.TemporaryDirectory(prefix='ir_store_') as tmp:
+                # Named after the modules, which llvm-dis records as the ModuleID
+                paths = [os.path.join(tmp, f"{name}.bc") for name, _ in bitcode]
+                for path, (_, payload) in zip(paths, bitcode):
+                    with open(path, 'wb') as f:
+                        f.write(payload)
+                subprocess.run([self.llvm_dis] + paths, check=True, stderr=subprocess.PIPE)
+                for path, (name, _) in zip(paths, bitcode):
+                    with open(path[:-3] + '.ll') as f:
+                        texts[name] = f.read()
+        return texts
+
+    def module_text(self, name):
+        """The textual IR of a module (llvm-dis output for bitcode modules)"""
+        return self.module_texts([name])[name]
+
+    def _forget(self, name):
+        entry = self._cache.pop(name, None)
+        if entry is not None:
+            self._cached_bytes -= entry[1]
+
+    def _remember(self, name, text):
+        index = IRIndex.from_text(text)
+        self._forget(name)
+        self._cache[name] = (index, len(text))
+        self._cached_bytes += len(text)
+        while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+            _, (_, size) = self._cache.popitem(last=False)
+            self._cached_bytes -= size
+        return index
+
+    def index(self, name):
+        """An IRIndex over the module's text, disassembled on first use and kept in the LRU"""
+        entry = self._cache.get(name)
+        if entry is not None:
+            self._cache.move_to_end(name)
+            self.stats['hits'] += 1
+            return entry[0]
+        self.stats['misses'] += 1
+        return self._remember(name, self.module_text(name))
+
+    def prefetch(self, names, batch=256):
+        """
+        Disassemble the named modules that aren't cached, batch at a time,
+        ahead of a pass over their functions. Only useful while the modules
+        fit in cache_bytes; later ones evict earlier ones otherwise.
+        """
+        missing = [name for name in dict.fromkeys(names) if name not in self._cache]
+        for start in range(0, len(missing), batch):
+            for name, text in self.module_texts(missing[start:start + batch]).items():
+                self.stats['misses'] += 1
+                self._remember(name, text)
+
+    def function(self, module, symbol):
+        """The textual definition of symbol in module"""
+        return self.index(module).text(symbol)
+
+    def footprint(self):
+        """(modules, total text bytes, total stored bytes)"""
+        return self.db.execute("SELECT COUNT(*), COALESCE(SUM(text_bytes), 0), COALESCE(SUM(stored_bytes), 0) "
+                               "FROM modules").fetchone()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep IR modules as compressed bitcode with a symbol index")
+    parser.add_argument('root', help="store directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="store .ll files (named after their stems)")
+    add.add_argument('ll_files', nargs='+', help=".ll files or directories of them")
+    add.add_argument('--jobs', '-j', type=int, default=None)
+    add.add_argument('--remove', action='store_true', help="delete each .ll once it is stored")
+    show = commands.add_parser('show', help="print a module, or one function of it")
+    show.add_argument('module')
+    show.add_argument('symbol', nargs='?')
+    find = commands.add_parser('find', help="list the modules defining a symbol")
+    find.add_argument('symbol')
+    commands.add_parser('stats', help="print the store's size against the text it holds")
+    args = parser.parse_args()
+
+    with IRStore(args.root) as store:
+        if args.command == 'add':
+            paths = []
+            for path in args.ll_files:
+                if os.path.isdir(path):
+                    paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.ll')))
+                else:
+                    paths.append(path)
+            formats = store.add_files(paths, args.jobs)
+            if args.remove:
+                for path in paths:
+                    os.remove(path)
+            print(f"Stored {len(paths)} modules: {formats.get('bc', 0)} as bitcode, "
+                  f"{formats.get('ll', 0)} as text")
+        elif args.command == 'show':
+            if args.symbol:
+                print(store.function(args.module, args.symbol))
+            else:
+                print(store.module_text(args.module), end='')
+        elif args.command == 'find':
+            for module in store.find(args.symbol):
+                print(module)
+        else:
+            count, text_bytes, stored_bytes = store.footprint()
+            ratio = text_bytes / stored_bytes if stored_bytes else 0
+            print(f"{count} modules, {text_bytes / 1e6:.1f} MB of text stored in {stored_bytes / 1e6:.1f} MB ({ratio:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
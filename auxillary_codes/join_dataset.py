@@ -0,0 +1,239 @@
+import os
+import json
+import heapq
+import argparse
+from itertools import groupby
+
+from dataset_sink import iter_shard_records, shard_format, source_order
+from extract_c_fn import iter_c_function_spans
+
+# c2rust turns C's main into `main_0` plus a `main` wrapper; both pair with C's main
+_RUST_MAIN_PARTS = ('main', 'main_0')
+
+
+def _c_file_key(stem):
+    """`train12_3` -> ('train12', 3) for the per-function files of extract_c_fn.py"""
+    source, _, number = stem.rpartition('_')
+    if not source or not number.isdigit():
+        return None
+    return source, int(number)
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def iter_c_files(directory):
+    """
+    Yield (source, function, code, ir) for the per-function `.c`/`.ll`
+    files written by extract_c_fn.py, in source_order. Function names
+    are recovered from the code itself.
+    """
+    keys = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.c'):
+                key = _c_file_key(entry.name[:-2])
+                if key:
+                    keys.append(key)
+    keys.sort(key=lambda key: (source_order(key[0]), key[1]))
+
+    for source, number in keys:
+        base = os.path.join(directory, f"{source}_{number}")
+        code = _read(base + '.c')
+        span = next(iter_c_function_spans(code), None)
+        if span is None:
+            continue
+        yield source, span[0], code, _read(base + '.ll')
+
+
+def iter_rust_files(directory):
+    """
+    Yield (source, function, code, ir) for the per-function `.rs`/`.ll`
+    files written by test_fetch_rs_ll_pairs.py next to their source, in
+    source_order. Source ids (`train7`) must not contain '_'; the function
+    name is the sanitized file name suffix.
+    """
+    stems = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.rs'):
+                stems.add(entry.name[:-3])
+
+    # `train7_Point_new.rs` -> ('train7', 'Point_new'); the original `train7.rs` has no suffix
+    keys = sorted((tuple(stem.split('_', 1)) for stem in stems if '_' in stem),
+                  key=lambda key: (source_order(key[0]), key[1]))
+
+    for source, function in keys:
+        base = os.path.join(directory, f"{source}_{function}")
+        yield source, function, _read(base + '.rs'), _read(base + '.ll')
+
+
+def _source_id(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def iter_shards(paths):
+    """
+    Yield (source, function, code, ir) from ShardedSink shards, in
+    source_order.
+
+    Each shard is already in source order (the extractors process files in
+    sorted order), so the shards are merged lazily, one open reader per
+    shard. For a source that appears in several runs, records from later
+    shards come last and so win.
+    """
+    def shard_stream(index, path):
+        previous = None
+        for record in iter_shard_records(path):
+            source = _source_id(record['source'])
+            order = source_order(source)
+            if previous is not None and order < previous:
+                raise ValueError(f"{path} is not sorted by source ({source} after {previous[1]})")
+            previous = order
+            yield order, index, record['function'], record['code'], record.get('ir')
+
+    streams = [shard_stream(index, path) for index, path in enumerate(sorted(paths))]
+    for order, _, function, code, ir in heapq.merge(*streams, key=lambda item: (item[0], item[1])):
+        yield order[1], function, code, ir
+
+
+def open_side(path):
+    """
+    Return the (source, function, code, ir) stream for a C or Rust input:
+    a shard file, a directory of shards, or a directory in the
+    per-function file layout.
+    """
+    if os.path.isfile(path):
+        return iter_shards([path])
+    shards = [os.path.join(path, name) for name in os.listdir(path) if shard_format(name)]
+    if shards:
+        return iter_shards(shards)
+    if any(name.endswith('.rs') for name in os.listdir(path)):
+        return iter_rust_files(path)
+    return iter_c_files(path)
+
+
+def _group_by_source(stream, merge_main=False):
+    """Yield (source, {function: (code, ir)}) with one group per source id"""
+    for source, items in groupby(stream, key=lambda item: item[0]):
+        functions = {}
+        for _, function, code, ir in items:
+            functions[function] = (code, ir)
+        if merge_main and 'main_0' in functions:
+            parts = [functions.pop(name) for name in _RUST_MAIN_PARTS if name in functions]
+            functions['main'] = (''.join(code or '' for code, _ in parts),
+                                 ''.join(ir or '' for _, ir in parts) or None)
+        yield source, functions
+
+
+class JSONLWriter:
+    """Write one JSON record per line"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        pass
+
+
+class JSONArrayWriter:
+    """Stream records as a single JSON array, as used for training"""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+        self.f.write('[')
+
+    def write(self, record):
+        self.f.write(',\n  ' if self.count else '\n  ')
+        self.f.write(json.dumps(record))
+        self.count += 1
+
+    def close(self):
+        self.f.write('\n]\n' if self.count else ']\n')
+
+
+def join(c_stream, rust_stream, writer, keep_keys=False):
+    """
+    Sorted-merge the C and Rust streams on (source id in source_order,
+    function name) and write a {c_code, c_ir, rust_code, rust_ir} record
+    for every function present on both sides with IR on both sides.
+
+    Only one source's functions per side are held in memory at a time.
+    Returns counts of joined records and of what was left unmatched.
+    """
+    counts = {'joined': 0, 'c_only': 0, 'rust_only': 0, 'c_without_ir': 0, 'rust_without_ir': 0,
+              'c_only_sources': 0, 'rust_only_sources': 0}
+    c_groups = _group_by_source(c_stream)
+    rust_groups = _group_by_source(rust_stream, merge_main=True)
+    c_group = next(c_groups, None)
+    rust_group = next(rust_groups, None)
+
+    while c_group is not None or rust_group is not None:
+        if rust_group is None or c_group is not None and source_order(c_group[0]) < source_order(rust_group[0]):
+            counts['c_only_sources'] += 1
+            counts['c_only'] += len(c_group[1])
+            c_group = next(c_groups, None)
+            continue
+        if c_group is None or source_order(rust_group[0]) < source_order(c_group[0]):
+            counts['rust_only_sources'] += 1
+            counts['rust_only'] += len(rust_group[1])
+            rust_group = next(rust_groups, None)
+            continue
+
+        source, c_functions = c_group
+        rust_functions = rust_group[1]
+        for function, (c_code, c_ir) in c_functions.items():
+            if function not in rust_functions:
+                counts['c_only'] += 1
+                continue
+            rust_code, rust_ir = rust_functions[function]
+            if not c_ir:
+                counts['c_without_ir'] += 1
+            elif not rust_ir:
+                counts['rust_without_ir'] += 1
+            else:
+                record = {'c_code': c_code, 'c_ir': c_ir, 'rust_code': rust_code, 'rust_ir': rust_ir}
+                if keep_keys:
+                    record = {'source': source, 'function': function, **record}
+                writer.write(record)
+                counts['joined'] += 1
+        counts['rust_only'] += sum(1 for function in rust_functions if function not in c_functions)
+        c_group = next(c_groups, None)
+        rust_group = next(rust_groups, None)
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Join C and Rust functions and their IR into {c_code, c_ir, rust_code, rust_ir} records")
+    parser.add_argument('c_input', help="extract_c_fn.py output: per-function files or shards")
+    parser.add_argument('rust_input', help="test_fetch_rs_ll_pairs.py output: per-function files or shards")
+    parser.add_argument('output', help="output file")
+    parser.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                        help="a single JSON array (default) or one record per line")
+    parser.add_argument('--keep-keys', action='store_true',
+                        help="also write each record's source id and function name")
+    args = parser.parse_args()
+
+    with open(args.output, 'w', buffering=1 << 20) as f:
+        writer = JSONArrayWriter(f) if args.format == 'json' else JSONLWriter(f)
+        counts = join(open_side(args.c_input), open_side(args.rust_input), writer, args.keep_keys)
+        writer.close()
+
+    print(f"Joined {counts['joined']} functions into {args.output}")
+    print(f"Unmatched: {counts['c_only']} C-only functions ({counts['c_only_sources']} sources), "
+          f"{counts['rust_only']} Rust-only functions ({counts['rust_only_sources']} sources), "
+          f"{counts['c_without_ir']} without C IR, {counts['rust_without_ir']} without Rust IR")
+
+
+if __name__ == "__main__":
+    main()
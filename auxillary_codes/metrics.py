@@ -0,0 +1,165 @@
+import sys
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Fixed-bucket histogram that can be merged across processes"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the open bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def merge(self, data):
+        for i, n in enumerate(data['counts']):
+            self.counts[i] += n
+        self.count += data['count']
+        self.sum += data['sum']
+        for key, pick in (('min', min), ('max', max)):
+            if data[key] is not None:
+                mine = getattr(self, key)
+                setattr(self, key, data[key] if mine is None else pick(mine, data[key]))
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'bounds': list(self.bounds), 'counts': self.counts}
+
+
+class Metrics:
+    """
+    Per-run instrumentation: stage timers, counters and latency histograms,
+    a throttled progress line and opt-in verbose tracing.
+
+    Per-item messages go through trace(), which prints only when verbose, so
+    a normal run writes a progress line at most every progress_interval
+    seconds instead of a line per artifact. Worker processes fill their own
+    Metrics and the parent merge()s their to_dict() snapshots; write() saves
+    the totals as JSON at the end of a run. Updates are thread-safe.
+    """
+
+    def __init__(self, verbose=False, progress_interval=1.0, stream=None):
+        self.verbose = verbose
+        self.progress_interval = progress_interval
+        self.stream = stream
+        self.counters = {}
+        self.stages = {}
+        self.histograms = {}
+        self.started = time.perf_counter()
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    def _out(self):
+        return self.stream if self.stream is not None else sys.stderr
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block under stage name (total seconds and calls)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += calls
+
+    def trace(self, message):
+        if self.verbose:
+            print(message, file=self._out())
+
+    def progress(self, done, total=None, label='files'):
+        """Report done/total, at most once per progress_interval (and always at the end)"""
+        now = time.perf_counter()
+        finished = total is not None and done >= total
+        with self._lock:
+            if not finished and now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f"{done}/{total} {label}" if total is not None else f"{done} {label}"
+        line += f" ({rate:.1f}/s"
+        if total is not None and rate and not finished:
+            line += f", ~{(total - done) / rate:.0f}s left"
+        line += ")"
+        out = self._out()
+        # Rewrite one line on a terminal; otherwise append throttled lines to the log
+        if out.isatty() and not self.verbose:
+            out.write('\r' + line + ('\n' if finished else ''))
+        else:
+            out.write(line + '\n')
+        out.flush()
+
+    def merge(self, data):
+        """Add a to_dict() snapshot (e.g. from a worker process) into these metrics"""
+        for name, n in data['counters'].items():
+            self.count(name, n)
+        for name, stage in data['stages'].items():
+            self.add_time(name, stage['seconds'], stage['calls'])
+        with self._lock:
+            for name, histogram in data['histograms'].items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram(histogram['bounds'])
+                self.histograms[name].merge(histogram)
+
+    def to_dict(self):
+        return {'elapsed_seconds': time.perf_counter() - self.started,
+                'counters': dict(self.counters),
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'histograms': {name: h.to_dict() for name, h in self.histograms.items()}}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def summary(self):
+        """A few lines with the counters and where the time went"""
+        lines = [', '.join(f"{name}: {n}" for name, n in sorted(self.counters.items()))]
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"  {name:>20}: {stage['seconds']:9.2f}s over {stage['calls']} calls")
+        return '\n'.join(lines)
@@ -1,24 +1,42 @@
 import os
-import shutil
+import argparse
 
-def move_split_files(source_dir, target_dir):
-    # Create the target directory if it doesn't exist
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
+from dataset_subset import materialize, split_function_files, write_manifest
 
-    # Iterate through files in the source directory
-    for file_name in os.listdir(source_dir):
-        # Check if the file name contains an underscore and ends with .rs or .ll
-        if "_" in file_name and (file_name.endswith(".rs") or file_name.endswith(".ll")):
-            # Construct full file path
-            source_file = os.path.join(source_dir, file_name)
-            target_file = os.path.join(target_dir, file_name)
+def move_split_files(source_dir, target_dir, remove_source=True, manifest_path=None):
+    """
+    Move the per-function files of source_dir (names with an underscore,
+    ending in .rs or .ll) to target_dir.
 
-            # Move the file to the target directory
-            shutil.move(source_file, target_file)
-            print(f"Moved {file_name} to {target_dir}")
+    Files are hard-linked first and the originals unlinked once every link
+    exists, so an interrupted run loses nothing. With remove_source=False
+    the originals are kept and target_dir just holds links to them.
+    If manifest_path is given, the selection is also recorded there (see
+    dataset_subset.write_manifest).
+    """
+    names = split_function_files(source_dir)
+    if manifest_path:
+        write_manifest(manifest_path, source_dir, names, {'split_functions': True})
+    paths = [os.path.join(source_dir, name) for name in names]
+    copied = materialize(paths, target_dir)
+    if remove_source:
+        for path in paths:
+            os.remove(path)
+    print(f"{'Moved' if remove_source else 'Linked'} {len(names)} files to {target_dir} ({copied} had to be copied)")
 
-input_dir = "/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c/test_clean/test_input"
-output_dir  = "/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c/FINAL_TEST_TO_CREATE_DATASET/SPLIT_RUST_CODES/"
+def main():
+    parser = argparse.ArgumentParser(description="Move per-function .rs/.ll files out of a Rust source directory")
+    # You can modify these default paths as needed
+    parser.add_argument('input_dir', nargs='?',
+                        default="/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c/test_clean/test_input")
+    parser.add_argument('output_dir', nargs='?',
+                        default="/Users/mushtaqshaikh/Downloads/GAI4SE/Project/code_snippets_c/FINAL_TEST_TO_CREATE_DATASET/SPLIT_RUST_CODES/")
+    parser.add_argument('--link', action='store_true',
+                        help="leave the files in input_dir and hard-link them into output_dir instead of moving them")
+    parser.add_argument('--manifest', default=None, help="also record the selection in this manifest file")
+    args = parser.parse_args()
 
-move_split_files(input_dir, output_dir)
\ No newline at end of file
+    move_split_files(args.input_dir, args.output_dir, remove_source=not args.link, manifest_path=args.manifest)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import os
+import glob
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+from functools import partial
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+from dataset_sink import OUTPUT_FORMATS, PerFileSink, ShardedSink, source_order, stem_order
+from emit_rust_ir import emit_single
+from extract_c_fn import compile_to_ir, compile_to_ir_cached, extract_c_functions, remove_blank_lines, split_ir_functions
+from extract_rust_fn import extract_ir_for_functions, extract_rust_function_definitions
+from fetch_c_dataset import iter_hub_rows, iter_parquet_rows
+from ir_cache import IRCache
+from ir_canonical import SeenHashes, canonical_hash
+from ir_minify import LEVELS, minify_ir
+from metrics import Metrics
+
+# Marks the end of a queue's input; one is sent per consuming worker
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline: fn(item) returns a list of items for the next
+    stage (empty to drop the item). workers threads run it concurrently.
+    With processes=True each call runs in a shared process pool instead,
+    for CPU-bound Python work; fn and items must then be picklable.
+    """
+
+    def __init__(self, name, fn, workers=1, processes=False):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.processes = processes
+
+
+class Pipeline:
+    """
+    Streams items through stages connected by bounded queues.
+
+    A feeder thread pulls items from the source iterator; each stage's
+    workers take items from the queue before them and put their outputs on
+    the queue after them. A full queue blocks its producers, so a slow stage
+    throttles everything upstream of it and memory stays bounded by the
+    queue sizes. run() yields the last stage's outputs as they arrive, or,
+    with ordered=True, in the order of the source items they came from:
+    outputs that overtake an earlier item wait in a reorder buffer, which
+    holds at most the items in flight (bounded by the queue sizes).
+
+    An exception raised by a stage for one item is printed and counted as
+    `<stage>_errors` in metrics, and the item is dropped.
+    """
+
+    def __init__(self, stages, queue_size=64, metrics=None, ordered=False):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = metrics or Metrics()
+        self.ordered = ordered
+        self._stop = threading.Event()
+        self._error = None
+
+    def _put(self, q, item):
+        # Time out now and then so a stopped pipeline can't leave a producer blocked forever
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _feed(self, source, out, consumers):
+        try:
+            # Each message is (sequence number, items): exactly one per source
+            # item and stage, even when a stage drops the item, so the
+            # consumer can tell when every earlier item is through
+            for seq, item in enumerate(source):
+                self.metrics.count('fetched')
+                if not self._put(out, (seq, [item])):
+                    return
+        except BaseException as e:
+            self._error = e
+            self._stop.set()
+        finally:
+            for _ in range(consumers):
+                self._put(out, _DONE)
+
+    def _work(self, stage, executor, inbox, out, consumers, remaining, lock):
+        try:
+            while not self._stop.is_set():
+                try:
+                    message = inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if message is _DONE:
+                    return
+                seq, items = message
+                outputs = []
+                for item in items:
+                    start = time.perf_counter()
+                    try:
+                        if executor is not None:
+                            outputs.extend(executor.submit(stage.fn, item).result())
+                        else:
+                            outputs.extend(stage.fn(item))
+                    except Exception as e:
+                        print(f"Error in {stage.name} for "
+                              f"{item.get('name', item) if isinstance(item, dict) else item}: {e}")
+                        self.metrics.count(f"{stage.name}_errors")
+                    finally:
+                        self.metrics.add_time(stage.name, time.perf_counter() - start)
+                if not self._put(out, (seq, outputs)):
+                    return
+        finally:
+            # The last worker of a stage to finish tells every downstream worker
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                for _ in range(consumers):
+                    self._put(out, _DONE)
+
+    def run(self, source):
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0], self.stages[0].workers),
+                                    name='feed', daemon=True)]
+        executors = []
+        for i, stage in enumerate(self.stages):
+            executor = None
+            if stage.processes:
+                # Forking while the stage threads run can deadlock the children
+                executor = ProcessPoolExecutor(max_workers=stage.workers, mp_context=get_context('spawn'))
+                executors.append(executor)
+            consumers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage, executor, queues[i], queues[i + 1], consumers, remaining, lock),
+                    name=f"{stage.name}-{n}", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        waiting = {}
+        next_seq = 0
+        try:
+            while True:
+                try:
+                    message = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    # The feeder failed and stopped the pipeline
+                    if self._stop.is_set():
+                        break
+                    continue
+                if message is _DONE:
+                    break
+                if not self.ordered:
+                    yield from message[1]
+                    continue
+                waiting[message[0]] = message[1]
+                while next_seq in waiting:
+                    yield from waiting.pop(next_seq)
+                    next_seq += 1
+        finally:
+            # Also reached when the consumer stops early: unblock and stop every thread
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            for executor in executors:
+                executor.shutdown(cancel_futures=True)
+        if self._error is not None:
+            raise self._error
+
+
+# Stage functions, top-level so they can run in a process pool
+
+
+def materialize_source(item, work_dir):
+    """Write a fetched source (item['code']) to work_dir, where the compilers can read it"""
+    if 'path' not in item:
+        item['path'] = os.path.join(work_dir, item['name'] + item['extension'])
+        with open(item['path'], 'w') as f:
+            f.write(item.pop('code'))
+    return [item]
+
+
+def compile_c(item, cache=None):
+    """Compile a C source to cleaned textual IR (item['ir_text'])"""
+    item['ir_text'] = compile_to_ir_cached(item['path'], cache) if cache is not None else compile_to_ir(item['path'])
+    return [item]
+
+
+def split_c_ir(item, ir_level='none'):
+    """Split the module into per-function IR, minified to ir_level"""
+    item['ir'] = {name: minify_ir(ir, ir_level) for name, ir in split_ir_functions(item.pop('ir_text'))}
+    return [item] if item['ir'] else []
+
+
+def pair_c(item, hash_ir=False):
+    """One record per C function of the source, with its IR if any"""
+    records = []
+    for number, c_func_text, c_func_name in extract_c_functions(item['path']):
+        if not c_func_name:
+            continue
+        record = {'source': item['path'], 'number': number, 'function': c_func_name,
+                  'language': 'c', 'code': remove_blank_lines(c_func_text), 'ir': item['ir'].get(c_func_name)}
+        if hash_ir and record['ir'] is not None:
+            record['ir_hash'] = canonical_hash(record['ir'])
+        records.append(record)
+    return [records]
+
+
+def compile_rust(item, ir_dir):
+    """Compile a Rust source to textual IR in ir_dir (item['ir_path'])"""
+    error = emit_single(item['path'], ir_dir)
+    if error:
+        raise RuntimeError(error.splitlines()[-1])
+    item['ir_path'] = os.path.join(ir_dir, item['name'] + '.ll')
+    return [item]
+
+
+def split_rust_ir(item, ir_level='none'):
+    """Find each Rust function's IR by demangled path (test_fetch_rs_ll_pairs.extract_ir_for_functions)"""
+    item['functions'] = extract_rust_function_definitions(item['path'])
+    item['ir'] = extract_ir_for_functions(item['ir_path'], item['functions'].keys(), ir_level=ir_level)
+    return [item]
+
+
+def pair_rust(item, hash_ir=False):
+    """One record per Rust function of the source, with its IR if any"""
+    crate = os.path.splitext(os.path.basename(item['path']))[0]
+    records = []
+    for name in sorted(item['functions'], key=stem_order):
+        record = {'source': item['path'], 'function': name, 'language': 'rust',
+                  'code': item['functions'][name], 'ir': item['ir'].get(name) or None}
+        if hash_ir and record['ir'] is not None:
+            record['ir_hash'] = canonical_hash(record['ir'], crate)
+        records.append(record)
+    return [records]
+
+
+def build_stages(language, work_dir, compile_workers=4, pair_workers=2, processes=False,
+                 cache=None, ir_level='none', hash_ir=False):
+    """
+    The stages after fetching, for 'c' or 'rust' sources: write the source
+    to work_dir if it only exists in memory, compile it, split the IR by
+    function and pair it with the source functions. The last stage emits one
+    list of records per source file.
+    """
+    if language == 'c':
+        return [Stage('compile', partial(compile_c, cache=cache), compile_workers),
+                Stage('split', partial(split_c_ir, ir_level=ir_level), pair_workers, processes),
+                Stage('pair', partial(pair_c, hash_ir=hash_ir), pair_workers, processes)]
+    ir_dir = os.path.join(work_dir, 'ir')
+    os.makedirs(ir_dir, exist_ok=True)
+    return [Stage('compile', partial(compile_rust, ir_dir=ir_dir), compile_workers),
+            Stage('split', partial(split_rust_ir, ir_level=ir_level), pair_workers, processes),
+            Stage('pair', partial(pair_rust, hash_ir=hash_ir), pair_workers, processes)]
+
+
+def iter_directory_sources(input_dir, extension):
+    """Source items for the files of input_dir, compiled in place, in dataset_sink.source_order"""
+    paths = glob.glob(os.path.join(input_dir, '*' + extension))
+    for path in sorted(paths, key=lambda path: source_order(os.path.splitext(os.path.basename(path))[0])):
+        yield {'name': os.path.splitext(os.path.basename(path))[0], 'extension': extension, 'path': path}
+
+
+def iter_fetched_sources(rows):
+    """Source items for (row, source_code) pairs from fetch_c_dataset"""
+    for row, source_code in rows:
+        # Named after the 1-based row number, as fetch_c_dataset.py does
+        yield {'name': f"train{row + 1}", 'extension': '.c', 'code': source_code}
+
+
+def run_pipeline(source, output_dir, language='c', output_format='jsonl', shard_bytes=256 << 20,
+                 work_dir=None, compile_workers=4, pair_workers=2, processes=False, queue_size=64,
+                 cache_dir=None, dedup_path=None, ir_level='none', metrics=None):
+    """
+    Stream source items (see iter_directory_sources / iter_fetched_sources)
+    through compile, split and pair stages into a sink in output_dir. Files
+    are in flight concurrently, so the first records are written within
+    seconds rather than after a whole directory has been compiled.
+
+    Records are written in dataset_sink.source_order, as join_dataset.py
+    expects of shards: directory sources are read in that order, and
+    fetched rows (train<row>) come in row order, which is the same.
+
+    Fetched sources and Rust IR are written under work_dir; without one a
+    temporary directory is used and removed at the end, so no intermediate
+    directory is left behind. Returns the metrics.
+    """
+    metrics = metrics or Metrics()
+    own_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='pipeline_')
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    cache = IRCache(cache_dir) if cache_dir else None
+    seen = SeenHashes(dedup_path) if dedup_path else None
+    if output_format == 'files':
+        sink = PerFileSink(output_dir)
+    else:
+        sink = ShardedSink(output_dir, output_format, max_shard_bytes=shard_bytes)
+
+    stages = [Stage('materialize', partial(materialize_source, work_dir=work_dir))]
+    stages += build_stages(language, work_dir, compile_workers, pair_workers, processes,
+                           cache, ir_level, seen is not None)
+    pipeline = Pipeline(stages, queue_size, metrics, ordered=True)
+    start = time.perf_counter()
+    try:
+        for done, records in enumerate(pipeline.run(source), 1):
+            with metrics.stage('sink'):
+                for record in records:
+                    if seen is not None and 'ir_hash' in record and not seen.add(record['ir_hash']):
+                        metrics.count('duplicates')
+                        continue
+                    for path in sink.write(record):
+                        metrics.trace(f"Created {path}")
+                    metrics.count('functions')
+                    metrics.count('matched' if record['ir'] is not None else 'unmatched')
+            if done == 1:
+                metrics.observe('first_output_seconds', time.perf_counter() - start)
+            metrics.count('files')
+            metrics.progress(done, label='files')
+    finally:
+        sink.close()
+        if seen is not None:
+            seen.close()
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream sources through compile, IR split and pairing into a dataset")
+    parser.add_argument('output_dir')
+    parser.add_argument('--language', default='c', choices=['c', 'rust'])
+    parser.add_argument('--input-dir', default=None, help="read sources from this directory")
+    parser.add_argument('--parquet', default=None, help="fetch C sources from a local parquet snapshot")
+    parser.add_argument('--split', default=None, help="fetch C sources from this SLTrans split on the hub")
+    parser.add_argument('--start', type=int, default=10001, help="first row to fetch (inclusive)")
+    parser.add_argument('--end', type=int, default=10100, help="last row to fetch (exclusive)")
+    parser.add_argument('--streaming', action='store_true', help="stream the hub split instead of caching it")
+    parser.add_argument('--format', default='jsonl', choices=OUTPUT_FORMATS)
+    parser.add_argument('--shard-size', type=int, default=256, help="approximate shard size in MB")
+    parser.add_argument('--work-dir', default=None,
+                        help="keep fetched sources and Rust IR here (default: a temporary directory)")
+    parser.add_argument('--compile-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--pair-workers', type=int, default=2)
+    parser.add_argument('--processes', action='store_true',
+                        help="run the split and pair stages in worker processes instead of threads")
+    parser.add_argument('--queue-size', type=int, default=64, help="items buffered between stages")
+    parser.add_argument('--cache-dir', default=None, help="compiled-IR cache for C (see ir_cache.py)")
+    parser.add_argument('--dedup', default=None, help="on-disk hash set for dropping exact IR duplicates")
+    parser.add_argument('--ir-level', default='none', choices=LEVELS)
+    parser.add_argument('--metrics', default=None, help="write the run's metrics here as JSON")
+    parser.add_argument('--verbose', '-v', action='store_true')
+    args = parser.parse_args()
+
+    if args.input_dir:
+        source = iter_directory_sources(args.input_dir, '.c' if args.language == 'c' else '.rs')
+    elif args.language != 'c':
+        parser.error("--input-dir is required for Rust sources")
+    elif args.parquet:
+        paths = sorted(glob.glob(os.path.join(args.parquet, '*.parquet'))) if os.path.isdir(args.parquet) else [args.parquet]
+        source = iter_fetched_sources(iter_parquet_rows(paths, args.start, args.end))
+    elif args.split:
+        source = iter_fetched_sources(iter_hub_rows(args.split, args.start, args.end, streaming=args.streaming))
+    else:
+        parser.error("one of --input-dir, --parquet or --split is required")
+
+    metrics = run_pipeline(source, args.output_dir, args.language, args.format, args.shard_size << 20,
+                           args.work_dir, args.compile_workers, args.pair_workers, args.processes,
+                           args.queue_size, args.cache_dir, args.dedup, args.ir_level, Metrics(args.verbose))
+    if args.metrics:
+        metrics.write(args.metrics)
+    print(metrics.summary())
+
+
+if __name__ == "__main__":
+    main()
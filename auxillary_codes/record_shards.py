@@ -0,0 +1,330 @@
+import os
+import gzip
+import json
+import mmap
+import struct
+import argparse
+from collections import OrderedDict
+
+from dataset_sink import iter_shard_records, shard_format
+
+INDEX_NAME = 'index.bin'
+CODECS = ('zst', 'gz')
+
+# index.bin, little-endian: header, then one (shard, offset, compressed
+# length, raw length) entry per block, then each record's offset inside its
+# decompressed block. Record i lives in block i // records_per_block.
+_MAGIC = b'RSHARD01'
+_HEADER = struct.Struct('<8sQQQ8s')
+_BLOCK = struct.Struct('<QQQQ')
+_OFFSET = struct.Struct('<I')
+
+
+def _default_codec():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return 'gz'
+    return 'zst'
+
+
+def _compressor(codec, level=None):
+    if codec == 'zst':
+        import zstandard
+        return zstandard.ZstdCompressor(level=level or 10).compress
+    return lambda data: gzip.compress(data, compresslevel=level or 6)
+
+
+def _decompressor(codec):
+    if codec == 'zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zst shards need the zstandard package (pip install zstandard)") from None
+        return zstandard.ZstdDecompressor().decompress
+    return gzip.decompress
+
+
+def shard_name(number, codec):
+    return f"records-{number:05d}.jsonl.{codec}"
+
+
+class RecordShardWriter:
+    """
+    Write records into compressed shards with a random-access index.
+
+    Records are grouped records_per_block at a time; each block is one
+    independently compressed zstd frame (gzip member without `zstandard`)
+    of JSON lines, so a shard is also a plain .jsonl.zst/.jsonl.gz file
+    that iter_shard_records and the zstd/gzip tools can read. A new shard is
+    started once about shard_bytes of compressed data went into one.
+    close() writes index.bin, which RecordShards memory-maps.
+
+    records_per_block trades random-access cost (a lookup decompresses one
+    block) against compression ratio.
+    """
+
+    def __init__(self, output_dir, records_per_block=64, shard_bytes=1 << 30, codec=None, level=None):
+        codec = codec or _default_codec()
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {CODECS}")
+        self.output_dir = output_dir
+        self.records_per_block = records_per_block
+        self.shard_bytes = shard_bytes
+        self.codec = codec
+        self.records_written = 0
+        self.blocks_written = 0
+        self.shards = []
+        self._compress = _compressor(codec, level)
+        self._block = []
+        self._block_bytes = 0
+        self._shard = None
+        self._shard_offset = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        # Offsets can outgrow memory for large corpora; spool them next to the index
+        self._blocks = open(os.path.join(output_dir, INDEX_NAME + '.blocks.tmp'), 'wb', buffering=1 << 20)
+        self._offsets = open(os.path.join(output_dir, INDEX_NAME + '.offsets.tmp'), 'wb', buffering=1 << 20)
+
+    def write(self, record):
+        line = (json.dumps(record) + '\n').encode()
+        self._offsets.write(_OFFSET.pack(self._block_bytes))
+        self._block.append(line)
+        self._block_bytes += len(line)
+        self.records_written += 1
+        if len(self._block) == self.records_per_block:
+            self._flush_block()
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        if self._shard is None or self._shard_offset >= self.shard_bytes:
+            if self._shard is not None:
+                self._shard.close()
+            self.shards.append(shard_name(len(self.shards), self.codec))
+            self._shard = open(os.path.join(self.output_dir, self.shards[-1]), 'wb')
+            self._shard_offset = 0
+        compressed = self._compress(b''.join(self._block))
+        self._shard.write(compressed)
+        self._blocks.write(_BLOCK.pack(len(self.shards) - 1, self._shard_offset, len(compressed), self._block_bytes))
+        self._shard_offset += len(compressed)
+        self.blocks_written += 1
+        self._block = []
+        self._block_bytes = 0
+
+    def close(self):
+        """Flush the last block and write index.bin"""
+        if self._blocks is None:
+            return
+        self._flush_block()
+        if self._shard is not None:
+            self._shard.close()
+        self._blocks.close()
+        self._offsets.close()
+        path = os.path.join(self.output_dir, INDEX_NAME)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.records_written, self.blocks_written, self.records_per_block,
+                                 self.codec.encode()))
+            for part in (self._blocks.name, self._offsets.name):
+                with open(part, 'rb') as spooled:
+                    while True:
+                        chunk = spooled.read(1 << 20)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                os.remove(part)
+        os.replace(path + '.tmp', path)
+        self._blocks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordShards:
+    """
+    Read-only, random-access view of a RecordShardWriter directory, usable
+    directly as a map-style dataset (len() and [i]) by training loaders.
+
+    Opening only memory-maps index.bin, so startup takes the same time for
+    any dataset size. dataset[i] reads record i's block with os.pread,
+    decompresses it and decodes the one record; the last cache_blocks
+    decompressed blocks are kept, so sequential and bucketed access
+    decompress each block once.
+
+    Forked DataLoader workers share the index pages and the shard file
+    descriptors (pread doesn't move a shared file position); pickling (for
+    spawned workers) sends only the path, and the copy reopens the files.
+    """
+
+    def __init__(self, path, cache_blocks=8):
+        self.path = path
+        self.cache_blocks = cache_blocks
+        self._open()
+
+    def _open(self):
+        with open(os.path.join(self.path, INDEX_NAME), 'rb') as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._records, self._block_count, self.records_per_block, codec = _HEADER.unpack_from(self._index)
+        if magic != _MAGIC:
+            raise ValueError(f"{self.path} has no record shard index")
+        self.codec = codec.rstrip(b'\0').decode()
+        self._offsets_start = _HEADER.size + self._block_count * _BLOCK.size
+        self._decompress = _decompressor(self.codec)
+        self._fds = {}
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return self._records
+
+    def _block(self, number):
+        raw = self._cache.get(number)
+        if raw is not None:
+            self._cache.move_to_end(number)
+            return raw
+        shard, offset, length, _ = _BLOCK.unpack_from(self._index, _HEADER.size + number * _BLOCK.size)
+        fd = self._fds.get(shard)
+        if fd is None:
+            fd = self._fds[shard] = os.open(os.path.join(self.path, shard_name(shard, self.codec)), os.O_RDONLY)
+        raw = self._decompress(os.pread(fd, length, offset))
+        self._cache[number] = raw
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return raw
+
+    def raw(self, i):
+        """The JSON bytes of record i"""
+        if i < 0:
+            i += self._records
+        if not 0 <= i < self._records:
+            raise IndexError(i)
+        block = self._block(i // self.records_per_block)
+        start, = _OFFSET.unpack_from(self._index, self._offsets_start + i * _OFFSET.size)
+        # Records end where the next one in the block starts, or with the block
+        if (i + 1) % self.records_per_block and i + 1 < self._records:
+            end, = _OFFSET.unpack_from(self._index, self._offsets_start + (i + 1) * _OFFSET.size)
+        else:
+            end = len(block)
+        return block[start:end]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._records))]
+        return json.loads(self.raw(i))
+
+    def __iter__(self):
+        """All records in order, one block at a time, bypassing the cache"""
+        for number in range(self._block_count):
+            shard, offset, length, _ = _BLOCK.unpack_from(self._index, _HEADER.size + number * _BLOCK.size)
+            with open(os.path.join(self.path, shard_name(shard, self.codec)), 'rb') as f:
+                f.seek(offset)
+                for line in self._decompress(f.read(length)).splitlines():
+                    yield json.loads(line)
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+        self._cache.clear()
+        self._index.close()
+
+    def __getstate__(self):
+        return {'path': self.path, 'cache_blocks': self.cache_blocks}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """
+    Yield the elements of a top-level JSON array file (the training file
+    format, as join_dataset.py writes it) without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', buffering=1 << 20) as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} is not a JSON array")
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("Need more data", buffer, pos)
+                element, end = decoder.raw_decode(buffer, pos)
+                # A number ending at the buffer's end may continue in the next read
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("Need more data", buffer, end)
+                pos = end
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Element cut at the end of the buffer: drop what was consumed, read more
+                more = f.read(max(chunk_size, len(buffer) - pos))
+                eof = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield element
+
+
+def iter_input_records(path):
+    """Records of a JSON array file (.json) or of a JSONL file or extractor shard"""
+    if path.endswith('.json'):
+        return iter_json_array(path)
+    if shard_format(path) is None:
+        raise ValueError(f"Don't know how to read {path}: expected .json, .jsonl[.gz|.zst] or .parquet")
+    return iter_shard_records(path)
+
+
+def convert(inputs, output_dir, records_per_block=64, shard_bytes=1 << 30, codec=None):
+    """Write the records of inputs (see iter_input_records) into output_dir; returns the writer"""
+    with RecordShardWriter(output_dir, records_per_block, shard_bytes, codec) as writer:
+        for path in inputs:
+            for record in iter_input_records(path):
+                writer.write(record)
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Random-access compressed record shards for training loaders")
+    commands = parser.add_subparsers(dest='command', required=True)
+    make = commands.add_parser('convert', help="convert JSON array / JSONL files into record shards")
+    make.add_argument('inputs', nargs='+', help="dataset .json files, JSONL files or extractor shards")
+    make.add_argument('--output-dir', required=True)
+    make.add_argument('--records-per-block', type=int, default=64,
+                      help="records compressed together; a lookup decompresses one block (default: 64)")
+    make.add_argument('--shard-size', type=int, default=1024, help="approximate compressed shard size in MB")
+    make.add_argument('--codec', choices=CODECS, default=None, help="default: zst if zstandard is installed")
+    get = commands.add_parser('get', help="print record i")
+    get.add_argument('path')
+    get.add_argument('index', type=int)
+    get.add_argument('--field', default=None, help="print only this field's text")
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        writer = convert(args.inputs, args.output_dir, args.records_per_block, args.shard_size << 20, args.codec)
+        size = sum(os.path.getsize(os.path.join(args.output_dir, name)) for name in writer.shards)
+        print(f"Wrote {writer.records_written} records in {writer.blocks_written} blocks "
+              f"to {len(writer.shards)} shards ({size / 1e6:.1f} MB) in {args.output_dir}")
+    else:
+        with RecordShards(args.path) as dataset:
+            record = dataset[args.index]
+        print(record[args.field] if args.field else json.dumps(record, indent=4))
+
+
+if __name__ == "__main__":
+    main()
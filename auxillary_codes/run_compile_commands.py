@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import shlex
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+def entry_arguments(entry):
+    """Return the argv of a compile_commands.json entry ('arguments' or 'command')"""
+    if 'arguments' in entry:
+        return list(entry['arguments'])
+    return shlex.split(entry['command'])
+
+
+def entry_output(entry, arguments):
+    """Return the entry's output path: its 'output' field, else the argument after -o"""
+    output = entry.get('output')
+    if output is None:
+        for i, argument in enumerate(arguments[:-1]):
+            if argument == '-o':
+                output = arguments[i + 1]
+    if output is None:
+        return None
+    return os.path.join(entry['directory'], output)
+
+
+def is_up_to_date(source, output):
+    """True if output exists and is at least as new as source"""
+    try:
+        return os.stat(output).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def run_entry(entry, force=False, timeout=None):
+    """
+    Run one compile_commands.json entry in its directory, unless its output
+    is newer than its source.
+
+    Returns a dict with the file, output, status ('skipped', 'ok', 'failed'
+    or 'timeout'), exit code, wall time in seconds and the tail of stderr on
+    failure.
+    """
+    arguments = entry_arguments(entry)
+    source = os.path.join(entry['directory'], entry['file'])
+    output = entry_output(entry, arguments)
+    result = {'file': source, 'output': output, 'status': 'skipped', 'returncode': None,
+              'seconds': 0.0, 'error': None}
+    if not force and output is not None and is_up_to_date(source, output):
+        return result
+
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(arguments, cwd=entry['directory'], stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, timeout=timeout)
+        result['returncode'] = completed.returncode
+        result['status'] = 'ok' if completed.returncode == 0 else 'failed'
+        if completed.returncode != 0:
+            result['error'] = completed.stderr.decode(errors='replace')[-2000:]
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+        result['error'] = f"timed out after {timeout}s"
+    except OSError as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start, 4)
+
+    # Don't leave a partial artifact that would look up to date next time
+    if result['status'] != 'ok' and output is not None and os.path.exists(output):
+        os.remove(output)
+    return result
+
+
+def run_compile_commands(entries, jobs=None, force=False, timeout=None, log_path=None):
+    """
+    Run compile_commands.json entries over `jobs` parallel processes
+    (default: number of CPUs), make-style: entries whose output is newer
+    than their source are skipped.
+
+    If log_path is given, one JSON line per entry (status, exit code, wall
+    time, error) is appended there in input order. Returns a dict of
+    counts per status and the total command time.
+    """
+    summary = {'ok': 0, 'failed': 0, 'timeout': 0, 'skipped': 0, 'seconds': 0.0}
+    log = open(log_path, 'a') if log_path else None
+    try:
+        # The work is in the child processes, so threads are enough to drive them
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+            for result in executor.map(lambda entry: run_entry(entry, force, timeout), entries):
+                summary[result['status']] += 1
+                summary['seconds'] += result['seconds']
+                if result['status'] in ('failed', 'timeout'):
+                    print(f"{result['status'].upper()}: {result['file']}: {(result['error'] or '').strip()[-300:]}")
+                if log is not None:
+                    log.write(json.dumps(result) + '\n')
+                    log.flush()
+    finally:
+        if log is not None:
+            log.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally run the commands of a compile_commands.json")
+    parser.add_argument('compile_commands', nargs='?', default='compile_commands.json')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help="number of commands to run at once (default: number of CPUs)")
+    parser.add_argument('--force', action='store_true', help="rerun entries whose output is up to date")
+    parser.add_argument('--timeout', type=float, default=None, help="per-command timeout in seconds")
+    parser.add_argument('--log', default=None, help="append per-command JSON results to this file")
+    args = parser.parse_args()
+
+    with open(args.compile_commands) as f:
+        entries = json.load(f)
+
+    start = time.perf_counter()
+    summary = run_compile_commands(entries, args.jobs, args.force, args.timeout, args.log)
+    print(f"{summary['ok']} built, {summary['failed']} failed, {summary['timeout']} timed out, "
+          f"{summary['skipped']} up to date in {time.perf_counter() - start:.1f}s "
+          f"({summary['seconds']:.1f}s of command time)")
+
+
+if __name__ == "__main__":
+    main()
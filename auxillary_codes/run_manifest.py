@@ -0,0 +1,78 @@
+import os
+import json
+import time
+import hashlib
+
+
+def file_digest(*paths):
+    """Return the sha256 hex digest of the concatenated contents of paths"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """
+    Append-only JSONL record of what a pipeline run did with each input.
+
+    Every line holds one input's path, content hash, the stage it reached
+    ('done' on success), the outputs it produced and a failure reason. The
+    last line for an input wins, so a crashed run loses at most the input
+    that was in flight. On a rerun, inputs whose hash is unchanged and whose
+    stage is 'done' are skipped; failed or modified inputs are redone.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        lines = 0
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partial line from a crashed run
+                    self.records[record['input']] = record
+                    lines += 1
+        # Drop superseded lines once they make up most of the file
+        if lines > 2 * len(self.records) + 100:
+            self.compact()
+        self._file = open(path, 'a')
+
+    def should_process(self, input_path, digest):
+        """True unless input_path already succeeded with the same contents"""
+        record = self.records.get(input_path)
+        return not (record and record['hash'] == digest and record['stage'] == 'done')
+
+    def record(self, input_path, digest, stage, outputs=(), error=None):
+        """Append the outcome for input_path and flush it to disk"""
+        record = {'input': input_path, 'hash': digest, 'stage': stage,
+                  'outputs': list(outputs), 'error': error, 'time': time.time()}
+        self.records[input_path] = record
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def compact(self):
+        """Rewrite the manifest with only the latest record per input"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
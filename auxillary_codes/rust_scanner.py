@@ -0,0 +1,146 @@
+import re
+
+# Tokens that matter for locating fn items. Literals and comments are
+# matched whole so that braces and keywords inside them are ignored; plain
+# identifiers and operators are skipped by finditer.
+_RUST_TOKEN = re.compile(r"""
+    (?P<line_comment>//[^\n]*)
+  | (?P<block_comment>/\*)
+  | (?P<raw_string>(?:\b[bc])?\br(?P<hashes>\#*)".*?"(?P=hashes))
+  | (?P<string>(?:\b[bc])?"(?:\\.|[^"\\])*")
+  | (?P<char>(?:\bb)?'(?:[^'\\\n]|\\(?:u\{[0-9a-fA-F_]*\}|x[0-9a-fA-F]{2}|.))')
+  | (?P<lifetime>'[A-Za-z_]\w*)
+  | \bfn\s+(?:r\#)?(?P<fn>[A-Za-z_]\w*)
+  | \bmod\s+(?:r\#)?(?P<mod>[A-Za-z_]\w*)
+  | \btrait\s+(?:r\#)?(?P<trait>[A-Za-z_]\w*)
+  | (?P<impl>\bimpl\b)
+  | (?P<punct>[{};])
+  | (?P<arrow>[-=]>)
+  | (?P<open>[\[(<])
+  | (?P<close>[\])>])
+""", re.S | re.X)
+_BLOCK_COMMENT_DELIMITER = re.compile(r'/\*|\*/')
+
+
+def _skip_block_comment(text, pos):
+    """Return the offset past the (possibly nested) block comment opened before pos"""
+    depth = 1
+    for m in _BLOCK_COMMENT_DELIMITER.finditer(text, pos):
+        depth += 1 if m.group() == '/*' else -1
+        if depth == 0:
+            return m.end()
+    return len(text)
+
+
+def _split_top_level(text, separator):
+    """Split text on separator where it is not nested inside <>, () or []"""
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch in '<([':
+            depth += 1
+        elif ch in '>)]' and not (ch == '>' and text[i - 1:i] == '-'):
+            depth -= 1
+        elif depth == 0 and text.startswith(separator, i):
+            parts.append(text[start:i])
+            start = i + len(separator)
+            i = start
+            continue
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _type_name(text):
+    """Reduce a type or trait path such as `&'a mut foo::Bar<T>` to `Bar`"""
+    text = re.sub(r"^(?:\s|&|'[A-Za-z_]\w*|\bmut\b|\bdyn\b|\bconst\b)*", '', text).strip()
+    text = text.split('<', 1)[0]
+    return text.rsplit('::', 1)[-1].strip()
+
+
+def impl_path(header):
+    """
+    Return the path component an impl block contributes to its items:
+    `Type` for an inherent impl, `<Type as Trait>` for a trait impl.
+
+    header is the text between the `impl` keyword and the opening brace.
+    """
+    header = header.strip()
+    if header.startswith('<'):
+        # Skip the impl's own generic parameters
+        depth = 0
+        for i, ch in enumerate(header):
+            if ch == '<':
+                depth += 1
+            elif ch == '>' and header[i - 1] != '-':
+                depth -= 1
+                if depth == 0:
+                    header = header[i + 1:]
+                    break
+    header = re.split(r'\bwhere\b', header, 1)[0]
+    parts = _split_top_level(f" {header} ", ' for ')
+    if len(parts) == 2 and not parts[0].strip().startswith('!'):
+        return f"<{_type_name(parts[1])} as {_type_name(parts[0])}>"
+    return _type_name(header)
+
+
+def iter_rust_function_spans(text):
+    """
+    Find every fn item with a body in Rust source text in a single pass.
+
+    Yields (path, start, end) where path qualifies the fn by its enclosing
+    modules, fns, traits and impls (e.g. `add`, `Point::new`,
+    `<Point as Display>::fmt`, `outer::inner`), text[start:end] runs from
+    the `fn` keyword to the closing brace, and spans are yielded in the
+    order their bodies close. Comments (including nested block comments),
+    string/raw string/char literals and lifetimes are tokenized, so braces
+    inside them are ignored.
+    """
+    scopes = []        # (kind, path component or None, fn start)
+    pending = None     # item whose '{' has not been seen yet
+    depth = 0          # [/(/< nesting inside the pending item's header
+    pos = 0
+    while True:
+        m = _RUST_TOKEN.search(text, pos)
+        if m is None:
+            return
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'block_comment':
+            pos = _skip_block_comment(text, pos)
+        elif kind in ('fn', 'mod', 'trait'):
+            if pending is None:
+                pending = (kind, m.group(kind), m.start())
+                depth = 0
+        elif kind == 'impl':
+            # `impl Trait` in a signature is a type, not an impl block
+            if pending is None:
+                pending = ('impl', None, m.end())
+                depth = 0
+        elif kind == 'open':
+            depth += 1
+        elif kind == 'close':
+            depth = max(depth - 1, 0)
+        elif kind == 'punct':
+            token = m.group()
+            if token == ';':
+                # `;` inside an array type such as `[i32; 4]` doesn't end the item
+                if depth == 0:
+                    pending = None
+            elif token == '{':
+                if pending is None:
+                    scopes.append(('block', None, None))
+                elif pending[0] == 'impl':
+                    scopes.append(('impl', impl_path(text[pending[2]:m.start()]), None))
+                else:
+                    scopes.append(pending)
+                pending = None
+            elif scopes:
+                scope_kind, name, start = scopes.pop()
+                if scope_kind == 'fn':
+                    path = [s[1] for s in scopes if s[1] is not None] + [name]
+                    yield '::'.join(path), start, m.end()
+                pending = None
@@ -1,31 +1,35 @@
 import re
 
+from demangle import Demangler, item_name
+
 def demangle_function_names(test_names):
     """
-    Demangles function names based on the pattern @_Z...<digits><name>17h.
+    Demangles the mangled Rust (legacy or v0) or C++ symbol referenced in each name.
 
     :param test_names: A list of strings containing mangled function names
     :return: A list of tuples (original_name, demangled_name or None if not matched)
     """
-    # Define the regex pattern
-    pattern = r"@_Z[A-Za-z\d]+(\d+[a-zA-Z0-9_]+)17h"
+    # Symbol reference: @_Z... / @_R..., optionally quoted
+    pattern = re.compile(r'@"?((?:_Z|_R)[-\w$.]*)')
 
     results = []
-    for name in test_names:
-        match = re.search(pattern, name)
-        if match:
-            demangled_name = match.group(1)  # Extract the name inside the pattern
-            # Remove the leading digits before the actual name
-            demangled_name = re.sub(r"^\d+", "", demangled_name)
-            results.append((name, demangled_name))
-        else:
-            results.append((name, None))  # No match found
+    with Demangler() as demangler:
+        for name in test_names:
+            match = pattern.search(name)
+            demangled = demangler.demangle(match.group(1)) if match else None
+            if demangled and demangled != match.group(1):
+                results.append((name, item_name(demangled)))
+            else:
+                results.append((name, None))  # No match found
     return results
 
 if __name__ == "__main__":
     # List of test names to check the pattern
     test_names = [
-        "@_ZN9train48406main_017h472af9ca814a5c7dE()"
+        "@_ZN9train48406main_017h472af9ca814a5c7dE()",
+        "@_RNvCskwGfYPst2Cb_3foo16example_function()",
+        "@_Z3addii(i32 %0, i32 %1)",
+        "@main()"
     ]
     
     # Test the function
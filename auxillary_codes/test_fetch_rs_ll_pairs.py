@@ -1,122 +1,24 @@
 
 
 import os
-import re
-import subprocess
+import hashlib
+import time
+from functools import partial
 
-
-def extract_rust_function_definitions(rust_file_path):
-    """
-    Extract complete function definitions from a Rust source file.
-    Returns a dictionary with function names as keys and their definitions as values.
-    """
-    function_definitions = {}
-
-    with open(rust_file_path, 'r') as file:
-        lines = file.readlines()
-
-    for i, line in enumerate(lines):
-        # Modified to include main() function
-        if "fn " in line and line.strip().endswith("{"):  # Look for lines containing 'fn'
-            start_line = i
-            function_def = extract_function(lines, start_line)
-            if function_def:
-                function_name = extract_function_name(line)
-                if function_name:
-                    print(f'function name is {function_name}')
-                    function_definitions[function_name] = function_def
-
-    return function_definitions
-
-
-def extract_function(lines, start_line):
-    """
-    Extract a complete function definition starting from the given line index.
-    Uses brace matching to find the end of the function.
-    """
-    function_body = []
-    brace_count = 0
-    in_function = False
-
-    for line in lines[start_line:]:
-        function_body.append(line)
-        if '{' in line:
-            brace_count += line.count('{')
-            in_function = True
-        if '}' in line and in_function:
-            brace_count -= line.count('}')
-            if brace_count == 0:
-                break
-
-    if brace_count == 0 and in_function:
-        return ''.join(function_body)
-    return None
-
-
-def extract_function_name(line):
-    """
-    Extract the function name from a line containing 'fn'.
-    Handles generics and type constraints correctly.
-    """
-    match = re.search(r'fn\s+([a-zA-Z_][a-zA-Z0-9_]*)', line)
-    if match:
-        return match.group(1)
-    return None
-
-
-def extract_ir_for_functions(ir_file_path, function_names):
-    """
-    Extract LLVM IR for specific functions from the IR file.
-    Returns a dictionary mapping function names to their IR.
-    """
-    ir_dict = {}
-    current_function = None
-    current_ir = []
-
-    with open(ir_file_path, 'r') as file:
-        lines = file.readlines()
-
-    for line in lines:
-        # Look for function definitions in IR
-        define_match = re.search(r'define\s+(?:.*?\s+)?@([a-zA-Z0-9_]+)\s*\(', line)
-
-        if define_match:
-            print(f'printing define_match {define_match}')
-            if current_function and current_ir:
-                ir_dict[current_function] = ''.join(current_ir)
-                current_ir = []
-
-            ir_func_name = define_match.group(1)
-            print(f'printing ir_func_name {ir_func_name}')
-            found_function = None
-
-            for rust_func in function_names:
-                if rust_func in ir_func_name:
-                    found_function = rust_func
-                    break
-
-            current_function = found_function
-            if current_function:
-                current_ir.append(line)
-
-        elif current_function and line.strip():
-            current_ir.append(line)
-            if line.strip() == '}':
-                ir_dict[current_function] = ''.join(current_ir)
-                current_function = None
-                current_ir = []
-
-    return ir_dict
+from dataset_sink import function_file_stems, source_order, stem_order
+from extract_rust_fn import extract_ir_for_functions, extract_rust_function_definitions
+from ir_canonical import canonical_hash
+from metrics import Metrics
+from run_manifest import RunManifest, file_digest
 
 
-
-import os
-
 def write_files_for_functions(rust_file_path, ir_file_path, function_definitions, ir_dict):
     """
     Write separate files for each function's Rust definition and IR.
     Ensures main and main_0 are written to the same numbered files.
+    Returns the list of files written.
     """
+    written = []
     base_name = os.path.splitext(rust_file_path)[0]
     
     # Sort function definitions by function name
@@ -140,6 +42,8 @@ def write_files_for_functions(rust_file_path, ir_file_path, function_definitions
             file_number_map[func_name] = current_idx
             current_idx += 1
 
+    file_stems = function_file_stems(function_definitions)
+
     # Write the files using the mapping
     for func_name in sorted_function_names:
         func_def = function_definitions[func_name]
@@ -150,8 +54,9 @@ def write_files_for_functions(rust_file_path, ir_file_path, function_definitions
             rust_func_file = f"{base_name}_main.rs"
             ir_func_file = f"{base_name}_main.ll"
         else:
-            rust_func_file = f"{base_name}_{func_name}.rs"
-            ir_func_file = f"{base_name}_{func_name}.ll"
+            file_stem = file_stems[func_name]
+            rust_func_file = f"{base_name}_{file_stem}.rs"
+            ir_func_file = f"{base_name}_{file_stem}.ll"
 
         # For main/main_0, append to existing file if it exists
         if func_name in ['main', 'main_0'] and os.path.exists(rust_func_file):
@@ -162,6 +67,8 @@ def write_files_for_functions(rust_file_path, ir_file_path, function_definitions
         # Write Rust function definition
         with open(rust_func_file, mode) as rust_file:
             rust_file.write(func_def)
+        if rust_func_file not in written:
+            written.append(rust_func_file)
 
         # Write IR definition (if exists)
         ir_code = ir_dict.get(func_name, "")
@@ -173,35 +80,169 @@ def write_files_for_functions(rust_file_path, ir_file_path, function_definitions
                 
             with open(ir_func_file, mode) as ir_file:
                 ir_file.write(ir_code)
+            if ir_func_file not in written:
+                written.append(ir_func_file)
+
+    return written
+
+def drop_duplicate_functions(rust_file_path, function_definitions, ir_dict, seen):
+    """
+    Remove functions whose canonical IR (see ir_canonical) is already in
+    seen, an ir_canonical.SeenHashes, and add the rest. main and main_0 are
+    keyed together, since the `main` wrapper alone is the same in every
+    file. Functions without IR are kept. Returns the number removed.
+    """
+    crate = os.path.splitext(os.path.basename(rust_file_path))[0]
+    groups = {}
+    for func_name in function_definitions:
+        if ir_dict.get(func_name):
+            groups.setdefault('main' if func_name in ('main', 'main_0') else func_name, []).append(func_name)
+
+    dropped = 0
+    for names in groups.values():
+        digest = canonical_hash(''.join(ir_dict[name] for name in sorted(names)), crate)
+        if not seen.add(digest):
+            for name in names:
+                del function_definitions[name]
+                del ir_dict[name]
+                dropped += 1
+    return dropped
 
                 
-def main(input_dir, input_ir_dir):
-    # Step 1: Get all .rs files from the input directory and sort them by name
-    rust_files = sorted([f for f in os.listdir(input_dir) if f.endswith('.rs')])
+def main(input_dir, input_ir_dir, manifest_path=None, sink=None, seen=None, ir_level='none',
+         metrics=None, metrics_path=None, ir_store=None, prefetch=256):
+    """
+    Split every .rs/.ll pair into per-function files.
+
+    If a sink is given (see dataset_sink.ShardedSink), one record per
+    function (source, function, language, code, ir) is written to it
+    instead of the per-function files. The caller closes the sink; pairs
+    are only recorded as done in the manifest once their records are on
+    disk (see ShardedSink.when_durable), so the manifest is closed with it.
+
+    If seen (an ir_canonical.SeenHashes) is given, functions whose IR
+    duplicates one already written are dropped first.
+
+    ir_level is an ir_minify level ('none', 'light' or 'aggressive')
+    applied to every function's IR before it is written.
+
+    Stage times, counters (files, functions, matched/unmatched IR, missing
+    IR files, errors) and per-file latency are collected in metrics (see
+    metrics.Metrics) and written to metrics_path as JSON if given. Per-file
+    messages are printed only when metrics is verbose; otherwise a
+    throttled progress line is shown.
+
+    If manifest_path is given, each pair's outcome is recorded there (see
+    run_manifest.RunManifest) and pairs whose .rs and .ll contents are
+    unchanged since a successful run are skipped.
+
+    If ir_store (an ir_store.IRStore) is given, IR modules are read from it
+    by name (the .rs file's stem) instead of from input_ir_dir, and
+    disassembled prefetch files at a time ahead of the loop.
+    """
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    if metrics is None:
+        metrics = Metrics()
+    # Per-function files land next to their source; don't treat them as inputs
+    produced = set()
+    if manifest is not None:
+        produced = {path for record in manifest.records.values() for path in record['outputs']}
+
+    # Step 1: Get all .rs files from the input directory, in the order join_dataset.py merges by
+    rust_files = sorted([f for f in os.listdir(input_dir) if f.endswith('.rs')], key=lambda f: source_order(f[:-3]))
+
+    for done, rust_file in enumerate(rust_files, 1):
+        metrics.progress(done - 1, len(rust_files))
+        if ir_store is not None and (done - 1) % prefetch == 0:
+            with metrics.stage('prefetch_ir'):
+                ir_store.prefetch([name[:-len('.rs')] for name in rust_files[done - 1:done - 1 + prefetch]
+                                   if name[:-len('.rs')] in ir_store])
 
-    for rust_file in rust_files:
         rust_file_path = os.path.join(input_dir, rust_file)
+        if rust_file_path in produced:
+            continue
         
         # Replace .rs with .ll to get the corresponding IR file
         ir_file = rust_file.replace('.rs', '.ll')
         ir_file_path = os.path.join(input_ir_dir, ir_file)
-        
-        if not os.path.exists(ir_file_path):
-            print(f"Corresponding .ll file not found for {rust_file}, deleting {rust_file}")
+        module = ir_file[:-len('.ll')]
+
+        if not (module in ir_store if ir_store is not None else os.path.exists(ir_file_path)):
+            metrics.trace(f"Corresponding .ll file not found for {rust_file}, deleting {rust_file}")
+            metrics.count('missing_ir')
             os.remove(rust_file_path)  # Delete the .rs file
             continue
 
-        print(f"Processing Rust file: {rust_file_path}")
-        print(f"Corresponding IR file: {ir_file_path}")
-
-        # Step 1: Extract function definitions from the Rust file
-        function_definitions = extract_rust_function_definitions(rust_file_path)
+        if manifest is not None:
+            if ir_store is not None:
+                digest = hashlib.sha256((file_digest(rust_file_path) + ir_store.digest(module)).encode()).hexdigest()
+            else:
+                digest = file_digest(rust_file_path, ir_file_path)
+            if not manifest.should_process(rust_file_path, digest):
+                continue
+
+        metrics.trace(f"Processing Rust file: {rust_file_path}")
+        metrics.trace(f"Corresponding IR file: {ir_file_path}")
+        start = time.perf_counter()
+        metrics.count('files')
+
+        try:
+            # Step 1: Extract function definitions from the Rust file
+            with metrics.stage('extract_rust'):
+                function_definitions = extract_rust_function_definitions(rust_file_path)
+            metrics.trace(f"Functions: {', '.join(function_definitions)}")
+
+            # Step 2: Extract IR for the functions
+            with metrics.stage('extract_ir'):
+                ir_dict = extract_ir_for_functions(ir_file_path, function_definitions.keys(), ir_level=ir_level,
+                                                   store=ir_store)
+            if seen is not None:
+                with metrics.stage('dedup'):
+                    dropped = drop_duplicate_functions(rust_file_path, function_definitions, ir_dict, seen)
+                metrics.count('duplicates', dropped)
+                if dropped:
+                    metrics.trace(f"Dropped {dropped} functions with already seen IR")
+
+            # Step 3: Write separate files (or records) for each function
+            with metrics.stage('write'):
+                if sink is None:
+                    written = write_files_for_functions(rust_file_path, ir_file_path, function_definitions, ir_dict)
+                else:
+                    written = set()
+                    for func_name in sorted(function_definitions, key=stem_order):
+                        written.update(sink.write({'source': rust_file_path, 'function': func_name,
+                                                   'language': 'rust', 'code': function_definitions[func_name],
+                                                   'ir': ir_dict.get(func_name) or None}))
+                    written = sorted(written)
+            matched = sum(1 for name in function_definitions if ir_dict.get(name))
+            metrics.count('functions', len(function_definitions))
+            metrics.count('matched', matched)
+            metrics.count('unmatched', len(function_definitions) - matched)
+        except Exception as e:
+            print(f"Error processing {rust_file_path}: {str(e)}")
+            metrics.count('errors')
+            if manifest is None:
+                raise
+            manifest.record(rust_file_path, digest, 'error', error=str(e))
+            continue
+        finally:
+            metrics.observe('file_seconds', time.perf_counter() - start)
 
-        # Step 2: Extract IR for the functions
-        ir_dict = extract_ir_for_functions(ir_file_path, function_definitions.keys())
+        if manifest is not None:
+            entry = partial(manifest.record, rust_file_path, digest, 'done', written)
+            if sink is not None:
+                sink.when_durable(entry)
+            else:
+                entry()
 
-        # Step 3: Write separate files for each function
-        write_files_for_functions(rust_file_path, ir_file_path, function_definitions, ir_dict)
+    if manifest is not None:
+        if sink is not None:
+            sink.when_durable(manifest.close)
+        else:
+            manifest.close()
+    metrics.progress(len(rust_files), len(rust_files))
+    if metrics_path:
+        metrics.write(metrics_path)
 
 
 
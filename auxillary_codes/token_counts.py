@@ -0,0 +1,49 @@
+import re
+
+_WORD = re.compile(r'\w+|[^\w\s]')
+
+
+class RegexTokenizer:
+    """Dependency-free stand-in: words and single punctuation characters"""
+
+    def lengths(self, texts):
+        return [len(_WORD.findall(text)) for text in texts]
+
+
+class HFTokenizer:
+    """A HuggingFace tokenizer (`transformers`); fast tokenizers encode a whole batch natively"""
+
+    def __init__(self, name):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(name)
+
+    def lengths(self, texts):
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_attention_mask=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+
+class TiktokenTokenizer:
+    """A tiktoken encoding, encoded a batch at a time over threads"""
+
+    def __init__(self, name):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(name)
+
+    def lengths(self, texts):
+        return [len(ids) for ids in self.encoding.encode_batch(texts, disallowed_special=())]
+
+
+def get_tokenizer(spec):
+    """
+    Return a tokenizer for spec: 'regex' (default, no dependencies),
+    'hf:<name or path>' or 'tiktoken:<encoding>'. Tokenizers have a
+    lengths(texts) method returning one token count per text.
+    """
+    kind, _, name = spec.partition(':')
+    if kind == 'regex':
+        return RegexTokenizer()
+    if kind == 'hf':
+        return HFTokenizer(name)
+    if kind == 'tiktoken':
+        return TiktokenTokenizer(name)
+    raise ValueError(f"Unknown tokenizer {spec!r}")